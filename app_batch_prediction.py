@@ -0,0 +1,196 @@
+# Batch Prediction API for Sleep Disorder Classification
+# Scores many patients in one call: the scaler, SelectKBest selector and model run
+# once over the whole input matrix instead of once per person
+
+from flask import request, jsonify, Response, stream_with_context
+import io
+import json
+import re
+import numpy as np
+
+from model_registry import registry, FEATURE_COLUMNS
+from feature_vocabulary import CATEGORICAL_COLUMNS
+from prediction_rules import apply_rules, DISORDER_LABELS, PROBABILITY_NAMES
+
+# Batches larger than this are streamed back as newline-delimited JSON
+STREAM_THRESHOLD = 1000
+
+# Rows transformed and scored per step when streaming
+BATCH_CHUNK_SIZE = 4096
+
+# Training target labels that /prediction names differently
+TARGET_DISPLAY_NAMES = {'None': DISORDER_LABELS[0]}
+
+# Accept the dataset's column names as well as the form's underscore names
+COLUMN_ALIASES = {col.lower(): col for col in FEATURE_COLUMNS}
+COLUMN_ALIASES['systolic'] = 'systolic'
+
+
+def normalize_columns(df):
+    """Rename 'Sleep_Duration', 'sleep duration' etc. to the training column names"""
+    rename = {}
+    for col in df.columns:
+        key = re.sub(r'[\s_]+', ' ', str(col)).strip().lower()
+        if key in COLUMN_ALIASES:
+            rename[col] = COLUMN_ALIASES[key]
+    return df.rename(columns=rename)
+
+
+def read_batch_records():
+    """Read the batch from a CSV upload, a CSV body or a JSON array of records"""
+    # pandas is only needed once a batch arrives, not at app start-up
+    import pandas as pd
+    if 'file' in request.files:
+        return pd.read_csv(request.files['file'])
+
+    if request.mimetype == 'text/csv':
+        return pd.read_csv(io.BytesIO(request.get_data()))
+
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict):
+        payload = payload.get('records')
+    if not isinstance(payload, list):
+        raise ValueError("Expected a JSON array of records or a CSV upload")
+    return pd.DataFrame.from_records(payload)
+
+
+def encode_records(df, vocabulary):
+    """Encode a frame of raw records into the (n, 11) float64 matrix the scaler expects.
+
+    Returns the matrix and a {row: error message} dict for rows that can't be scored."""
+    import pandas as pd
+    df = normalize_columns(df)
+    n = len(df)
+    X = np.empty((n, len(FEATURE_COLUMNS)), dtype=np.float64)
+
+    for j, col in enumerate(FEATURE_COLUMNS):
+        if col in CATEGORICAL_COLUMNS:
+            if col not in df:
+                raise ValueError(f"Missing column: {col}")
+            # Unknown labels become NaN and are reported per row below
+            X[:, j] = df[col].astype(str).map(vocabulary.codes[col]).to_numpy(dtype=np.float64, na_value=np.nan)
+        elif col == 'Blood Pressure':
+            # "126/83" -> systolic, or a separate systolic column
+            if col in df:
+                systolic = df[col].astype(str).str.split('/').str[0]
+            elif 'systolic' in df:
+                systolic = df['systolic']
+            else:
+                raise ValueError(f"Missing column: {col}")
+            X[:, j] = pd.to_numeric(systolic, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+        else:
+            if col not in df:
+                raise ValueError(f"Missing column: {col}")
+            X[:, j] = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+
+    errors = {}
+    invalid = np.isnan(X)
+    for row in np.flatnonzero(invalid.any(axis=1)):
+        bad = [FEATURE_COLUMNS[j] for j in np.flatnonzero(invalid[row])]
+        errors[int(row)] = f"Invalid value for {', '.join(bad)}"
+    return X, errors
+
+
+def disorder_codes(bundle):
+    """DISORDER_LABELS code of each of the model's classes_.
+
+    The model was trained on LabelEncoder codes of the target (0 Insomnia, 1 None,
+    2 Sleep Apnea), not on /prediction's codes, so go through the training labels."""
+    codes = {name: code for code, name in DISORDER_LABELS.items()}
+    names = [bundle.vocabulary.class_name(c) for c in bundle.model.classes_]
+    return np.array([codes[TARGET_DISPLAY_NAMES.get(name, name)] for name in names])
+
+
+def score_matrix(bundle, X):
+    """Run scaler, selector and model once over a matrix.
+
+    Returns the model's top class and its probabilities as DISORDER_LABELS codes and
+    columns (RLS, which the model never predicts, stays 0)."""
+    proba = bundle.predict_proba(X)
+    codes = disorder_codes(bundle)
+    ordered = np.zeros((len(proba), len(DISORDER_LABELS)), dtype=np.float64)
+    ordered[:, codes] = proba
+    return codes[np.argmax(proba, axis=1)], ordered
+
+
+def refine_matrix(vocabulary, X, proba):
+    """Apply the /prediction rules to a scored matrix; returns class codes and ECE probabilities"""
+    col = {name: X[:, j] for j, name in enumerate(FEATURE_COLUMNS)}
+    # The rules compare BMI labels, so map the codes back
+    bmi_codes = vocabulary.codes['BMI Category']
+    bmi_labels = np.empty(len(bmi_codes), dtype=object)
+    for label, code in bmi_codes.items():
+        bmi_labels[code] = label
+    return apply_rules(
+        col['Sleep Duration'], col['Quality of Sleep'], col['Physical Activity Level'], col['Stress Level'],
+        bmi_labels[col['BMI Category'].astype(np.intp)], col['Heart Rate'], col['Daily Steps'], proba
+    )
+
+
+def score_batch(bundle, X, errors, start=0):
+    """Score rows [start, start + len(X)) and build one result dict per row.
+
+    'class' and 'label' are the prediction after the /prediction rules; 'model_class'
+    is the model's own top class. All codes are DISORDER_LABELS codes."""
+    valid = np.flatnonzero(~np.isnan(X).any(axis=1))
+    results = [None] * len(X)
+
+    if len(valid):
+        model_classes, proba = score_matrix(bundle, X[valid])
+        classes, ece_proba = refine_matrix(bundle.vocabulary, X[valid], proba)
+        model_codes = sorted(disorder_codes(bundle).tolist())
+        proba_rows = np.round(proba, 6).tolist()
+        ece_rows = np.round(ece_proba, 6).tolist()
+        for i, row in enumerate(valid.tolist()):
+            code = int(classes[i])
+            results[row] = {
+                'row': start + row,
+                'class': code,
+                'label': DISORDER_LABELS.get(code, str(code)),
+                'model_class': int(model_classes[i]),
+                'probabilities': {DISORDER_LABELS[c]: proba_rows[i][c] for c in model_codes},
+                'ece_probabilities': dict(zip(PROBABILITY_NAMES, ece_rows[i]))
+            }
+
+    for row in range(len(X)):
+        if results[row] is None:
+            results[row] = {'row': start + row, 'error': errors.get(start + row, 'Invalid record')}
+    return results
+
+
+def add_batch_prediction_routes(app):
+    """Add batch prediction routes to the Flask app"""
+
+    @app.route('/api/predict/batch', methods=['POST'])
+    def predict_batch():
+        try:
+            df = read_batch_records()
+            # Hold one model version for the whole batch, even across a hot reload
+            bundle = registry.active()
+            X, errors = encode_records(df, bundle.vocabulary)
+        except Exception as e:
+            print(f"Error reading prediction batch: {e}")
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        stream = request.args.get('stream')
+        if stream is None:
+            stream = len(X) > STREAM_THRESHOLD
+        else:
+            stream = stream.lower() in ('1', 'true', 'yes')
+
+        if not stream:
+            return jsonify({
+                'success': True,
+                'version': bundle.version,
+                'count': len(X),
+                'results': score_batch(bundle, X, errors)
+            })
+
+        def generate():
+            # One JSON object per line, produced chunk by chunk
+            for start in range(0, len(X), BATCH_CHUNK_SIZE):
+                chunk = score_batch(bundle, X[start:start + BATCH_CHUNK_SIZE], errors, start)
+                yield ''.join(json.dumps(result) + '\n' for result in chunk)
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                        headers={'X-Model-Version': bundle.version})
@@ -2,17 +2,18 @@
 # This file contains the backend routes for processing facial images using OpenCV and simulated facial landmarks
 
 from flask import request, jsonify
-import cv2
+# OpenCV is imported inside the functions that need it so app start-up doesn't pay for it
 # Removed dlib import as it's causing issues
 # import dlib
 import numpy as np
 import base64
-import io
-from PIL import Image
-import tempfile
-import os
-import json
 import random
+import time
+
+from face_detection import DETECTOR_VERSION
+from image_cache import ResultCache, image_key, to_builtin
+from image_decode import decode_grayscale, decode_data_uri, MAX_IMAGE_UPLOAD_BYTES
+from image_jobs import image_jobs, QueueFull
 
 # Initialize facial landmark detector
 face_detector = None
@@ -22,160 +23,233 @@ def init_face_detection():
     """Initialize the face detector and landmark predictor"""
     global face_detector, landmark_predictor
     try:
-        # Since we're having issues with dlib, we'll use a simulated approach
-        print("Using simulated facial landmarks instead of dlib.")
-        return False
+        # dlib is not used; OpenCV's bundled cascades detect the face and eyes and
+        # the same object fits the 68 landmarks
+        from face_detection import FaceDetector
+        face_detector = FaceDetector()
+        landmark_predictor = face_detector
+        return True
     except Exception as e:
         print(f"Error initializing face detection: {e}")
         return False
 
-def extract_facial_landmarks(image):
-    """Extract facial landmarks from an image"""
+def _elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 3)
+
+def extract_facial_landmarks(image, timings=None, image_scale=1):
+    """Extract facial landmarks from an image (grayscale or BGR).
+
+    image_scale maps image coordinates to the original photo's when it was decoded at
+    reduced resolution. Fills timings, if given, with the milliseconds spent in each stage."""
+    import cv2
+    if timings is None:
+        timings = {}
+
     # Convert image to grayscale for better face detection
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     
-    # Detect faces in the image
-    faces = face_detector(gray, 1)
+    # Detect faces on a downscaled copy; the box is mapped back to full resolution
+    start = time.perf_counter()
+    small, scale = face_detector.downscale(gray)
+    timings['resize'] = _elapsed_ms(start)
+
+    start = time.perf_counter()
+    face = face_detector.detect(small, scale)
+    timings['detect'] = _elapsed_ms(start)
     
-    if len(faces) == 0:
+    if face is None:
         return None, "No face detected in the image"
     
-    # Get the largest face (assuming it's the main subject)
-    largest_face = max(faces, key=lambda rect: rect.width() * rect.height())
+    # Get facial landmarks in full-resolution pixels and on the normalised face crop
+    start = time.perf_counter()
+    full_points, crop_points = landmark_predictor.landmarks(gray, face)
+    timings['landmarks'] = _elapsed_ms(start)
     
-    # Get facial landmarks
-    landmarks = landmark_predictor(gray, largest_face)
+    # Features are measured on the face crop, whose size the thresholds below assume
+    start = time.perf_counter()
+    facial_features = facial_features_from_points(crop_points)
+    facial_features['face'] = [round(v * image_scale, 1) for v in face]
+    facial_features['points'] = np.round(full_points * image_scale, 1).tolist()
+    timings['features'] = _elapsed_ms(start)
     
-    # Convert landmarks to a more usable format
-    points = []
-    for i in range(68):  # 68 facial landmarks
-        x = landmarks.part(i).x
-        y = landmarks.part(i).y
-        points.append((x, y))
-    
-    # Extract specific facial features
-    eye_landmarks = {
-        'left': points[36:42],   # Left eye landmarks
-        'right': points[42:48],  # Right eye landmarks
-    }
-    
-    mouth_landmarks = points[48:68]  # Mouth landmarks
-    jaw_landmarks = points[0:17]     # Jawline landmarks
-    nose_landmarks = points[27:36]   # Nose landmarks
-    eyebrow_landmarks = {
-        'left': points[17:22],   # Left eyebrow
-        'right': points[22:27],  # Right eyebrow
+    return facial_features, None
+
+# Landmark indices (iBUG 68-point order) gathered by facial_metrics
+EYE_INDICES = np.array([np.arange(36, 42), np.arange(42, 48)])  # Left, right eye
+
+# Left/right point pairs compared for symmetry: eyes, eyebrows, then mouth
+SYMMETRY_LEFT = np.r_[36:42, 17:22, 48:54]
+SYMMETRY_RIGHT = np.r_[42:48, 22:27, 54:60]
+SYMMETRY_GROUPS = np.array([0, 6, 11])  # Start of each part in the pair arrays
+SYMMETRY_WEIGHTS = np.array([0.4, 0.3, 0.3])
+
+def _safe_ratio(num, den):
+    """num / den, 0 where den is 0"""
+    return np.divide(num, den, out=np.zeros(np.broadcast(num, den).shape), where=den > 0)
+
+def facial_metrics(points):
+    """Raw facial measurements for a (68, 2) landmark array or an (N, 68, 2) stack.
+
+    Returns a dict of (N,) float64 arrays."""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 68, 2)
+    x, y = points[..., 0], points[..., 1]
+
+    # Eye openness: mean lid distance over corner-to-corner width, per eye -> (N, 2)
+    eyes = points[:, EYE_INDICES]
+    eye_width = np.linalg.norm(eyes[:, :, 0] - eyes[:, :, 3], axis=-1)
+    eye_height = np.linalg.norm(eyes[:, :, [1, 2]] - eyes[:, :, [5, 4]], axis=-1).mean(axis=-1)
+    eye_openness = _safe_ratio(eye_height, eye_width)
+
+    # Mouth ratio: inner-lip gap over corner-to-corner width
+    mouth_height = np.linalg.norm(points[:, 62] - points[:, 66], axis=-1)
+    mouth_width = np.linalg.norm(points[:, 48] - points[:, 54], axis=-1)
+    mouth_ratio = _safe_ratio(mouth_height, mouth_width)
+
+    # Symmetry: horizontal distances of paired points from the centre line (nose bridge to chin)
+    center_x = (x[:, 27] + x[:, 8]) / 2
+    left = np.abs(x[:, SYMMETRY_LEFT] - center_x[:, None])
+    right = np.abs(x[:, SYMMETRY_RIGHT] - center_x[:, None])
+    avg_difference = np.add.reduceat(np.abs(left - right), SYMMETRY_GROUPS, axis=1) / np.diff(np.r_[SYMMETRY_GROUPS, len(SYMMETRY_LEFT)])
+    max_distance = np.maximum.reduceat(np.maximum(left, right), SYMMETRY_GROUPS, axis=1)
+    part_symmetry = np.where(max_distance > 0, 1 - _safe_ratio(avg_difference, max_distance), 0)
+    overall_symmetry = part_symmetry @ SYMMETRY_WEIGHTS
+
+    # Facial tension from eyebrow height and how far the mouth corners drop
+    eyebrow_height = np.minimum(y[:, 17:22].mean(axis=1), y[:, 22:27].mean(axis=1))
+    forehead_height = eyebrow_height - y[:, 27]  # Distance from eyebrows to nose bridge
+    eye_level = (y[:, 36] + y[:, 42]) / 2
+    mouth_corner_level = (y[:, 48] + y[:, 54]) / 2
+    mouth_corner_drop = (mouth_corner_level - eye_level) / (y[:, 8] - eye_level)  # Normalized by face height
+    facial_tension = np.clip(1 - ((1 - mouth_corner_drop) * 0.7 + (forehead_height / 50) * 0.3), 0, 1)
+
+    # Nasolabial fold depth from nostril-to-mouth-corner distances
+    nasolabial = np.linalg.norm(points[:, [31, 35]] - points[:, [48, 54]], axis=-1).mean(axis=1)
+    nasolabial_fold_depth = np.clip(1 - nasolabial / 50, 0, 1)
+
+    return {
+        # Measured: the landmark predictor places the eyelids and lips from the pixels
+        'left_eye_openness': eye_openness[:, 0],
+        'right_eye_openness': eye_openness[:, 1],
+        'mouth_ratio': mouth_ratio,
+        # Template-derived: these points are the fixed template aligned to the eye centres
+        'symmetry': overall_symmetry,
+        'forehead_height': forehead_height,
+        'facial_tension': facial_tension,
+        'nasolabial_fold_depth': nasolabial_fold_depth
     }
-    
-    # Calculate eye openness (ratio of height to width)
-    def calculate_eye_openness(eye_points):
-        width = np.linalg.norm(np.array(eye_points[0]) - np.array(eye_points[3]))
-        height1 = np.linalg.norm(np.array(eye_points[1]) - np.array(eye_points[5]))
-        height2 = np.linalg.norm(np.array(eye_points[2]) - np.array(eye_points[4]))
-        height = (height1 + height2) / 2
-        return height / width if width > 0 else 0
-    
-    left_eye_openness = calculate_eye_openness(eye_landmarks['left'])
-    right_eye_openness = calculate_eye_openness(eye_landmarks['right'])
-    avg_eye_openness = (left_eye_openness + right_eye_openness) / 2
-    
-    # Calculate jaw relaxation (based on mouth openness and jaw position)
-    mouth_height = np.linalg.norm(np.array(mouth_landmarks[14]) - np.array(mouth_landmarks[18]))
-    mouth_width = np.linalg.norm(np.array(mouth_landmarks[0]) - np.array(mouth_landmarks[6]))
-    mouth_ratio = mouth_height / mouth_width if mouth_width > 0 else 0
-    
-    # Calculate facial symmetry
-    def calculate_symmetry(left_points, right_points, center_line):
-        left_distances = [np.linalg.norm(np.array(p) - np.array([center_line, p[1]])) for p in left_points]
-        right_distances = [np.linalg.norm(np.array(p) - np.array([center_line, p[1]])) for p in right_points]
-        
-        if len(left_distances) != len(right_distances):
-            min_len = min(len(left_distances), len(right_distances))
-            left_distances = left_distances[:min_len]
-            right_distances = right_distances[:min_len]
-        
-        differences = [abs(l - r) for l, r in zip(left_distances, right_distances)]
-        avg_difference = sum(differences) / len(differences) if differences else 0
-        max_distance = max(max(left_distances), max(right_distances)) if left_distances and right_distances else 1
-        
-        return 1 - (avg_difference / max_distance) if max_distance > 0 else 0
-    
-    # Find center line of face
-    center_x = (points[27][0] + points[8][0]) / 2  # Between nose bridge and chin
-    
-    # Calculate symmetry for different facial parts
-    eye_symmetry = calculate_symmetry(eye_landmarks['left'], eye_landmarks['right'], center_x)
-    eyebrow_symmetry = calculate_symmetry(eyebrow_landmarks['left'], eyebrow_landmarks['right'], center_x)
-    
-    # Split mouth landmarks into left and right
-    mouth_left = mouth_landmarks[:7]
-    mouth_right = mouth_landmarks[6:12]
-    mouth_symmetry = calculate_symmetry(mouth_left, mouth_right, center_x)
-    
-    # Calculate overall symmetry
-    overall_symmetry = (eye_symmetry * 0.4) + (eyebrow_symmetry * 0.3) + (mouth_symmetry * 0.3)
-    
-    # Calculate facial tension based on eyebrow position and mouth corners
-    eyebrow_height_left = sum(p[1] for p in eyebrow_landmarks['left']) / len(eyebrow_landmarks['left'])
-    eyebrow_height_right = sum(p[1] for p in eyebrow_landmarks['right']) / len(eyebrow_landmarks['right'])
-    forehead_height = min(eyebrow_height_left, eyebrow_height_right) - points[27][1]  # Distance from eyebrows to nose bridge
-    
-    # Mouth corners position (up = relaxed, down = tense)
-    mouth_corner_left = mouth_landmarks[0]
-    mouth_corner_right = mouth_landmarks[6]
-    eye_level = (eye_landmarks['left'][0][1] + eye_landmarks['right'][0][1]) / 2
-    mouth_corner_level = (mouth_corner_left[1] + mouth_corner_right[1]) / 2
-    mouth_corner_drop = (mouth_corner_level - eye_level) / (points[8][1] - eye_level)  # Normalized by face height
-    
-    # Calculate facial tension (lower = more relaxed)
-    facial_tension = 1 - ((1 - mouth_corner_drop) * 0.7 + (forehead_height / 50) * 0.3)
-    facial_tension = max(0, min(1, facial_tension))  # Clamp between 0 and 1
-    
-    # Calculate nasolabial fold depth (estimate based on landmarks)
-    nasolabial_left = np.linalg.norm(np.array(nose_landmarks[4]) - np.array(mouth_landmarks[0]))
-    nasolabial_right = np.linalg.norm(np.array(nose_landmarks[8]) - np.array(mouth_landmarks[6]))
-    nasolabial_fold_depth = 1 - ((nasolabial_left + nasolabial_right) / 2) / 50  # Normalize
-    nasolabial_fold_depth = max(0, min(1, nasolabial_fold_depth))  # Clamp between 0 and 1
-    
-    # Compile results
-    facial_features = {
-        'eyes': {
-            'left': {
-                'open': left_eye_openness > 0.2,
-                'openness': left_eye_openness * 2,  # Scale to 0-1 range
-                'blinkRate': random.uniform(0.3, 0.8)  # Simulated, would need video for real measurement
+
+def facial_features_from_points(points):
+    """Sleep-related facial features from a (68, 2) landmark array.
+
+    An (N, 68, 2) stack (several faces, or the frames of a video) is featurized in
+    one pass and returns a list of N feature dicts."""
+    points = np.asarray(points)
+    metrics = facial_metrics(points)
+    features = add_template_features(features_from_metrics(metrics), metrics)
+    return features if points.ndim == 3 else features[0]
+
+# Feature dict entries read off the aligned landmark template rather than the image:
+# only the eyelid and lip points move with the pixels, so these barely vary between faces
+TEMPLATE_DERIVED_FEATURES = ['jawline.symmetry', 'facialMuscles', 'nasolabialFolds', 'eyebrows']
+
+def _metric_rows(metrics, names):
+    """One tuple of Python floats per face for the named facial_metrics arrays"""
+    return zip(*(np.atleast_1d(metrics[name]).tolist() for name in names))
+
+def features_from_metrics(metrics):
+    """One feature dict per face from the measured (eye and mouth) facial_metrics arrays"""
+    features = []
+    for left_eye_openness, right_eye_openness, mouth_ratio in _metric_rows(
+            metrics, ['left_eye_openness', 'right_eye_openness', 'mouth_ratio']):
+        features.append({
+            'eyes': {
+                'left': {
+                    'open': left_eye_openness > 0.2,
+                    'openness': left_eye_openness * 2,  # Scale to 0-1 range
+                    'blinkRate': random.uniform(0.3, 0.8)  # Simulated, would need video for real measurement
+                },
+                'right': {
+                    'open': right_eye_openness > 0.2,
+                    'openness': right_eye_openness * 2,  # Scale to 0-1 range
+                    'blinkRate': random.uniform(0.3, 0.8)  # Simulated, would need video for real measurement
+                }
             },
-            'right': {
-                'open': right_eye_openness > 0.2,
-                'openness': right_eye_openness * 2,  # Scale to 0-1 range
-                'blinkRate': random.uniform(0.3, 0.8)  # Simulated, would need video for real measurement
+            'mouth': {
+                'open': mouth_ratio > 0.2,
+                'relaxation': 1 - mouth_ratio  # Lower ratio = more relaxed
+            },
+            'jawline': {
+                'tension': 1 - (1 - mouth_ratio) * 0.7,
+                'relaxation': (1 - mouth_ratio) * 0.7
             }
-        },
-        'mouth': {
-            'open': mouth_ratio > 0.2,
-            'relaxation': 1 - mouth_ratio  # Lower ratio = more relaxed
-        },
-        'jawline': {
-            'tension': 1 - (1 - mouth_ratio) * 0.7,
-            'relaxation': (1 - mouth_ratio) * 0.7,
-            'symmetry': overall_symmetry
-        },
-        'facialMuscles': {
+        })
+
+    return features
+
+def add_template_features(features, metrics):
+    """Fill in the TEMPLATE_DERIVED_FEATURES entries of features_from_metrics dicts.
+
+    The client still expects these entries, so they are kept in the response but
+    listed under 'templateDerived' to tell them apart from measurements."""
+    rows = _metric_rows(metrics, ['symmetry', 'forehead_height', 'facial_tension', 'nasolabial_fold_depth'])
+    for feature, (symmetry, forehead_height, facial_tension, nasolabial_fold_depth) in zip(features, rows):
+        feature['jawline']['symmetry'] = symmetry
+        feature['facialMuscles'] = {
             'tension': facial_tension,
             'relaxation': 1 - facial_tension,
-            'symmetry': overall_symmetry
-        },
-        'nasolabialFolds': {
+            'symmetry': symmetry
+        }
+        feature['nasolabialFolds'] = {
             'depth': nasolabial_fold_depth,
-            'symmetry': overall_symmetry
-        },
-        'eyebrows': {
+            'symmetry': symmetry
+        }
+        feature['eyebrows'] = {
             'tension': facial_tension * 0.8,
             'position': 1 - (forehead_height / 50)  # Normalized position
         }
-    }
-    
-    return facial_features, None
+        feature['templateDerived'] = list(TEMPLATE_DERIVED_FEATURES)
+
+    return features
+
+# Ranges of the simulated feature factors, in seed offset order 1..8
+SIMULATED_FACTOR_RANGES = np.array([
+    [0.3, 1.0],  # Eye openness (30-100%)
+    [0.2, 0.8],  # Blink rate (20-80%)
+    [0.2, 1.0],  # Jaw relaxation (20-100%)
+    [0.1, 0.8],  # Facial tension (10-80%)
+    [0.2, 1.0],  # Symmetry (20-100%)
+    [0.0, 1.0],  # Mouth open factor
+    [0.2, 1.0],  # Nasolabial fold depth
+    [0.5, 1.0],  # Eyebrow position
+])
+
+def image_fingerprint(image_data):
+    """Weighted sum of about 500 evenly spaced bytes of the image.
+
+    Every step-th byte is weighted by (index % 7 + 1). Computed over a strided
+    view of the payload, so it costs the same for a 50KB or a 12MB upload."""
+    data = np.frombuffer(image_data, dtype=np.uint8)
+    # Sample more bytes for better consistency
+    sample_size = min(500, len(data))
+    step = max(1, len(data) // sample_size)
+
+    # Weight different bytes differently for better feature detection
+    sampled = data[::step].astype(np.int64)
+    weights = np.arange(0, len(data), step, dtype=np.int64) % 7 + 1
+    return int(np.sum((sampled * weights) % 10000))
+
+def seeded_factors(seed):
+    """All eight simulated feature factors for a seed, as plain floats"""
+    offsets = np.arange(1, len(SIMULATED_FACTOR_RANGES) + 1)
+    # Use a stable algorithm for deterministic random generation
+    x = np.sin((seed * 9781 + offsets * 577) % 10000) * 10000
+    rand = x - np.floor(x)
+    # Apply additional stabilization to ensure consistent results
+    rand = (rand + np.cos(seed / 7919.0 + offsets)) / 2.0
+    rand = rand - np.floor(rand)
+    min_vals = SIMULATED_FACTOR_RANGES[:, 0]
+    max_vals = SIMULATED_FACTOR_RANGES[:, 1]
+    return (min_vals + rand * (max_vals - min_vals)).tolist()
 
 def simulate_facial_landmarks(image_data=None):
     """Simulate facial landmarks when real detection is not available
@@ -195,41 +269,13 @@ def simulate_facial_landmarks(image_data=None):
         
         # Generate a more robust hash from the image data
         try:
-            # Use a more sophisticated approach to generate a consistent seed
-            hash_value = 0
-            # Sample more bytes for better consistency
-            sample_size = min(500, len(image_data))
-            step = max(1, len(image_data) // sample_size)
-            
-            for i in range(0, len(image_data), step):
-                if i < len(image_data):
-                    # Weight different bytes differently for better feature detection
-                    hash_value += (image_data[i] * (i % 7 + 1)) % 10000
-            
-            # Combine with original seed for better consistency
-            seed = (seed + hash_value) % 100000
+            seed = (seed + image_fingerprint(image_data)) % 100000
         except:
             pass  # Use default seed if hashing fails
     
-    # Use an improved seeded random function to ensure consistent results for the same image
-    def seeded_random(min_val, max_val, offset=0):
-        # Use a more stable algorithm for deterministic random generation
-        x = np.sin((seed * 9781 + offset * 577) % 10000) * 10000
-        rand = x - np.floor(x)
-        # Apply additional stabilization to ensure consistent results
-        rand = (rand + np.cos(seed / 7919.0 + offset)) / 2.0
-        rand = rand - np.floor(rand)
-        return min_val + rand * (max_val - min_val)
-    
-    # Generate deterministic values based on seed
-    eyeOpennessFactor = seeded_random(0.3, 1.0, 1)  # 30-100% eye openness
-    blinkRateFactor = seeded_random(0.2, 0.8, 2)    # 20-80% blink rate
-    jawRelaxationFactor = seeded_random(0.2, 1.0, 3) # 20-100% jaw relaxation
-    facialTensionFactor = seeded_random(0.1, 0.8, 4) # 10-80% facial tension
-    symmetryFactor = seeded_random(0.2, 1.0, 5)      # 20-100% symmetry
-    mouthOpenFactor = seeded_random(0, 1.0, 6)       # Deterministic mouth open factor
-    nasolabialDepthFactor = seeded_random(0.2, 1.0, 7) # Deterministic nasolabial fold depth
-    eyebrowPositionFactor = seeded_random(0.5, 1.0, 8) # Deterministic eyebrow position
+    # Generate all deterministic values based on seed in one call
+    (eyeOpennessFactor, blinkRateFactor, jawRelaxationFactor, facialTensionFactor,
+     symmetryFactor, mouthOpenFactor, nasolabialDepthFactor, eyebrowPositionFactor) = seeded_factors(seed)
     
     # Create simulated facial landmarks with deterministic values
     facial_features = {
@@ -271,24 +317,29 @@ def simulate_facial_landmarks(image_data=None):
     
     return facial_features
 
-def process_image(image_data):
+def process_image(image_data, timings=None):
     """Process the image data and extract facial landmarks"""
+    import cv2
+    if timings is None:
+        timings = {}
+
     try:
         # Store original image_data for deterministic simulation if needed
         original_image_data = image_data
         
         # Check if image_data is a base64 string
-        if isinstance(image_data, str) and image_data.startswith('data:image'):
-            # Extract the base64 encoded image data
-            image_data_decoded = image_data.split(',')[1]
-            image_data_decoded = base64.b64decode(image_data_decoded)
-            
-            # Convert to numpy array for OpenCV
-            nparr = np.frombuffer(image_data_decoded, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        else:
-            # Handle file upload case
-            image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+        if isinstance(image_data, str):
+            image_data = decode_image_payload(image_data)
+            if image_data is None:
+                return simulate_facial_landmarks(original_image_data), "Could not decode the image"
+        
+        # Only a face-sized grayscale image is needed: decode at 1/2, 1/4 or 1/8 scale
+        start = time.perf_counter()
+        image, image_scale = decode_grayscale(image_data)
+        timings['decode'] = _elapsed_ms(start)
+        
+        if image is None:
+            return simulate_facial_landmarks(original_image_data), "Could not decode the image"
         
         # Initialize face detection if not already done
         if face_detector is None:
@@ -298,7 +349,7 @@ def process_image(image_data):
                 return simulate_facial_landmarks(original_image_data), None
         
         # Extract facial landmarks
-        landmarks, error = extract_facial_landmarks(image)
+        landmarks, error = extract_facial_landmarks(image, timings, image_scale)
         
         if error or landmarks is None:
             # Fall back to simulation if extraction fails
@@ -311,12 +362,68 @@ def process_image(image_data):
         # Fall back to simulation on error
         return simulate_facial_landmarks(original_image_data), str(e)
 
+# Landmark results keyed by image content, shared by all requests in this worker
+result_cache = ResultCache()
+
+def decode_image_payload(image_data):
+    """Return the raw bytes of an uploaded file or base64 data URI, or None if it can't be decoded"""
+    if isinstance(image_data, (bytes, bytearray)):
+        return bytes(image_data)
+    if isinstance(image_data, str) and image_data.startswith('data:image'):
+        return decode_data_uri(image_data)
+    return None
+
+def process_image_cached(image_data, timings=None):
+    """process_image with results cached by a SHA-256 of DETECTOR_VERSION and the decoded image bytes"""
+    if timings is None:
+        timings = {}
+    start = time.perf_counter()
+    image_bytes = decode_image_payload(image_data)
+    timings['base64'] = _elapsed_ms(start)
+    if image_bytes is None:
+        # Nothing to hash; process_image will report the problem
+        landmarks, error = process_image(image_data, timings)
+        return to_builtin(landmarks), error
+
+    key = image_key(image_bytes, DETECTOR_VERSION)
+    cached = result_cache.get(key)
+    timings['cache_hit'] = cached is not None
+    if cached is not None:
+        return cached['landmarks'], cached['error']
+
+    # The decoded bytes give the same result as the original payload (including the simulation seed)
+    landmarks, error = process_image(image_bytes, timings)
+    result_cache.put(key, {'landmarks': landmarks, 'error': error})
+    return to_builtin(landmarks), error
+
+def submit_image_job(image_data):
+    """Queue an upload for background processing; responds 202 with the job id to poll"""
+    image_bytes = decode_image_payload(image_data)
+    if image_bytes is None:
+        return jsonify({'success': False, 'error': 'Could not decode the image'}), 400
+    try:
+        job_id = image_jobs.submit(image_bytes, result_cache, image_key(image_bytes, DETECTOR_VERSION))
+    except QueueFull as e:
+        return jsonify({'success': False, 'error': str(e)}), 503, {'Retry-After': '1'}
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status_url': f"/api/image_jobs/{job_id}"
+    }), 202
+
 # Add this function to your Flask app
 def add_image_processing_routes(app):
     """Add image processing routes to the Flask app"""
     
     @app.route('/process_facial_image', methods=['POST'])
     def process_facial_image():
+        # Refuse oversized uploads from the Content-Length header, before the body is read
+        if request.content_length is not None and request.content_length > MAX_IMAGE_UPLOAD_BYTES:
+            return jsonify({
+                'success': False,
+                'error': f"Image upload too large (limit {MAX_IMAGE_UPLOAD_BYTES // (1024 * 1024)}MB)"
+            }), 413
+        
         try:
             # Check if the post request has the file part
             if 'image' not in request.files and 'image' not in request.form:
@@ -330,19 +437,28 @@ def add_image_processing_routes(app):
                 # Handle base64 image data
                 image_data = request.form['image']
             
-            # Process the image
-            landmarks, error = process_image(image_data)
+            # ?async=1 hands the work to the job queue and returns immediately
+            if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+                return submit_image_job(image_data)
+            
+            # Process the image (or reuse the result for an identical upload)
+            start = time.perf_counter()
+            timings = {}
+            landmarks, error = process_image_cached(image_data, timings)
+            timings['total'] = _elapsed_ms(start)
             
             if error:
                 return jsonify({
                     'success': False,
                     'error': error,
-                    'landmarks': landmarks  # Return simulated landmarks anyway
+                    'landmarks': landmarks,  # Return simulated landmarks anyway
+                    'timings': timings
                 })
             
             return jsonify({
                 'success': True,
-                'landmarks': landmarks
+                'landmarks': landmarks,
+                'timings': timings
             })
             
         except Exception as e:
@@ -350,5 +466,9 @@ def add_image_processing_routes(app):
             return jsonify({
                 'success': False,
                 'error': str(e),
-                'landmarks': simulate_facial_landmarks()  # Return simulated landmarks on error
-            })
\ No newline at end of file
+                'landmarks': to_builtin(simulate_facial_landmarks())  # Return simulated landmarks on error
+            })
+
+    @app.route('/api/image_cache', methods=['GET'])
+    def image_cache_stats():
+        return jsonify(result_cache.stats())
\ No newline at end of file
@@ -0,0 +1,88 @@
+# Compiled Tree Model Benchmark
+# Compares sklearn's scaler -> SelectKBest -> predict_proba path (as /prediction ran it,
+# from a one-row DataFrame) with the flat-array evaluator in compiled_model.py, for the
+# serving decision tree and for a random forest fitted on the same preprocessing.
+# Checks that both give identical probabilities on every row of the dataset first, then
+# times the whole single-request path: the old one-row DataFrame encoding against the
+# fused InputEncoder.
+#
+# Usage: python benchmarks/bench_compiled_model.py [--repeat 2000]
+
+import argparse
+import os
+import sys
+import time
+import warnings
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from compiled_model import compile_pipeline, verify_compiled
+from model_registry import registry, SERVING_ARTIFACTS, FEATURE_COLUMNS, CANNED_RECORD
+from feature_vocabulary import CATEGORICAL_COLUMNS
+from train_model import load_dataset, preprocess, make_estimator
+
+
+def per_call_us(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sklearn vs compiled tree inference")
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    _, X, _, _ = load_dataset()
+    X = X[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+    bundle = registry.active()
+    scaler, k_best = bundle.scaler, bundle.k_best
+    data = preprocess()
+    forest = make_estimator('Random Forest').fit(k_best.transform(data['X_train']), data['y_train'])
+    row = X[0]
+    row_df = pd.DataFrame([row], columns=FEATURE_COLUMNS)
+
+    print(f"{'model':<22} {'sklearn row us':>15} {'compiled row us':>16} {'sklearn batch ms':>17} "
+          f"{'compiled batch ms':>18}  ({len(X)} rows, identical on all)")
+    for name, model in [(os.path.basename(SERVING_ARTIFACTS['model']), bundle.model), ('Random Forest (100)', forest)]:
+        compiled = compile_pipeline(scaler, k_best, model)
+        verify_compiled(compiled, scaler, k_best, model, X)
+
+        sklearn_row = per_call_us(lambda: model.predict_proba(k_best.transform(scaler.transform(row_df)))[0],
+                                  args.repeat)
+        compiled_row = per_call_us(lambda: compiled.predict_proba_row(row), args.repeat)
+        X_df = pd.DataFrame(X, columns=FEATURE_COLUMNS)
+        sklearn_batch = per_call_us(lambda: model.predict_proba(k_best.transform(scaler.transform(X_df))),
+                                    max(1, args.repeat // 20)) / 1000
+        compiled_batch = per_call_us(lambda: compiled.predict_proba(X), max(1, args.repeat // 20)) / 1000
+        print(f"{name:<22} {sklearn_row:>15.1f} {compiled_row:>16.1f} {sklearn_batch:>17.2f} {compiled_batch:>18.2f}")
+
+    # Raw inputs to probabilities for one request
+    record = dict(CANNED_RECORD)
+    values = [record[col] for col in FEATURE_COLUMNS]
+
+    def dataframe_path():
+        input_df = pd.DataFrame([record])
+        for col in CATEGORICAL_COLUMNS:
+            input_df[col] = bundle.vocabulary.encode(col, record[col])
+        input_df = input_df[FEATURE_COLUMNS]
+        return bundle.model.predict_proba(k_best.transform(scaler.transform(input_df)))[0]
+
+    def encoder_path():
+        return bundle.predict_proba_row(bundle.encoder.transform_row(bundle.encoder.encode(*values)))
+
+    assert np.array_equal(dataframe_path(), encoder_path())
+    print(f"request path: DataFrame + sklearn {per_call_us(dataframe_path, args.repeat):.1f} us, "
+          f"InputEncoder + compiled {per_call_us(encoder_path, args.repeat):.1f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# Facial Image Decode Benchmark
+# Decodes photos the way /process_facial_image receives them (a base64 data URI form
+# field) with the old full-resolution colour path and the reduced grayscale path, and
+# reports wall time and peak RSS. Each measurement runs in a fresh process so the
+# peaks don't mix.
+#
+# Usage: python benchmarks/bench_image_decode.py [IMAGE ...] [--repeat 5]
+
+import argparse
+import base64
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+DEFAULT_IMAGES = [
+    os.path.join(ROOT, 'static', 'images', 'pexels-psad-11533580.jpg'),
+    os.path.join(ROOT, 'static', 'img', '16499.jpg'),
+]
+
+
+def proc_status_kb(field):
+    """A kB value such as VmRSS or VmHWM from /proc/self/status, or None off Linux"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Reset the kernel's peak-RSS mark (Linux). Process-wide, so only call it in the
+    benchmark's own worker process, never inside the app"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def decode_old(data_uri):
+    """The decode path before reduced-resolution decoding"""
+    import cv2
+    import numpy as np
+    image_bytes = base64.b64decode(data_uri.split(',')[1])
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def decode_new(data_uri):
+    from image_decode import decode_data_uri, decode_grayscale
+    image, _ = decode_grayscale(decode_data_uri(data_uri))
+    return image
+
+
+def worker(mode, path, repeat):
+    """Measure one mode on one image in this process and print a JSON line"""
+    import cv2  # Imported before the baseline so library memory isn't counted
+    decode = decode_old if mode == 'old' else decode_new
+    with open(path, 'rb') as f:
+        data_uri = 'data:image/jpeg;base64,' + base64.b64encode(f.read()).decode('ascii')
+
+    # Peak RSS of the first decode, before the allocator holds on to freed buffers
+    rss_before = proc_status_kb('VmRSS')
+    reset_peak_rss()
+    shape = decode(data_uri).shape
+    peak_delta = proc_status_kb('VmHWM') - rss_before
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        decode(data_uri)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    print(json.dumps({'ms': times[len(times) // 2] * 1000, 'peak_delta_mb': peak_delta / 1024, 'shape': list(shape)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark facial image decoding time and peak RSS")
+    parser.add_argument('images', nargs='*', default=DEFAULT_IMAGES)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--worker', choices=['old', 'new'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker, args.images[0], args.repeat)
+        return
+
+    print(f"{'image':<32} {'mode':<4} {'decoded':>11} {'p50 ms':>8} {'peak +MB':>9}")
+    for path in args.images:
+        for mode in ('old', 'new'):
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), path, '--worker', mode,
+                                  '--repeat', str(args.repeat)], capture_output=True, text=True, check=True)
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            shape = 'x'.join(str(v) for v in result['shape'][:2][::-1])
+            print(f"{os.path.basename(path)[:32]:<32} {mode:<4} {shape:>11} {result['ms']:>8.1f} {result['peak_delta_mb']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
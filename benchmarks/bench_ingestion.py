@@ -0,0 +1,80 @@
+# Monitoring Ingestion Benchmark
+# Writes recordings (each with one classification) into an on-disk SQLite stand-in for
+# the sleep_monitoring and sleep_classification tables, once the way executionquery
+# does it (an INSERT and a commit per row, then a lookup of the new id) and once through
+# IngestionWriter, and reports rows written per second.
+#
+# Usage: python benchmarks/bench_ingestion.py [--rows 20000] [--eeg-bytes 2000] [--baseline-rows 2000]
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from db_pool import ConnectionPool
+from monitoring_ingest import IngestionWriter, CLASSIFICATION_INSERT
+from signal_storage import MONITORING_INSERT
+
+
+def create_pool(path):
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        create table sleep_monitoring(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INT, eeg_data BLOB, hrv_data BLOB,
+            sleep_position TEXT, respiratory_pattern TEXT);
+        create table sleep_classification(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            monitoring_id INT, classification_result TEXT, confidence_score REAL);""")
+    conn.close()
+    return ConnectionPool(lambda: sqlite3.connect(path, check_same_thread=False), size=4, paramstyle='qmark')
+
+
+def recordings(count, eeg_bytes):
+    eeg, hrv = os.urandom(eeg_bytes), os.urandom(eeg_bytes // 8)
+    return [(i % 500, eeg, hrv, 'supine', 'regular') for i in range(count)]
+
+
+def per_row(pool, rows):
+    """An execute and a commit per row, then a query for the new id"""
+    for values in rows:
+        pool.execute(MONITORING_INSERT, values)
+        monitoring_id = pool.fetchall("SELECT MAX(id) FROM sleep_monitoring")[0][0]
+        pool.execute(CLASSIFICATION_INSERT, (monitoring_id, 'No sleeping disorder', 0.9))
+
+
+def batched(pool, rows):
+    writer = IngestionWriter(pool).start()
+    futures = [writer.add_monitoring(values, [('No sleeping disorder', 0.9)]) for values in rows]
+    writer.close()
+    return [future.result() for future in futures]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-row vs batched monitoring ingestion")
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--eeg-bytes', type=int, default=2000)
+    parser.add_argument('--baseline-rows', type=int, default=2000,
+                        help="recordings for the (slow) per-row baseline")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, fn, count in [('per-row commit', per_row, args.baseline_rows),
+                                ('IngestionWriter', batched, args.rows)]:
+            pool = create_pool(os.path.join(directory, f"{fn.__name__}.db"))
+            rows = recordings(count, args.eeg_bytes)
+            start = time.perf_counter()
+            fn(pool, rows)
+            elapsed = time.perf_counter() - start
+            stored = pool.fetchall("SELECT COUNT(*) FROM sleep_classification c "
+                                   "JOIN sleep_monitoring m ON m.id = c.monitoring_id")[0][0]
+            print(f"{name:<16} {count:>7,} recordings {elapsed:>7.2f} s "
+                  f"{2 * count / elapsed:>9,.0f} rows/s ({stored:,} linked classifications)")
+
+
+if __name__ == '__main__':
+    main()
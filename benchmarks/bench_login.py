@@ -0,0 +1,78 @@
+# Login Lookup Benchmark
+# Seeds an in-process SQLite stand-in for the users table with 1k..1M users and
+# times the indexed /login query against the old full-table email scan.
+#
+# Usage: python benchmarks/bench_login.py [--sizes 1000 10000 100000 1000000]
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from db_pool import ConnectionPool
+
+LOGIN_QUERY = "SELECT UPPER(password) FROM users WHERE email = %s LIMIT 1"
+OLD_SCAN_QUERY = "SELECT UPPER(email) FROM users"
+
+# The old scan is O(users) per login; skip it where it would take minutes
+MAX_SCAN_USERS = 100000
+
+
+def seed_pool(n_users):
+    """In-memory users table with the same unique case-insensitive email index as db.sql"""
+    conn = sqlite3.connect(':memory:', check_same_thread=False)
+    conn.execute("""create table users(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name VARCHAR(50),
+        email VARCHAR(50) COLLATE NOCASE NOT NULL,
+        password VARCHAR(50))""")
+    conn.execute("CREATE UNIQUE INDEX users_email_unique ON users (email)")
+    conn.executemany("INSERT INTO users (email, password) VALUES (?, ?)",
+                     ((f"user{i}@example.com", f"secret{i}") for i in range(n_users)))
+    conn.commit()
+    # A single shared connection: the benchmark measures the query, not the pool
+    return ConnectionPool(lambda: conn, size=1, paramstyle='qmark')
+
+
+def time_logins(pool, n_users, lookups, scan):
+    rng = random.Random(42)
+    timings = []
+    for _ in range(lookups):
+        email = f"USER{rng.randrange(n_users)}@example.com"
+        start = time.perf_counter()
+        if scan:
+            emails = [row[0] for row in pool.fetchall(OLD_SCAN_QUERY)]
+            found = email.upper() in emails
+            if found:
+                pool.fetchall(LOGIN_QUERY, (email,))
+        else:
+            found = bool(pool.fetchall(LOGIN_QUERY, (email,)))
+        timings.append(time.perf_counter() - start)
+        assert found
+    timings.sort()
+    return timings[len(timings) // 2], timings[int(len(timings) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /login lookups against seeded users")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--lookups', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'users':>10} {'indexed p50 us':>15} {'indexed p99 us':>15} {'old scan p50 ms':>16}")
+    for n_users in args.sizes:
+        pool = seed_pool(n_users)
+        p50, p99 = time_logins(pool, n_users, args.lookups, scan=False)
+        scan = '-'
+        if n_users <= MAX_SCAN_USERS:
+            scan_p50, _ = time_logins(pool, n_users, max(5, args.lookups // 200), scan=True)
+            scan = f"{scan_p50 * 1000:.2f}"
+        print(f"{n_users:>10} {p50 * 1e6:>15.1f} {p99 * 1e6:>15.1f} {scan:>16}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# Prediction Lookup Table Benchmark
+# Builds the /prediction lookup tables for the serving model in memory (nothing is
+# written to Models/lookup/), checks them against the model + rules path, then times
+# one request both ways over the dataset's records: InputEncoder + compiled model +
+# scalar rules against the two table lookups. Also reports how many records fall on
+# the grid when some inputs arrive as off-grid values.
+#
+# Usage: python benchmarks/bench_prediction_lookup.py [--repeat 20]
+
+import argparse
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from model_registry import registry
+from prediction_lookup import build_tables, verify_tables, direct_prediction, dataset_records
+
+
+def per_record_us(fn, records, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for record in records:
+            fn(record)
+        best = min(best, time.perf_counter() - start)
+    return best / len(records) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the /prediction lookup tables")
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    bundle = registry.active()
+    start = time.perf_counter()
+    tables = build_tables(bundle)
+    built = time.perf_counter() - start
+    checked = verify_tables(tables, bundle)
+    print(f"tables: model {tables.meta['model_radices']}, rules {tables.meta['rules_radices']}, "
+          f"{tables.nbytes / 1e6:.1f} MB, built in {built:.2f} s, identical on {checked} records")
+
+    records = dataset_records()
+    direct = per_record_us(lambda record: direct_prediction(bundle, record), records, args.repeat)
+    lookup = per_record_us(tables.lookup, records, args.repeat)
+    print(f"per request: encoder + compiled + rules {direct:.1f} us, lookup {lookup:.1f} us ({direct / lookup:.1f}x)")
+
+    # Every fourth record with a fractional sleep duration off the 0.1 h grid
+    mixed = [record[:3] + (record[3] + 0.05,) + record[4:] if i % 4 == 0 else record
+             for i, record in enumerate(records)]
+    hits = sum(tables.lookup(record) is not None for record in mixed)
+    print(f"hit rate with 1 in 4 records off the grid: {hits / len(mixed):.2%} of {len(mixed)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# EEG/HRV Feature Extraction Benchmark
+# Synthesizes a night of EEG and heartbeats, then times the incremental extractors in
+# signal_features.py against running scipy.signal.welch on every overlapping window
+# from scratch, and checks the two give the same band powers.
+#
+# Usage: python benchmarks/bench_signal_features.py [--hours 8] [--fs 256] [--disorder "Sleep Apnea"]
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from scipy import signal as sps
+
+from signal_features import (eeg_features, hrv_features, EEG_BANDS, EEG_WINDOW_SECONDS, EEG_STEP_SECONDS,
+                             WELCH_SEGMENT_SECONDS)
+from signal_synthesis import synthesize_eeg, synthesize_rr
+
+
+def welch_per_window(eeg, fs):
+    """Band powers recomputed from each window's samples"""
+    window, step, nperseg = EEG_WINDOW_SECONDS * fs, EEG_STEP_SECONDS * fs, WELCH_SEGMENT_SECONDS * fs
+    starts = range(0, len(eeg) - window + 1, step)
+    powers = np.empty((len(starts), len(EEG_BANDS)))
+    for i, start in enumerate(starts):
+        frequencies, psd = sps.welch(eeg[start:start + window], fs, nperseg=nperseg, noverlap=nperseg // 2)
+        for j, (_, low, high) in enumerate(EEG_BANDS):
+            powers[i, j] = psd[(frequencies >= low) & (frequencies < high)].sum() * frequencies[1]
+    return powers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark EEG band power and HRV feature extraction")
+    parser.add_argument('--hours', type=float, default=8)
+    parser.add_argument('--fs', type=int, default=256)
+    parser.add_argument('--disorder', default='No sleeping disorder')
+    args = parser.parse_args()
+    seconds = args.hours * 3600
+
+    start = time.perf_counter()
+    eeg = synthesize_eeg(args.disorder, 0, seconds, args.fs)
+    beat_times, rr_ms = synthesize_rr(args.disorder, 0, seconds)
+    print(f"synthesized {len(eeg):,} EEG samples and {len(rr_ms):,} beats in {time.perf_counter() - start:.2f} s")
+
+    start = time.perf_counter()
+    features = eeg_features(eeg, args.fs)
+    eeg_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    hrv = hrv_features(beat_times, rr_ms)
+    hrv_seconds = time.perf_counter() - start
+    print(f"incremental EEG features: {len(features['start']):,} windows in {eeg_seconds:.2f} s "
+          f"({int(features['spindles'].sum()):,} spindle detections)")
+    print(f"incremental HRV features: {len(hrv['start']):,} windows in {hrv_seconds:.3f} s")
+
+    start = time.perf_counter()
+    reference = welch_per_window(eeg.astype(np.float64), args.fs)
+    print(f"welch per window:         {len(reference):,} windows in {time.perf_counter() - start:.2f} s")
+
+    incremental = np.column_stack([features[name] for name, _, _ in EEG_BANDS])
+    print(f"max relative difference:  {np.max(np.abs(incremental - reference) / reference):.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# Monitoring Signal Storage Benchmark
+# Stores a synthesized night of EEG in an in-process SQLite stand-in for the
+# sleep_monitoring table, once as the old TEXT encoding (a JSON array of samples)
+# and once per binary encoding, then reports bytes per hour of EEG and the latency
+# of reading one 30 s epoch from the middle of the night.
+#
+# Usage: python benchmarks/bench_signal_storage.py [--hours 8] [--fs 256] [--reads 20]
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from db_pool import ConnectionPool
+from signal_storage import (encode_signal, SignalBlob, blob_reader, ENCODING_INT16, ENCODING_FLOAT32,
+                            COMPRESSION_ZLIB, COMPRESSION_NONE)
+from signal_synthesis import synthesize_eeg
+
+ENCODINGS = [
+    ('int16 + zlib', ENCODING_INT16, COMPRESSION_ZLIB),
+    ('float32 + zlib', ENCODING_FLOAT32, COMPRESSION_ZLIB),
+    ('float32', ENCODING_FLOAT32, COMPRESSION_NONE),
+]
+
+# MySQL TEXT holds at most this many bytes
+MYSQL_TEXT_LIMIT = 65535
+
+
+def create_pool():
+    conn = sqlite3.connect(':memory:', check_same_thread=False)
+    conn.execute("""create table sleep_monitoring(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        eeg_text TEXT,
+        eeg_data BLOB)""")
+    return ConnectionPool(lambda: conn, size=1, paramstyle='qmark')
+
+
+def median_ms(fn, reads):
+    times = []
+    for _ in range(reads):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark TEXT vs binary EEG storage")
+    parser.add_argument('--hours', type=float, default=8)
+    parser.add_argument('--fs', type=int, default=256)
+    parser.add_argument('--reads', type=int, default=20)
+    parser.add_argument('--disorder', default='Sleep Apnea')
+    args = parser.parse_args()
+
+    eeg = synthesize_eeg(args.disorder, 0, args.hours * 3600, args.fs)
+    pool = create_pool()
+    rng = random.Random(42)
+
+    def epoch_start():
+        return rng.uniform(0.4, 0.6) * args.hours * 3600
+
+    print(f"{'encoding':<16} {'MB/hour':>8} {'encode s':>9} {'30 s read ms':>13} {'bytes read':>11}")
+
+    # Old encoding: samples as text, parsed in full to get any slice
+    start = time.perf_counter()
+    text = json.dumps(np.round(eeg.astype(np.float64), 2).tolist())
+    encode_seconds = time.perf_counter() - start
+    pool.execute("INSERT INTO sleep_monitoring (id, eeg_text) VALUES (%s, %s)", (1, text))
+
+    def read_text():
+        first = int(epoch_start() * args.fs)
+        samples = json.loads(pool.fetchall("SELECT eeg_text FROM sleep_monitoring WHERE id = %s", (1,))[0][0])
+        return samples[first:first + 30 * args.fs]
+
+    print(f"{'TEXT (JSON)':<16} {len(text) / args.hours / 1e6:>8.2f} {encode_seconds:>9.2f} "
+          f"{median_ms(read_text, args.reads):>13.1f} {len(text):>11,}")
+
+    for row_id, (name, encoding, compression) in enumerate(ENCODINGS, start=2):
+        start = time.perf_counter()
+        blob = encode_signal(eeg, args.fs, encoding=encoding, compression=compression)
+        encode_seconds = time.perf_counter() - start
+        pool.execute("INSERT INTO sleep_monitoring (id, eeg_data) VALUES (%s, %s)", (row_id, blob))
+
+        bytes_read = []
+
+        def read_blob():
+            signal_blob = SignalBlob(blob_reader(pool, 'eeg_data', row_id))
+            samples = signal_blob.read_seconds(epoch_start(), 30)
+            bytes_read.append(signal_blob.bytes_read)
+            return samples
+
+        latency = median_ms(read_blob, args.reads)
+        print(f"{name:<16} {len(blob) / args.hours / 1e6:>8.2f} {encode_seconds:>9.2f} "
+              f"{latency:>13.2f} {int(np.median(bytes_read)):>11,}")
+
+    print(f"(MySQL TEXT holds {MYSQL_TEXT_LIMIT:,} bytes, about {MYSQL_TEXT_LIMIT / (len(text) / len(eeg)) / args.fs:.0f} s "
+          f"of {args.fs} Hz EEG as text)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# Start-up Import Benchmark
+# Imports the web app in a fresh interpreter with `python -X importtime` and reports
+# where the time goes, grouped by top-level package. Pass --rev to measure another
+# git revision (e.g. the commit before an import change) side by side.
+#
+# Usage: python benchmarks/bench_startup.py [--rev HEAD~1] [--module app] [--top 15]
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def import_times(module, cwd):
+    """Run `import module` under -X importtime; return {top-level package: self us} and wall seconds"""
+    # The interpreter exits right after the import, so background threads never matter
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          cwd=cwd, capture_output=True, text=True)
+
+    packages = defaultdict(int)
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        # Charge each module's own time to its top-level package (sklearn.tree -> sklearn)
+        packages[name.strip().split('.')[0]] += int(self_us)
+
+    wall = None
+    if proc.returncode == 0 and proc.stdout.strip():
+        wall = float(proc.stdout.strip().splitlines()[-1])
+    elif proc.returncode != 0:
+        print(f"warning: importing {module} in {cwd} failed: {proc.stderr.strip().splitlines()[-1]}")
+    return dict(packages), wall
+
+
+def export_revision(rev, target):
+    """Check out a git revision's tree into target without touching the working copy"""
+    archive = subprocess.run(['git', 'archive', rev], cwd=REPO_DIR, capture_output=True, check=True)
+    subprocess.run(['tar', '-x', '-C', target], input=archive.stdout, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Break down app import time by package")
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--rev', help="git revision to compare against the working tree")
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [('current', REPO_DIR)]
+    tmp = None
+    if args.rev:
+        tmp = tempfile.TemporaryDirectory()
+        export_revision(args.rev, tmp.name)
+        runs.insert(0, (args.rev, tmp.name))
+
+    results = [(label,) + import_times(args.module, cwd) for label, cwd in runs]
+
+    totals = defaultdict(int)
+    for _, packages, _ in results:
+        for name, us in packages.items():
+            totals[name] = max(totals[name], us)
+    top = sorted(totals, key=totals.get, reverse=True)[:args.top]
+
+    header = f"{'package':<24}" + ''.join(f"{label:>14}" for label, _, _ in results)
+    print(header)
+    print('-' * len(header))
+    for name in top:
+        print(f"{name:<24}" + ''.join(f"{packages.get(name, 0) / 1000:>12.1f}ms" for _, packages, _ in results))
+    print('-' * len(header))
+    print(f"{'sum of packages':<24}" + ''.join(f"{sum(packages.values()) / 1000:>12.1f}ms" for _, packages, _ in results))
+    print(f"{'wall (import ' + args.module + ')':<24}" + ''.join(
+        f"{wall * 1000:>12.1f}ms" if wall is not None else f"{'failed':>14}" for _, _, wall in results))
+
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
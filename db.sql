@@ -6,16 +6,20 @@ use db;
 create table users(
     id INT PRIMARY KEY AUTO_INCREMENT, 
     name VARCHAR(50), 
-    email VARCHAR(50), 
-    password VARCHAR(50)
+    email VARCHAR(50) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NOT NULL, 
+    password VARCHAR(50),
+    -- Case-insensitive (via the collation) unique index used by /login and /register
+    UNIQUE KEY users_email_unique (email)
     );
 
 create table sleep_monitoring(
     id INT PRIMARY KEY AUTO_INCREMENT,
     user_id INT,
     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-    eeg_data TEXT,
-    hrv_data TEXT,
+    -- Encoded signals (signal_storage.py): a header with the sample rate and start,
+    -- a chunk offset table, then compressed 30 s chunks, so slices are range reads
+    eeg_data LONGBLOB,
+    hrv_data MEDIUMBLOB,
     sleep_position VARCHAR(20),
     respiratory_pattern VARCHAR(20),
     FOREIGN KEY (user_id) REFERENCES users(id)
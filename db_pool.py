@@ -0,0 +1,264 @@
+# Database Access Layer for Sleep Disorder Classification
+# A bounded pool of database connections shared by all request threads. Every query
+# gets its own cursor on a pooled connection, stale connections are replaced
+# automatically and the time spent waiting for a free connection is recorded.
+#
+# mysql-connector runs with autocommit off, so even a plain SELECT opens a transaction
+# whose REPEATABLE READ snapshot lasts until the next commit or rollback. Connections
+# are therefore rolled back whenever they go back to the pool, so the next borrower
+# sees current data (e.g. /login finds a user /register just added).
+
+from flask import jsonify
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+# MySQL settings used by the web app
+DB_CONFIG = {
+    'host': "localhost",
+    'user': "root",
+    'password': "",
+    'port': "3306",
+    'database': 'db'
+}
+
+# Maximum number of open connections per worker process
+POOL_SIZE = 5
+
+# Seconds a request waits for a free connection before giving up
+POOL_TIMEOUT_SECONDS = 10.0
+
+# Idle connections older than this are checked before being handed out
+POOL_PING_INTERVAL_SECONDS = 30.0
+
+
+class PoolTimeout(Exception):
+    """No connection became free within the pool timeout"""
+
+
+def mysql_connect(**config):
+    """Connection factory for the MySQL database in db.sql"""
+    import mysql.connector
+    return mysql.connector.connect(**(config or DB_CONFIG))
+
+
+def mysql_disconnect_errors():
+    """Exceptions that mean the MySQL connection itself is gone"""
+    import mysql.connector
+    return (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError)
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of DB-API connections.
+
+    connect is a zero-argument factory returning a new connection, so the pool can
+    be pointed at MySQL in production or at sqlite3 (paramstyle='qmark') in a script."""
+
+    def __init__(self, connect, size=POOL_SIZE, timeout=POOL_TIMEOUT_SECONDS,
+                 ping_interval=POOL_PING_INTERVAL_SECONDS, paramstyle='format', disconnect_errors=()):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.paramstyle = paramstyle
+        self.disconnect_errors = tuple(disconnect_errors)
+
+        # Idle connections as (connection, last_used); LIFO keeps the warmest ones in use
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+
+        # Metrics
+        self._created = 0
+        self._reconnects = 0
+        self._in_use = 0
+        self._acquisitions = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _new_connection(self):
+        conn = self._connect()
+        with self._lock:
+            self._created += 1
+        return conn
+
+    def _is_alive(self, conn):
+        """Cheap liveness check for a connection that has been idle for a while"""
+        try:
+            if hasattr(conn, 'ping'):
+                conn.ping(reconnect=False)
+            else:
+                cursor = conn.cursor()
+                cursor.execute('SELECT 1')
+                cursor.fetchall()
+                cursor.close()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _checkout(self):
+        try:
+            conn, last_used = self._idle.get_nowait()
+        except queue.Empty:
+            return self._new_connection()
+
+        # Replace connections the server has probably dropped
+        if time.monotonic() - last_used > self.ping_interval and not self._is_alive(conn):
+            self._close(conn)
+            with self._lock:
+                self._reconnects += 1
+            return self._new_connection()
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with-block"""
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise PoolTimeout(f"No database connection available after {self.timeout} seconds")
+
+        wait = time.perf_counter() - start
+        with self._lock:
+            self._acquisitions += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            self._in_use += 1
+
+        conn = None
+        broken = False
+        try:
+            conn = self._checkout()
+            yield conn
+        except Exception as e:
+            broken = isinstance(e, self.disconnect_errors)
+            raise
+        finally:
+            if conn is not None and not broken:
+                # End whatever transaction is still open (uncommitted writes after an
+                # error, or the snapshot a read started) before anyone else gets it
+                try:
+                    conn.rollback()
+                except Exception:
+                    broken = True
+            if conn is not None:
+                if broken:
+                    self._close(conn)
+                else:
+                    self._idle.put((conn, time.monotonic()))
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def cursor(self, commit=False):
+        """A fresh cursor on a pooled connection, committed on success if requested"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                yield cursor
+                if commit:
+                    conn.commit()
+            finally:
+                cursor.close()
+
+    def _query(self, query):
+        # MySQL uses %s placeholders, sqlite3 uses ?
+        if self.paramstyle == 'qmark':
+            return query.replace('%s', '?')
+        return query
+
+    def _run(self, fn, retry):
+        # A connection dropped by the server is always discarded; the statement is only
+        # retried if running it twice is harmless
+        try:
+            return fn()
+        except self.disconnect_errors:
+            with self._lock:
+                self._reconnects += 1
+            if not retry:
+                raise
+            return fn()
+
+    def execute(self, query, values=()):
+        """Run a statement and commit it.
+
+        Not retried after a dropped connection: the server may have applied it already."""
+        def run():
+            with self.cursor(commit=True) as cursor:
+                cursor.execute(self._query(query), values)
+                return cursor.rowcount
+        return self._run(run, retry=False)
+
+    def executemany(self, query, rows, cursor=None):
+        """Run a statement once per row with a single executemany call.
+
+        Given a cursor from cursor(), the rows join that cursor's transaction and the
+        caller commits; otherwise they are committed on a pooled connection of their own.
+        Not retried after a dropped connection, like execute()."""
+        if cursor is not None:
+            cursor.executemany(self._query(query), rows)
+            return cursor.rowcount
+
+        def run():
+            with self.cursor(commit=True) as cursor:
+                cursor.executemany(self._query(query), rows)
+                return cursor.rowcount
+        return self._run(run, retry=False)
+
+    def fetchall(self, query, values=()):
+        """Run a query and return all rows"""
+        def run():
+            with self.cursor() as cursor:
+                cursor.execute(self._query(query), values)
+                return cursor.fetchall()
+        return self._run(run, retry=True)
+
+    def close(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close(conn)
+
+    def stats(self):
+        """Pool size, usage and wait-time metrics"""
+        with self._lock:
+            return {
+                'size': self.size,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+                'created': self._created,
+                'reconnects': self._reconnects,
+                'acquisitions': self._acquisitions,
+                'timeouts': self._timeouts,
+                'wait_avg_ms': round(self._wait_total / self._acquisitions * 1000, 3) if self._acquisitions else 0.0,
+                'wait_max_ms': round(self._wait_max * 1000, 3),
+                'wait_total_ms': round(self._wait_total * 1000, 3)
+            }
+
+
+def create_mysql_pool(**config):
+    """Pool of connections to the app's MySQL database (connections open lazily)"""
+    config = config or DB_CONFIG
+    return ConnectionPool(lambda: mysql_connect(**config), disconnect_errors=mysql_disconnect_errors())
+
+
+def add_db_pool_routes(app, pool):
+    """Add database pool routes to the Flask app"""
+
+    @app.route('/api/db/pool', methods=['GET'])
+    def db_pool_stats():
+        return jsonify(pool.stats())
@@ -0,0 +1,251 @@
+# Face and Landmark Detection for Sleep Disorder Classification
+# A CPU-only detector built from the cascades that ship with OpenCV, so it works without
+# dlib or any extra model files. Faces are found on a downscaled grayscale copy of the
+# photo; the 68 iBUG-style landmarks are fitted from a template aligned to the detected
+# eyes, with eyelid and lip openings measured from the pixels, then mapped back to the
+# full-resolution image.
+
+import os
+import numpy as np
+
+# Longest side of the grayscale copy used for face detection
+DETECTION_MAX_SIDE = 384
+
+# Cascade pyramid step, and the smallest face searched for as a fraction of the
+# image's short side (uploads are portraits, so tiny background faces are skipped)
+DETECTION_SCALE_FACTOR = 1.15
+MIN_FACE_FRACTION = 1 / 6
+
+# Width of the normalised face crop the landmarks are measured on
+FACE_CROP_SIZE = 192
+
+# Haar/LBP cascade files; override with FACE_CASCADE_PATH / EYE_CASCADE_PATH
+# (e.g. an LBP cascade from the OpenCV source tree, which is faster still)
+FACE_CASCADE_NAME = 'haarcascade_frontalface_default.xml'
+EYE_CASCADE_NAME = 'haarcascade_eye.xml'
+
+# Template geometry in face-box units (the box the frontal-face cascade returns)
+EYE_CENTERS = ((0.30, 0.40), (0.70, 0.40))
+EYE_HALF_WIDTH = 0.085
+MOUTH_CENTER = (0.5, 0.80)
+MOUTH_HALF_WIDTH = 0.17
+
+# Pixels darker than this percentile of the face crop count as pupil/iris or mouth cavity
+DARK_PERCENTILE = 8
+
+# Bump when detection, landmark fitting or the features built on them change, so
+# landmark results cached by image content aren't served from the old version
+DETECTOR_VERSION = 1
+
+
+def _template_points():
+    """Mean 68-point face shape in face-box units (0..1) with a neutral expression"""
+    points = np.zeros((68, 2), dtype=np.float32)
+
+    # Jawline 0-16: from the left ear, round the chin, to the right ear
+    theta = np.pi - np.arange(17) * np.pi / 16
+    points[0:17, 0] = 0.5 + 0.46 * np.cos(theta)
+    points[0:17, 1] = 0.40 + 0.58 * np.sin(theta)
+
+    # Eyebrows 17-21 and 22-26 as shallow arcs
+    t = np.linspace(0.0, 1.0, 5)
+    points[17:22, 0] = 0.15 + 0.28 * t
+    points[17:22, 1] = 0.29 - 0.04 * np.sin(np.pi * t)
+    points[22:27, 0] = 0.57 + 0.28 * t
+    points[22:27, 1] = 0.29 - 0.04 * np.sin(np.pi * t)
+
+    # Nose bridge 27-30 and nostrils 31-35
+    points[27:31, 0] = 0.5
+    points[27:31, 1] = [0.38, 0.46, 0.54, 0.62]
+    points[31:36, 0] = [0.42, 0.46, 0.50, 0.54, 0.58]
+    points[31:36, 1] = [0.68, 0.695, 0.70, 0.695, 0.68]
+
+    # Eyes 36-41 and 42-47
+    points[36:42] = _eye_points(EYE_CENTERS[0], EYE_HALF_WIDTH, 0.3 * EYE_HALF_WIDTH)
+    points[42:48] = _eye_points(EYE_CENTERS[1], EYE_HALF_WIDTH, 0.3 * EYE_HALF_WIDTH)
+
+    # Outer lips 48-59 and inner lips 60-67
+    points[48:68] = _mouth_points(MOUTH_CENTER, MOUTH_HALF_WIDTH, 0.0)
+    return points
+
+
+def _eye_points(center, half_width, half_height):
+    """Six eye points: outer corner, two upper lid, inner corner, two lower lid"""
+    cx, cy = center
+    return np.array([
+        [cx - half_width, cy],
+        [cx - half_width / 3, cy - half_height],
+        [cx + half_width / 3, cy - half_height],
+        [cx + half_width, cy],
+        [cx + half_width / 3, cy + half_height],
+        [cx - half_width / 3, cy + half_height],
+    ], dtype=np.float32)
+
+
+def _mouth_points(center, half_width, opening):
+    """Twenty lip points; opening is the gap between the inner lips, in the same units as center"""
+    cx, cy = center
+    lip = 0.2 * half_width  # Lip thickness
+    gap = opening / 2
+    outer_x = cx + half_width * np.array([-1, -0.6, -0.25, 0, 0.25, 0.6, 1, 0.6, 0.25, 0, -0.25, -0.6])
+    outer_y = cy + np.array([0, -1, -1.2, -1, -1.2, -1, 0, 1, 1.1, 1.1, 1.1, 1]) * lip
+    outer_y[1:6] -= gap
+    outer_y[7:12] += gap
+    inner_x = cx + half_width * np.array([-0.8, -0.35, 0, 0.35, 0.8, 0.35, 0, -0.35])
+    inner_y = cy + np.array([0, -1, -1, -1, 0, 1, 1, 1]) * gap
+    return np.column_stack([np.concatenate([outer_x, inner_x]), np.concatenate([outer_y, inner_y])]).astype(np.float32)
+
+
+TEMPLATE_POINTS = _template_points()
+
+
+def _dark_run(roi, dark_level, min_fraction=0.15):
+    """Height of the tallest band of dark rows in the middle of an ROI, as a fraction of its height.
+
+    The iris and pupil of an open eye, or the mouth cavity, form a tall band of pixels
+    below dark_level; a closed eyelid or closed lips leave a thin line or nothing."""
+    import cv2
+    if roi.size == 0:
+        return 0.0
+    dark = cv2.GaussianBlur(roi, (3, 3), 0) < dark_level
+    # Only the central half of the columns, away from eye corners and shadows
+    w = roi.shape[1]
+    rows = dark[:, w // 4: w - w // 4].mean(axis=1) > min_fraction
+    best = run = 0
+    for row in rows:
+        run = run + 1 if row else 0
+        best = max(best, run)
+    return best / roi.shape[0]
+
+
+def _similarity(src, dst):
+    """2x3 similarity transform mapping two source points onto two destination points"""
+    (sx0, sy0), (sx1, sy1) = src
+    (dx0, dy0), (dx1, dy1) = dst
+    s = complex(dx1 - dx0, dy1 - dy0) / complex(sx1 - sx0, sy1 - sy0)
+    t = complex(dx0, dy0) - s * complex(sx0, sy0)
+    return np.array([[s.real, -s.imag, t.real], [s.imag, s.real, t.imag]], dtype=np.float32)
+
+
+class FaceDetector:
+    """Largest-face detector and 68-point landmark fitter on OpenCV's bundled cascades"""
+
+    def __init__(self, face_cascade_path=None, eye_cascade_path=None):
+        import cv2
+        face_cascade_path = face_cascade_path or os.environ.get('FACE_CASCADE_PATH') or os.path.join(cv2.data.haarcascades, FACE_CASCADE_NAME)
+        eye_cascade_path = eye_cascade_path or os.environ.get('EYE_CASCADE_PATH') or os.path.join(cv2.data.haarcascades, EYE_CASCADE_NAME)
+        self.face_cascade = cv2.CascadeClassifier(face_cascade_path)
+        self.eye_cascade = cv2.CascadeClassifier(eye_cascade_path)
+        if self.face_cascade.empty():
+            raise IOError(f"Could not load face cascade: {face_cascade_path}")
+        if self.eye_cascade.empty():
+            raise IOError(f"Could not load eye cascade: {eye_cascade_path}")
+
+    def downscale(self, gray, max_side=DETECTION_MAX_SIDE):
+        """Grayscale copy no larger than max_side, and the factor that maps it back"""
+        import cv2
+        scale = min(1.0, max_side / max(gray.shape[:2]))
+        if scale == 1.0:
+            return gray, 1.0
+        if scale < 0.5:
+            # INTER_AREA straight from 12MP costs ~35ms; a bilinear pass to twice the
+            # target size followed by a 2x area reduction is ~1ms and still smooth
+            larger = cv2.resize(gray, None, fx=2 * scale, fy=2 * scale, interpolation=cv2.INTER_LINEAR)
+            small = cv2.resize(larger, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+        else:
+            small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        # Rounding of the output size makes the effective factor differ slightly
+        return small, small.shape[1] / gray.shape[1]
+
+    def detect(self, small, scale=1.0):
+        """Largest face on the downscaled image as (x, y, w, h) in full-resolution pixels, or None"""
+        min_side = max(24, int(min(small.shape[:2]) * MIN_FACE_FRACTION))
+        # No histogram equalisation: the cascade normalises each window's contrast itself
+        faces = self.face_cascade.detectMultiScale(small, scaleFactor=DETECTION_SCALE_FACTOR,
+                                                   minNeighbors=5, minSize=(min_side, min_side))
+        if len(faces) == 0:
+            return None
+        x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+        return tuple(float(v) / scale for v in (x, y, w, h))
+
+    def landmarks(self, gray, face, eyes=None):
+        """Fit 68 landmarks to a detected face.
+
+        eyes are the (2, 2) eye centres on the face crop to align the template to; they
+        are searched for with the eye cascade when None. Video frames pass the centres
+        found at the last detection (see find_eyes) and skip the search.
+
+        Returns (points, crop_points): a (68, 2) float32 array in full-resolution pixels
+        and the same points on the FACE_CROP_SIZE-wide face crop, the scale the
+        feature measurements are calibrated for."""
+        size = FACE_CROP_SIZE
+        crop, (x, y, w, h) = self._crop(gray, face)
+
+        # Template in crop pixels, aligned to the eyes when both are found
+        template = TEMPLATE_POINTS * size
+        if eyes is None:
+            eyes = self._find_eyes(crop)
+        if eyes is not None:
+            transform = _similarity(np.array(EYE_CENTERS) * size, eyes)
+            template = template @ transform[:, :2].T + transform[:, 2]
+        points = template.astype(np.float32)
+
+        # Measure how open each eye and the mouth are and move the lid/lip points to match.
+        # "Dark" is relative to the whole face, so a closed eye's shadow doesn't count
+        dark_level = np.percentile(crop, DARK_PERCENTILE)
+        half_width = EYE_HALF_WIDTH * size
+        for start in (36, 42):
+            center = points[start:start + 6].mean(axis=0)
+            roi = self._roi(crop, center, half_width, half_width * 0.8)
+            half_height = max(0.5, _dark_run(roi, dark_level) * half_width * 0.8)
+            points[start:start + 6] = _eye_points(center, half_width, min(half_height, 0.6 * half_width))
+
+        mouth_center = points[48:68].mean(axis=0)
+        mouth_half_width = MOUTH_HALF_WIDTH * size
+        roi = self._roi(crop, mouth_center, mouth_half_width * 0.6, mouth_half_width * 0.5)
+        opening = _dark_run(roi, dark_level, min_fraction=0.3) * mouth_half_width
+        points[48:68] = _mouth_points(mouth_center, mouth_half_width, opening)
+
+        # Back to full-resolution image coordinates
+        full = points * np.array([w / size, h / size], dtype=np.float32) + np.array([x, y], dtype=np.float32)
+        return full.astype(np.float32), points
+
+    def find_eyes(self, gray, face):
+        """Eye centres on the face crop, to pass to landmarks as eyes, or None if not both found"""
+        crop, _ = self._crop(gray, face)
+        return self._find_eyes(crop)
+
+    @staticmethod
+    def _crop(gray, face):
+        """The face cut from the full-resolution image (a view, no copy) into a fixed-size
+        equalised patch, and the integer box it was cut from"""
+        import cv2
+        x, y, w, h = face
+        size = FACE_CROP_SIZE
+        x0, y0 = int(round(x)), int(round(y))
+        x1, y1 = min(gray.shape[1], int(round(x + w))), min(gray.shape[0], int(round(y + h)))
+        crop = cv2.equalizeHist(cv2.resize(gray[y0:y1, x0:x1], (size, size), interpolation=cv2.INTER_AREA))
+        return crop, (x0, y0, x1 - x0, y1 - y0)
+
+    def _find_eyes(self, crop):
+        """Centres of the left and right eye in the upper half of the face crop, or None"""
+        size = crop.shape[1]
+        upper = crop[:size // 2]
+        eyes = self.eye_cascade.detectMultiScale(upper, scaleFactor=1.1, minNeighbors=4,
+                                                 minSize=(size // 10, size // 10), maxSize=(size // 3, size // 3))
+        left = [e for e in eyes if e[0] + e[2] / 2 < size / 2]
+        right = [e for e in eyes if e[0] + e[2] / 2 >= size / 2]
+        if not left or not right:
+            return None
+        centers = []
+        for group in (left, right):
+            ex, ey, ew, eh = max(group, key=lambda e: e[2] * e[3])
+            centers.append((ex + ew / 2, ey + eh / 2))
+        return np.array(centers, dtype=np.float32)
+
+    @staticmethod
+    def _roi(image, center, half_width, half_height):
+        cx, cy = center
+        x0, x1 = int(max(0, cx - half_width)), int(min(image.shape[1], cx + half_width))
+        y0, y1 = int(max(0, cy - half_height)), int(min(image.shape[0], cy + half_height))
+        return image[y0:y1, x0:x1]
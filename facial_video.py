@@ -0,0 +1,306 @@
+# Video Analysis for Facial Sleep Disorder Indicators
+# Measures blink rate and PERCLOS (percentage of time the eyes are closed) from a short
+# clip or a series of frames, which a single photo can't provide. Frames are decoded
+# one at a time, the face is tracked between periodic re-detections, and the eye
+# aspect ratio (EAR) of every frame feeds running blink/closure counters.
+
+from flask import request, jsonify
+import os
+import tempfile
+import time
+import numpy as np
+
+from app_image_processing import facial_metrics, features_from_metrics, add_template_features
+from image_decode import decode_grayscale
+
+# Longest clip analysed; later frames are ignored
+VIDEO_MAX_FRAMES = 1800
+
+# Frame rate assumed for uploaded frame series (and videos that don't report one)
+DEFAULT_FPS = 30.0
+
+# Run the full face detector at least this often; frames in between are tracked
+REDETECT_INTERVAL = 30
+
+# Template-match score below which the tracker gives up and re-detects
+TRACK_MIN_SCORE = 0.6
+
+# Width the face template is reduced to for tracking
+TRACK_TEMPLATE_WIDTH = 48
+
+# Eyes count as closed below this EAR (the same cut-off as the 'open' flag of a photo)
+EAR_CLOSED_THRESHOLD = 0.2
+
+# Closures in this range count as blinks; longer ones only add to PERCLOS
+BLINK_MIN_SECONDS = 0.05
+BLINK_MAX_SECONDS = 0.5
+
+# Blinks per minute that map to a blinkRate of 1.0 in the feature dict
+BLINK_RATE_FULL_SCALE_PER_MIN = 30.0
+
+# Detector shared by all video requests in this worker
+_detector = None
+
+
+def _elapsed_ms(start):
+    return (time.perf_counter() - start) * 1000
+
+
+def get_detector():
+    """The worker's FaceDetector, created on first use"""
+    global _detector
+    if _detector is None:
+        from face_detection import FaceDetector
+        _detector = FaceDetector()
+    return _detector
+
+
+def iter_video_file(path):
+    """Yield (timestamp, grayscale frame) from a video file, one frame at a time"""
+    import cv2
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError("Could not open the video")
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        if not np.isfinite(fps) or fps <= 0:
+            fps = DEFAULT_FPS
+        index = 0
+        while index < VIDEO_MAX_FRAMES:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield index / fps, cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            index += 1
+    finally:
+        capture.release()
+
+
+def iter_image_frames(files, fps=DEFAULT_FPS):
+    """Yield (timestamp, grayscale frame) from uploaded image files, decoding each only when reached"""
+    for index, file in enumerate(files[:VIDEO_MAX_FRAMES]):
+        image, _ = decode_grayscale(file.read())
+        if image is None:
+            raise ValueError(f"Could not decode frame {index}")
+        yield index / fps, image
+
+
+class FaceTracker:
+    """Follows one face across frames: full detection every REDETECT_INTERVAL frames,
+    template matching around the last position in between"""
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.face = None            # (x, y, w, h) in frame pixels
+        self.template = None
+        self.template_scale = 1.0
+        self.frames_since_detect = 0
+        self.detections = 0
+
+    def update(self, gray):
+        """Face box for this frame, or None if there isn't one"""
+        import cv2
+        if self.face is not None and self.frames_since_detect < REDETECT_INTERVAL:
+            face = self._track(gray)
+            if face is not None:
+                self.face = face
+                self.frames_since_detect += 1
+                return face
+
+        small, scale = self.detector.downscale(gray)
+        self.face = self.detector.detect(small, scale)
+        self.detections += 1
+        self.frames_since_detect = 0
+        if self.face is not None:
+            # Remember the face at a small fixed width to match against in the next frames
+            x, y, w, h = (int(round(v)) for v in self.face)
+            self.template_scale = TRACK_TEMPLATE_WIDTH / w
+            self.template = cv2.resize(gray[y:y + h, x:x + w], None, fx=self.template_scale, fy=self.template_scale,
+                                       interpolation=cv2.INTER_AREA)
+        return self.face
+
+    def _track(self, gray):
+        import cv2
+        x, y, w, h = self.face
+        # Search a window half a face wider than the last box on every side
+        pad_x, pad_y = w / 2, h / 2
+        x0, y0 = int(max(0, x - pad_x)), int(max(0, y - pad_y))
+        x1, y1 = int(min(gray.shape[1], x + w + pad_x)), int(min(gray.shape[0], y + h + pad_y))
+        scale = self.template_scale
+        window = cv2.resize(gray[y0:y1, x0:x1], None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        if window.shape[0] < self.template.shape[0] or window.shape[1] < self.template.shape[1]:
+            return None
+        result = cv2.matchTemplate(window, self.template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (mx, my) = cv2.minMaxLoc(result)
+        if score < TRACK_MIN_SCORE:
+            return None
+        return (x0 + mx / scale, y0 + my / scale, w, h)
+
+
+def _closure_counts(duration):
+    """(blinks, long closures) added by one closure lasting duration seconds"""
+    if duration > BLINK_MAX_SECONDS:
+        return 0, 1
+    if duration >= BLINK_MIN_SECONDS:
+        return 1, 0
+    return 0, 0
+
+
+class EyeClosureMonitor:
+    """Running blink count and PERCLOS from one EAR sample per frame"""
+
+    def __init__(self, threshold=EAR_CLOSED_THRESHOLD):
+        self.threshold = threshold
+        self.frames = 0
+        self.closed_frames = 0
+        self.blinks = 0
+        self.long_closures = 0
+        self.first_time = None
+        self.last_time = None
+        self._closed_since = None
+
+    def update(self, timestamp, ear):
+        """Add one frame's eye aspect ratio"""
+        if self.first_time is None:
+            self.first_time = timestamp
+        self.last_time = timestamp
+        self.frames += 1
+
+        if ear < self.threshold:
+            self.closed_frames += 1
+            if self._closed_since is None:
+                self._closed_since = timestamp
+        elif self._closed_since is not None:
+            self._end_closure(timestamp)
+
+    def _end_closure(self, timestamp):
+        blinks, long_closures = _closure_counts(timestamp - self._closed_since)
+        self.blinks += blinks
+        self.long_closures += long_closures
+        self._closed_since = None
+
+    def summary(self):
+        """Blink count, blinks per minute and PERCLOS so far"""
+        duration = 0.0
+        frame_interval = 0.0
+        if self.frames > 1:
+            # Include the last frame's own interval
+            frame_interval = (self.last_time - self.first_time) / (self.frames - 1)
+            duration = frame_interval * self.frames
+
+        # Eyes still closed at the last frame: the closure runs to the end of the clip
+        blinks, long_closures = self.blinks, self.long_closures
+        if self._closed_since is not None:
+            open_blinks, open_long_closures = _closure_counts(self.last_time + frame_interval - self._closed_since)
+            blinks += open_blinks
+            long_closures += open_long_closures
+
+        return {
+            'face_frames': self.frames,
+            'duration_seconds': round(duration, 3),
+            'blinks': blinks,
+            'long_closures': long_closures,
+            'blinks_per_minute': round(blinks / duration * 60, 2) if duration else 0.0,
+            'perclos': round(self.closed_frames / self.frames, 4) if self.frames else 0.0
+        }
+
+
+def analyze_frames(frames, detector=None):
+    """Track a face through (timestamp, gray) frames and measure blinks, PERCLOS and features.
+
+    Only the 68 landmarks of each frame are kept, never the frames themselves."""
+    detector = detector or get_detector()
+    tracker = FaceTracker(detector)
+    monitor = EyeClosureMonitor()
+    ear_series = []
+    crop_points = []
+    eyes = None
+    timings = {'decode': 0.0, 'track': 0.0, 'landmarks': 0.0, 'ear': 0.0}
+
+    start = time.perf_counter()
+    for timestamp, gray in frames:
+        timings['decode'] += _elapsed_ms(start)
+
+        start = time.perf_counter()
+        face = tracker.update(gray)
+        timings['track'] += _elapsed_ms(start)
+        if face is None:
+            ear_series.append(None)
+            start = time.perf_counter()
+            continue
+
+        # The eye cascade only runs on detection frames and the other frames reuse the
+        # alignment (the tracked box keeps its size); closed eyes keep the previous one
+        start = time.perf_counter()
+        if tracker.frames_since_detect == 0:
+            found = detector.find_eyes(gray, face)
+            if found is not None:
+                eyes = found
+        _, points = detector.landmarks(gray, face, eyes)
+        timings['landmarks'] += _elapsed_ms(start)
+
+        start = time.perf_counter()
+        metrics = facial_metrics(points)
+        ear = float((metrics['left_eye_openness'][0] + metrics['right_eye_openness'][0]) / 2)
+        monitor.update(timestamp, ear)
+        ear_series.append(round(ear, 4))
+        crop_points.append(points)
+        timings['ear'] += _elapsed_ms(start)
+        start = time.perf_counter()
+
+    if not crop_points:
+        return None, "No face detected in the video", {'ear': ear_series, 'timings': timings}
+
+    # Average the per-frame measurements (one batched call) into a single feature dict
+    start = time.perf_counter()
+    metrics = facial_metrics(np.stack(crop_points))
+    mean_metrics = {name: values.mean() for name, values in metrics.items()}
+    landmarks = add_template_features(features_from_metrics(mean_metrics), mean_metrics)[0]
+
+    blinks = monitor.summary()
+    blink_rate = min(1.0, blinks['blinks_per_minute'] / BLINK_RATE_FULL_SCALE_PER_MIN)
+    # Measured rather than simulated
+    landmarks['eyes']['left']['blinkRate'] = blink_rate
+    landmarks['eyes']['right']['blinkRate'] = blink_rate
+    timings['features'] = _elapsed_ms(start)
+
+    frames_seen = len(ear_series)
+    timings = {name: round(value, 3) for name, value in timings.items()}
+    timings['per_frame'] = round(sum(timings.values()) / frames_seen, 3)
+    return landmarks, None, dict(blinks, frames=frames_seen,
+                                 detections=tracker.detections, ear=ear_series, timings=timings)
+
+
+def add_facial_video_routes(app):
+    """Add video facial analysis routes to the Flask app"""
+
+    @app.route('/process_facial_video', methods=['POST'])
+    def process_facial_video():
+        """Analyse a clip ('video' file) or a series of images ('frames' files, optional 'fps')"""
+        temp_path = None
+        try:
+            if 'video' in request.files:
+                # VideoCapture needs a path; FileStorage.save streams the upload to disk in chunks
+                fd, temp_path = tempfile.mkstemp(suffix=os.path.splitext(request.files['video'].filename or '')[1])
+                with os.fdopen(fd, 'wb') as f:
+                    request.files['video'].save(f)
+                frames = iter_video_file(temp_path)
+            elif request.files.getlist('frames'):
+                fps = float(request.form.get('fps', DEFAULT_FPS))
+                if not np.isfinite(fps) or fps <= 0:
+                    return jsonify({'success': False, 'error': "fps must be a positive number"}), 400
+                frames = iter_image_frames(request.files.getlist('frames'), fps)
+            else:
+                return jsonify({'error': "Expected a 'video' file or 'frames' image files"}), 400
+
+            landmarks, error, measurements = analyze_frames(frames)
+            if error:
+                return jsonify({'success': False, 'error': error, **measurements})
+            return jsonify({'success': True, 'landmarks': landmarks, **measurements})
+
+        except Exception as e:
+            print(f"Error in process_facial_video route: {e}")
+            return jsonify({'success': False, 'error': str(e)}), 400
+        finally:
+            if temp_path:
+                os.remove(temp_path)
@@ -0,0 +1,90 @@
+# Categorical Vocabulary for Sleep Disorder Classification
+# Gender, Occupation and BMI Category labels with the codes LabelEncoder gave them
+# at training time, plus the Sleep Disorder target labels (the model's classes_).
+# train_model.py writes it next to the model artifacts so the app never has to read
+# the dataset to build dropdowns, encode inputs or name the model's outputs.
+
+import json
+import os
+import re
+
+VOCABULARY_PATH = os.path.join('Models', 'vocabulary.json')
+
+# Categorical columns in the order they appear in the dataset
+CATEGORICAL_COLUMNS = ['Gender', 'Occupation', 'BMI Category']
+
+# Target column; LabelEncoder codes its labels, so classes_ 0, 1, 2 are these sorted
+TARGET_COLUMN = 'Sleep Disorder'
+
+
+class Vocabulary:
+    """Label to code mapping for the categorical inputs, as fitted at training time"""
+
+    def __init__(self, columns):
+        # columns: {column: {'codes': {label: code}, 'options': [labels, most common first]}}
+        self.columns = columns
+        inputs = {col: entry for col, entry in columns.items() if col != TARGET_COLUMN}
+        self.codes = {col: dict(entry['codes']) for col, entry in inputs.items()}
+
+        # Target labels by class code, i.e. the names of the model's classes_
+        # (None for a vocabulary written before the target was recorded)
+        target = columns.get(TARGET_COLUMN)
+        self.classes = sorted(target['codes'], key=target['codes'].get) if target else None
+
+        # Dropdown data for prediction.html: form field name -> [(label, value)]
+        self.dropdown = {
+            re.sub(r'\s+', '_', col): [(label, label) for label in entry['options']]
+            for col, entry in inputs.items()
+        }
+
+    def class_name(self, code):
+        """Training label of a model class code"""
+        if self.classes is None:
+            raise ValueError(f"Vocabulary has no {TARGET_COLUMN} labels; retrain with train_model.py")
+        return self.classes[int(code)]
+
+    def encode(self, column, label):
+        """Return the training-time code for a categorical label"""
+        try:
+            return self.codes[column][str(label)]
+        except KeyError:
+            raise ValueError(f"Unknown {column}: {label}")
+
+    def to_json(self):
+        return json.dumps(self.columns, indent=2)
+
+    @classmethod
+    def loads(cls, data):
+        """Build a Vocabulary from the JSON bytes written by save_vocabulary"""
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return cls(json.loads(data))
+
+
+def build_vocabulary(df):
+    """Build the vocabulary from the raw (not yet encoded) dataset"""
+    columns = {}
+    for col in CATEGORICAL_COLUMNS + [TARGET_COLUMN]:
+        # Target rows without a disorder are read as NaN and trained as 'None'
+        values = df[col].fillna('None').astype(str)
+        # LabelEncoder assigns codes in sorted order of the unique labels
+        labels = sorted(values.unique())
+        columns[col] = {
+            'codes': {label: code for code, label in enumerate(labels)},
+            'options': list(values.value_counts().index)
+        }
+    return Vocabulary(columns)
+
+
+def save_vocabulary(vocabulary, path=VOCABULARY_PATH):
+    """Write the vocabulary as JSON, replacing any previous file atomically"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(vocabulary.to_json())
+    os.replace(tmp_path, path)
+
+
+def load_vocabulary(path=VOCABULARY_PATH):
+    """Read a vocabulary written by save_vocabulary"""
+    with open(path, 'rb') as f:
+        return Vocabulary.loads(f.read())
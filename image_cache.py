@@ -0,0 +1,164 @@
+# Result Cache for Facial Image Processing
+# Landmark results keyed by a SHA-256 of the decoded image bytes and the detector version,
+# so re-uploads of the same photo skip decoding and analysis. An in-memory LRU (capped in
+# bytes, with a TTL) sits in front of an optional on-disk tier that every worker process
+# can share.
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Memory budget for cached results per worker process
+IMAGE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# Seconds a cached result stays valid
+IMAGE_CACHE_TTL_SECONDS = 3600
+
+# Directory for the shared on-disk tier; unset disables it
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR')
+
+
+def image_key(image_bytes, version):
+    """Cache key for an image: SHA-256 of the detector version and its decoded bytes"""
+    digest = hashlib.sha256(f"{version}:".encode('ascii'))
+    digest.update(image_bytes)
+    return digest.hexdigest()
+
+
+def to_builtin(obj):
+    """Convert NumPy scalars inside a result to plain Python types so it can be stored as JSON"""
+    if isinstance(obj, dict):
+        return {key: to_builtin(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_builtin(value) for value in obj]
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+class ResultCache:
+    """Thread-safe LRU of JSON-encoded results with a byte cap, a TTL and an optional disk tier"""
+
+    def __init__(self, max_bytes=IMAGE_CACHE_MAX_BYTES, ttl_seconds=IMAGE_CACHE_TTL_SECONDS, disk_dir=IMAGE_CACHE_DIR):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+        # key -> (stored_at, encoded result); most recently used last
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key + '.json')
+
+    def get(self, key):
+        """Return a fresh copy of the cached result, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, data = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(data)
+                self._remove(key)
+                self.expirations += 1
+
+        data, stored_at = self._read_disk(key, now)
+        if data is not None:
+            with self._lock:
+                self.disk_hits += 1
+                # Keep the file's age so the entry expires when the file does
+                self._store(key, data, stored_at)
+            return json.loads(data)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, result):
+        """Cache a result (a JSON-serialisable structure, NumPy scalars allowed)"""
+        data = json.dumps(to_builtin(result), separators=(',', ':')).encode('utf-8')
+        with self._lock:
+            self._store(key, data, time.time())
+        self._write_disk(key, data)
+
+    def _store(self, key, data, stored_at):
+        # Results bigger than the whole budget aren't worth keeping in memory
+        if len(data) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (stored_at, data)
+        self._bytes += len(data)
+        while self._bytes > self.max_bytes:
+            old_key = next(iter(self._entries))
+            self._remove(old_key)
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, data = self._entries.pop(key)
+        self._bytes -= len(data)
+
+    def _read_disk(self, key, now):
+        """(encoded result, time it was written) from the disk tier, or (None, None)"""
+        if not self.disk_dir:
+            return None, None
+        path = self._disk_path(key)
+        try:
+            stored_at = min(os.path.getmtime(path), now)
+            if now - stored_at > self.ttl_seconds:
+                os.remove(path)
+                return None, None
+            with open(path, 'rb') as f:
+                return f.read(), stored_at
+        except OSError:
+            return None, None
+
+    def _write_disk(self, key, data):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so other workers never read a partial file
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing image cache entry: {e}")
+
+    def stats(self):
+        """Hit/miss counters and memory usage"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                'disk_dir': self.disk_dir
+            }
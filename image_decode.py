@@ -0,0 +1,91 @@
+# Image Decoding for Facial Image Processing
+# Uploads are decoded straight to grayscale at the smallest resolution the analysis
+# needs: the JPEG/PNG header is read first and OpenCV's IMREAD_REDUCED_* modes (DCT
+# scaling for JPEG) skip most of the work for large phone photos.
+
+import binascii
+import struct
+import numpy as np
+
+# Decoded images keep at least this many pixels on their long side, enough for
+# the smallest face the detector looks for to fill the landmark crop
+ANALYSIS_MIN_SIDE = 960
+
+# Largest upload the facial endpoints accept (file or base64 form field)
+MAX_IMAGE_UPLOAD_BYTES = 16 * 1024 * 1024
+
+# JPEG start-of-frame markers (the ones carrying the image size)
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def image_size(buf):
+    """(width, height) from a JPEG or PNG header without decoding, or None"""
+    data = memoryview(buf)
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+        width, height = struct.unpack('>II', data[16:24])
+        return width, height
+
+    if data[:2] != b'\xff\xd8':
+        return None
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # Fill byte
+            i += 1
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack('>HH', data[i + 5:i + 9])
+            return width, height
+        if marker == 0xD8 or 0xD0 <= marker <= 0xD7:  # Markers without a length
+            i += 2
+            continue
+        i += 2 + struct.unpack('>H', data[i + 2:i + 4])[0]
+    return None
+
+
+def reduction_factor(size, min_side=ANALYSIS_MIN_SIDE):
+    """Largest of 8, 4, 2 that keeps the long side at least min_side, else 1"""
+    if size is None:
+        return 1
+    long_side = max(size)
+    for factor in (8, 4, 2):
+        if long_side // factor >= min_side:
+            return factor
+    return 1
+
+
+def decode_grayscale(buf, min_side=ANALYSIS_MIN_SIDE):
+    """Decode image bytes to a grayscale ndarray at reduced resolution.
+
+    Returns (image, factor) where multiplying image coordinates by factor gives
+    full-resolution coordinates; image is None if the bytes can't be decoded."""
+    import cv2
+    if len(buf) == 0:
+        return None, 1
+    factor = reduction_factor(image_size(buf), min_side)
+    flag = {
+        1: cv2.IMREAD_GRAYSCALE,
+        2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+        4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+        8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+    }[factor]
+    # frombuffer wraps the bytes without copying them
+    image = cv2.imdecode(np.frombuffer(buf, dtype=np.uint8), flag)
+    return image, factor
+
+
+def decode_data_uri(image_data):
+    """Raw bytes from a 'data:image/...;base64,' string, or None.
+
+    a2b_base64 reads an ASCII str directly, so the only copy of what can be a
+    multi-megabyte string is the slice after the header; there is no encode() of the
+    whole string and no split() list. Non-ASCII input raises ValueError."""
+    comma = image_data.find(',')
+    if comma < 0:
+        return None
+    try:
+        return binascii.a2b_base64(image_data[comma + 1:])
+    except ValueError:
+        return None
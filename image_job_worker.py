@@ -0,0 +1,45 @@
+# Image Job Worker
+# Entry point for the image job processes started by image_jobs. The pool uses the
+# forkserver (or spawn) start method, so workers are not forked from the threaded Flask
+# process; this module is what they unpickle, and it imports nothing beyond the
+# standard library until the first job needs the image analysis code.
+
+import signal
+import time
+
+
+class JobTimeout(BaseException):
+    """Raised inside a worker when a job runs past its time limit.
+
+    A BaseException so the except-Exception fallbacks in process_image don't swallow it."""
+
+
+def _alarm(signum, frame):
+    raise JobTimeout()
+
+
+def run_image_job(image_bytes, timeout):
+    """Worker-process entry point: analyse one image under a time limit"""
+    from app_image_processing import process_image
+    started_at = time.time()
+    # SIGALRM interrupts the job once the limit passes (tasks run on the worker's main thread)
+    previous = signal.signal(signal.SIGALRM, _alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        timings = {}
+        landmarks, error = process_image(image_bytes, timings)
+        status = 'done'
+    except JobTimeout:
+        landmarks, error, timings = None, f"Job exceeded {timeout} seconds", {}
+        status = 'timeout'
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+    return {
+        'status': status,
+        'landmarks': landmarks,
+        'error': error,
+        'timings': timings,
+        'started_at': started_at,
+        'finished_at': time.time()
+    }
@@ -0,0 +1,233 @@
+# Background Jobs for Facial Image Processing
+# Lets /process_facial_image?async=1 return a job id straight away while a small
+# process pool does the decoding and landmark work (image_job_worker), so big uploads
+# don't hold a Flask worker thread. The queue is bounded (submissions beyond it are rejected),
+# each job has a time limit, and queue depth and wait times are recorded.
+
+from flask import jsonify
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures.process import BrokenProcessPool
+
+from image_cache import to_builtin
+from image_job_worker import run_image_job
+
+# Worker processes doing image analysis
+IMAGE_JOB_WORKERS = int(os.environ.get('IMAGE_JOB_WORKERS', 2))
+
+# Jobs queued or running at once; further submissions get a 503
+IMAGE_JOB_QUEUE_SIZE = int(os.environ.get('IMAGE_JOB_QUEUE_SIZE', 32))
+
+# Seconds a job may wait for a worker, and separately may run, before it is given up
+IMAGE_JOB_TIMEOUT_SECONDS = float(os.environ.get('IMAGE_JOB_TIMEOUT_SECONDS', 30))
+
+# Seconds a finished job's result stays available to poll
+IMAGE_JOB_RESULT_TTL_SECONDS = 600
+
+# Recent wait/run times kept for the metrics
+METRICS_WINDOW = 1000
+
+
+class QueueFull(Exception):
+    """The job queue is at capacity"""
+
+
+class ImageJobQueue:
+    """Bounded queue of image analysis jobs run on a process pool"""
+
+    def __init__(self, workers=IMAGE_JOB_WORKERS, max_pending=IMAGE_JOB_QUEUE_SIZE,
+                 timeout=IMAGE_JOB_TIMEOUT_SECONDS, result_ttl=IMAGE_JOB_RESULT_TTL_SECONDS):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.result_ttl = result_ttl
+        self._executor = None
+        self._jobs = OrderedDict()  # job id -> job dict, oldest first
+        self._pending = 0
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.rejected = 0
+        self.cache_hits = 0
+        self._waits = deque(maxlen=METRICS_WINDOW)
+        self._runs = deque(maxlen=METRICS_WINDOW)
+
+    def _get_executor(self):
+        # Created on first use. Forking the multithreaded Flask process can copy a lock
+        # held by another thread into the child, so workers come from the forkserver
+        # (a clean single-threaded process with image_job_worker preloaded) or, where
+        # that isn't available, are spawned. app.py skips its start-up work when a
+        # worker re-imports it as __mp_main__
+        if self._executor is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload(['image_job_worker'])
+            else:
+                context = multiprocessing.get_context('spawn')
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        return self._executor
+
+    def submit(self, image_bytes, cache=None, key=None):
+        """Queue an image and return its job id; raises QueueFull at capacity.
+
+        With a cache and key, a cached result completes the job immediately and a
+        computed one is stored for the next identical upload."""
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        job = {'id': job_id, 'status': 'queued', 'submitted_at': now, 'started_at': None,
+               'finished_at': None, 'landmarks': None, 'error': None, 'timings': {}}
+
+        cached = cache.get(key) if cache is not None else None
+        with self._lock:
+            self._prune(now)
+            if cached is not None:
+                self.cache_hits += 1
+                job.update(status='done', started_at=now, finished_at=now,
+                           landmarks=cached['landmarks'], error=cached['error'], timings={'cache_hit': True})
+                self._jobs[job_id] = job
+                return job_id
+
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise QueueFull(f"Image job queue is full ({self.max_pending} pending)")
+            self._pending += 1
+            self.submitted += 1
+            self._jobs[job_id] = job
+
+        try:
+            try:
+                future = self._get_executor().submit(run_image_job, image_bytes, self.timeout)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); start a fresh pool
+                self._executor = None
+                future = self._get_executor().submit(run_image_job, image_bytes, self.timeout)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+                self._jobs.pop(job_id, None)
+            raise
+        job['future'] = future
+        future.add_done_callback(lambda f: self._finish(job, f, cache, key))
+        return job_id
+
+    def _finish(self, job, future, cache, key):
+        """Record a job's outcome (runs on the executor's management thread)"""
+        if future.cancelled():
+            # Given up on in the queue; already recorded by _expire
+            return
+        try:
+            outcome = future.result()
+        except Exception as e:
+            outcome = {'status': 'failed', 'landmarks': None, 'error': str(e), 'timings': {},
+                       'started_at': None, 'finished_at': time.time()}
+
+        with self._lock:
+            if job['status'] in ('queued', 'running'):
+                self._pending -= 1
+            outcome['landmarks'] = to_builtin(outcome['landmarks'])
+            job.update(outcome)
+            if job['started_at'] is not None:
+                self._waits.append(job['started_at'] - job['submitted_at'])
+                self._runs.append(job['finished_at'] - job['started_at'])
+            if job['status'] == 'done':
+                self.completed += 1
+            elif job['status'] == 'timeout':
+                self.timed_out += 1
+            else:
+                self.failed += 1
+
+        if cache is not None and key is not None and job['status'] == 'done':
+            cache.put(key, {'landmarks': job['landmarks'], 'error': job['error']})
+
+    def _expire(self, job, now):
+        """Give up on a job that has waited longer than the timeout for a worker"""
+        future = job.get('future')
+        if future is not None and future.cancel():
+            self._pending -= 1
+            self.timed_out += 1
+            job.update(status='timeout', finished_at=now,
+                       error=f"Job waited more than {self.timeout} seconds for a worker")
+
+    def _prune(self, now):
+        """Drop results past their TTL and expire jobs stuck in the queue (lock held).
+
+        Jobs finish out of submission order, so every job is checked rather than
+        stopping at the first one still queued or running."""
+        for job_id, job in list(self._jobs.items()):
+            if job['finished_at'] is not None:
+                if now - job['finished_at'] > self.result_ttl:
+                    del self._jobs[job_id]
+            elif job['status'] == 'queued' and now - job['submitted_at'] > self.timeout:
+                self._expire(job, now)
+
+    def get(self, job_id):
+        """Status and, once finished, the result of a job; None for unknown ids"""
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            future = job.get('future')
+            if job['status'] == 'queued' and future is not None and future.running():
+                job['status'] = 'running'
+            result = {name: value for name, value in job.items() if name != 'future'}
+        if result['finished_at'] is None:
+            result['elapsed_seconds'] = round(now - result['submitted_at'], 3)
+        return result
+
+    def stats(self):
+        """Queue depth, outcome counters and wait/run time metrics"""
+        with self._lock:
+            self._prune(time.time())
+            waits = sorted(self._waits)
+            runs = sorted(self._runs)
+
+            def ms(values, q):
+                return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 1) if values else 0.0
+
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'timeout_seconds': self.timeout,
+                'pending': self._pending,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'timed_out': self.timed_out,
+                'rejected': self.rejected,
+                'cache_hits': self.cache_hits,
+                'wait_p50_ms': ms(waits, 0.5),
+                'wait_p95_ms': ms(waits, 0.95),
+                'wait_max_ms': ms(waits, 1.0),
+                'run_p50_ms': ms(runs, 0.5),
+                'run_p95_ms': ms(runs, 0.95)
+            }
+
+
+# Job queue shared by all requests in this Flask worker
+image_jobs = ImageJobQueue()
+
+
+def add_image_job_routes(app):
+    """Add image job result and metrics routes to the Flask app"""
+
+    @app.route('/api/image_jobs/<job_id>', methods=['GET'])
+    def image_job_result(job_id):
+        job = image_jobs.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Unknown job id'}), 404
+        return jsonify(job)
+
+    @app.route('/api/image_jobs', methods=['GET'])
+    def image_job_stats():
+        return jsonify(image_jobs.stats())
@@ -0,0 +1,64 @@
+# Fused Input Encoding for the Serving Model
+# Turns the 11 raw /prediction fields into the scaled, selected feature row the model
+# takes, without building any pandas objects: categorical labels are looked up in the
+# vocabulary and written with the numeric fields straight into a preallocated float64
+# row, then the scaler's mean and scale are applied only to the columns SelectKBest
+# keeps, in one gather + subtract + divide over that row.
+#
+# The subtraction and division are the same float64 operations StandardScaler does, so
+# the result is bit-identical to k_best.transform(scaler.transform(frame)). (Folding
+# them into one multiply-add would round differently and could flip a tree split.)
+
+import threading
+import numpy as np
+
+
+class InputEncoder:
+    """Raw inputs -> model row for one serving version (scaler + selector + vocabulary)"""
+
+    def __init__(self, vocabulary, scaler, k_best):
+        self.columns = np.flatnonzero(k_best.get_support())
+        n_features = scaler.n_features_in_
+        mean = scaler.mean_ if scaler.mean_ is not None else np.zeros(n_features)
+        scale = scaler.scale_ if scaler.scale_ is not None else np.ones(n_features)
+        self.mean = np.ascontiguousarray(mean[self.columns], dtype=np.float64)
+        self.scale = np.ascontiguousarray(scale[self.columns], dtype=np.float64)
+        self.n_features = n_features
+        self.vocabulary = vocabulary
+        # Per-thread buffers, reused by every request on that thread
+        self._local = threading.local()
+
+    def _buffers(self):
+        local = self._local
+        if not hasattr(local, 'row'):
+            local.row = np.empty(self.n_features, dtype=np.float64)
+            local.selected = np.empty(len(self.columns), dtype=np.float64)
+        return local.row, local.selected
+
+    def encode(self, gender, age, occupation, sleep_duration, quality_of_sleep, physical_activity_level,
+               stress_level, bmi_category, systolic, heart_rate, daily_steps):
+        """Write one record into this thread's raw row and return it (valid until the next call).
+
+        Raises ValueError for a categorical label the model wasn't trained on."""
+        encode = self.vocabulary.encode
+        gender, occupation, bmi_category = (encode('Gender', gender), encode('Occupation', occupation),
+                                            encode('BMI Category', bmi_category))
+        row, _ = self._buffers()
+        row[:] = (gender, age, occupation, sleep_duration, quality_of_sleep, physical_activity_level,
+                  stress_level, bmi_category, systolic, heart_rate, daily_steps)
+        return row
+
+    def transform_row(self, row):
+        """Scaled selected features of one raw row, in this thread's buffer (valid until the next call)"""
+        _, selected = self._buffers()
+        np.take(row, self.columns, out=selected)
+        np.subtract(selected, self.mean, out=selected)
+        np.divide(selected, self.scale, out=selected)
+        return selected
+
+    def transform(self, X, out=None):
+        """Scaled selected features of a batch of raw rows (n, 11), into `out` if given"""
+        out = np.take(X, self.columns, axis=1, out=out)
+        np.subtract(out, self.mean, out=out)
+        np.divide(out, self.scale, out=out)
+        return out
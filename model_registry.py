@@ -0,0 +1,498 @@
+# Model Registry for Sleep Disorder Classification
+# Loads the pickled scalers, feature selectors and classifiers once per process
+# and hands the same shared objects to every request instead of unpickling per request.
+# The serving triple in Models/ is versioned and can be hot-swapped after retraining.
+
+from flask import jsonify
+import hashlib
+import os
+import pickle
+import sys
+import threading
+import time
+import types
+from collections import namedtuple
+
+import numpy as np
+
+from feature_vocabulary import Vocabulary, VOCABULARY_PATH, CATEGORICAL_COLUMNS
+from compiled_model import try_compile, verify_compiled
+from input_encoder import InputEncoder
+
+MODELS_DIR = 'Models'
+BACKEND_DIR = 'BACK END'
+
+# Artifacts used by the /prediction route (written by train_model.py)
+SERVING_ARTIFACTS = {
+    'scaler': os.path.join(MODELS_DIR, 'scaler.pkl'),
+    'k_best': os.path.join(MODELS_DIR, 'k_best_selector.pkl'),
+    'model': os.path.join(MODELS_DIR, 'Random Forest_model_k_best.pkl'),
+    'vocabulary': VOCABULARY_PATH,
+}
+
+# Artifacts that aren't pickles, with the function that parses their bytes
+ARTIFACT_LOADERS = {
+    'vocabulary': Vocabulary.loads,
+}
+
+# Artifacts produced by the notebooks in BACK END/ (own scaler and 10-feature selector)
+BACKEND_ARTIFACTS = {
+    'backend/scaler': os.path.join(BACKEND_DIR, 'scaler.pkl'),
+    'backend/k_best': os.path.join(BACKEND_DIR, 'k_best_selector.pkl'),
+}
+for _name in ['KNN', 'SVM', 'Decision Tree', 'Random Forest', 'ANN']:
+    for _suffix in ['original', 'k_best']:
+        BACKEND_ARTIFACTS[f'backend/{_name}_{_suffix}'] = os.path.join(BACKEND_DIR, f'{_name}_model_{_suffix}.pkl')
+for _name in ['stacking_classifier', 'voting_classifier']:
+    for _suffix in ['original', 'k_best']:
+        BACKEND_ARTIFACTS[f'backend/{_name}_{_suffix}'] = os.path.join(BACKEND_DIR, f'{_name}_{_suffix}.pkl')
+
+# How often the watcher checks Models/ for retrained artifacts
+WATCH_INTERVAL_SECONDS = 5.0
+
+# Number of past serving versions kept for the /api/models/active report
+VERSION_HISTORY_SIZE = 10
+
+# Canned input used to verify a new serving triple before it goes live
+# (first row of the dataset, encoded with the candidate's own vocabulary)
+FEATURE_COLUMNS = ['Gender', 'Age', 'Occupation', 'Sleep Duration',
+                   'Quality of Sleep', 'Physical Activity Level', 'Stress Level',
+                   'BMI Category', 'Blood Pressure', 'Heart Rate', 'Daily Steps']
+CANNED_RECORD = {
+    'Gender': 'Male', 'Age': 27, 'Occupation': 'Software Engineer', 'Sleep Duration': 6.1,
+    'Quality of Sleep': 6, 'Physical Activity Level': 42, 'Stress Level': 6,
+    'BMI Category': 'Overweight', 'Blood Pressure': 126, 'Heart Rate': 77, 'Daily Steps': 4200
+}
+
+# One loaded artifact; the record itself is immutable and the object is shared read-only
+LoadedArtifact = namedtuple('LoadedArtifact', ['name', 'path', 'obj', 'load_seconds', 'memory_bytes', 'file_bytes', 'loaded_at', 'sha256'])
+
+
+class ServingBundle(namedtuple('ServingBundle', ['version', 'artifacts', 'load_seconds', 'loaded_at', 'compiled',
+                                                 'encoder'])):
+    """One immutable version of the scaler + selector + model triple (and its vocabulary) served by /prediction.
+
+    `compiled` is the triple flattened by compiled_model.py when the model is a tree
+    ensemble (None otherwise); it gives exactly the model's probabilities. `encoder`
+    turns raw inputs into the model's scaled, selected features (input_encoder.py)."""
+    __slots__ = ()
+
+    def predict_proba_row(self, selected):
+        """Model probabilities for one row from encoder.transform_row"""
+        if self.compiled is not None:
+            return self.compiled.predict_proba_scaled_row(selected)
+        return self.model.predict_proba(selected[np.newaxis, :])[0]
+
+    def predict_proba(self, X):
+        """Model probabilities for a batch of raw encoded rows (n, 11)"""
+        selected = self.encoder.transform(X)
+        if self.compiled is not None:
+            return self.compiled.predict_proba_scaled(selected)
+        return self.model.predict_proba(selected)
+
+    @property
+    def vocabulary(self):
+        return self.artifacts['vocabulary'].obj
+
+    @property
+    def scaler(self):
+        return self.artifacts['scaler'].obj
+
+    @property
+    def k_best(self):
+        return self.artifacts['k_best'].obj
+
+    @property
+    def model(self):
+        return self.artifacts['model'].obj
+
+
+def file_stamp(paths):
+    """Cheap change detector: (path, mtime, size) for every file"""
+    stamp = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stamp.append((path, st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamp.append((path, None, None))
+    return tuple(stamp)
+
+
+def file_checksum(path):
+    """SHA-256 of a file's contents"""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def bundle_version(checksums):
+    """Short version id derived from the checksums of the files in a bundle"""
+    return hashlib.sha256(''.join(checksums).encode()).hexdigest()[:12]
+
+
+def estimate_memory(obj):
+    """Approximate bytes held by a fitted estimator (numpy buffers plus Python containers)"""
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, (type, types.ModuleType, types.FunctionType)):
+            continue
+        seen.add(id(item))
+
+        if isinstance(item, np.ndarray):
+            total += item.nbytes
+            if item.dtype == object:
+                stack.extend(item.ravel())
+            continue
+
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif hasattr(item, '__dict__'):
+            stack.append(vars(item))
+        elif hasattr(item, '__getstate__') and not isinstance(item, (str, bytes, int, float)):
+            # Cython objects such as sklearn's Tree keep their arrays behind __getstate__
+            try:
+                stack.append(item.__getstate__())
+            except Exception:
+                pass
+    return total
+
+
+def load_artifact(name, path):
+    """Unpickle one artifact and measure how long it took and how much memory it holds"""
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        data = f.read()
+    obj = ARTIFACT_LOADERS.get(name, pickle.loads)(data)
+    load_seconds = time.perf_counter() - start
+
+    return LoadedArtifact(
+        name=name,
+        path=path,
+        obj=obj,
+        load_seconds=load_seconds,
+        memory_bytes=estimate_memory(obj),
+        file_bytes=len(data),
+        loaded_at=time.time(),
+        sha256=hashlib.sha256(data).hexdigest()
+    )
+
+
+def canned_frame(vocabulary):
+    """CANNED_RECORD encoded with a vocabulary, as a one-row frame"""
+    # Only needed when a serving triple is verified, so app start-up doesn't import pandas
+    import pandas as pd
+    canned = dict(CANNED_RECORD)
+    for col in CATEGORICAL_COLUMNS:
+        canned[col] = vocabulary.encode(col, canned[col])
+    return pd.DataFrame([canned], columns=FEATURE_COLUMNS)
+
+
+def verify_serving_bundle(scaler, k_best, model, vocabulary):
+    """Run the canned input through a candidate triple and check the output looks sane"""
+    canned_input = canned_frame(vocabulary)
+
+    n_selected = int(np.sum(k_best.get_support()))
+    if k_best.n_features_in_ != scaler.n_features_in_:
+        raise ValueError(f"Selector expects {k_best.n_features_in_} features but scaler produces {scaler.n_features_in_}")
+    if model.n_features_in_ != n_selected:
+        raise ValueError(f"Model expects {model.n_features_in_} features but selector produces {n_selected}")
+
+    proba = model.predict_proba(k_best.transform(scaler.transform(canned_input)))
+    if proba.shape != (1, len(model.classes_)) or not np.all(np.isfinite(proba)):
+        raise ValueError(f"Unexpected probabilities from canned input: {proba}")
+    if abs(float(proba.sum()) - 1.0) > 1e-6:
+        raise ValueError(f"Probabilities from canned input do not sum to 1: {proba}")
+    if vocabulary.classes is not None and len(vocabulary.classes) != len(model.classes_):
+        raise ValueError(f"Model has {len(model.classes_)} classes but the vocabulary names {len(vocabulary.classes)}")
+
+
+def load_serving_bundle(paths):
+    """Load and verify a scaler + selector + model triple (plus vocabulary) as one version"""
+    start = time.perf_counter()
+    artifacts = {name: load_artifact(name, path) for name, path in paths.items()}
+    scaler, k_best, model, vocabulary = (artifacts[name].obj for name in ('scaler', 'k_best', 'model', 'vocabulary'))
+    verify_serving_bundle(scaler, k_best, model, vocabulary)
+
+    # The fused encoder and the flat tree form must both agree exactly with sklearn
+    canned_input = canned_frame(vocabulary)
+    encoder = InputEncoder(vocabulary, scaler, k_best)
+    canned_row = encoder.encode(*(CANNED_RECORD[col] for col in FEATURE_COLUMNS))
+    if not np.array_equal(encoder.transform_row(canned_row), k_best.transform(scaler.transform(canned_input))[0]):
+        raise ValueError("Fused input encoding disagrees with the scaler and selector")
+    compiled = try_compile(scaler, k_best, model)
+    if compiled is not None:
+        verify_compiled(compiled, scaler, k_best, model, canned_input.to_numpy(dtype=np.float64))
+    return ServingBundle(
+        version=bundle_version([artifacts[name].sha256 for name in sorted(artifacts)]),
+        artifacts=artifacts,
+        load_seconds=time.perf_counter() - start,
+        loaded_at=time.time(),
+        compiled=compiled,
+        encoder=encoder
+    )
+
+
+class ModelRegistry:
+    """Process-wide cache of unpickled model artifacts.
+
+    Every artifact is read from disk at most once. Callers get the same object
+    back on every call and must treat it as read-only (transform/predict only).
+
+    The serving triple (scaler, k_best, model) is held as one ServingBundle.
+    A retrain replaces the whole bundle in a single assignment, so a request that
+    grabbed the bundle with active() keeps using the old version until it finishes."""
+
+    def __init__(self, artifacts=None, serving=None):
+        self._paths = dict(artifacts if artifacts is not None else BACKEND_ARTIFACTS)
+        self._serving_paths = dict(serving if serving is not None else SERVING_ARTIFACTS)
+        self._loaded = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+
+        # Serving bundle state
+        self._active = None
+        self._active_stamp = None
+        self._reload_lock = threading.Lock()
+        self._reload_error = None
+        # When loading the serving triple last failed (monotonic), so requests without
+        # a model retry at most once per WATCH_INTERVAL_SECONDS instead of every time
+        self._reload_failed_at = None
+        self._retry_lock = threading.Lock()
+        self._history = []
+        self._watcher = None
+        self._stop_watching = threading.Event()
+
+    def names(self):
+        """Names of all artifacts known to the registry"""
+        return list(self._serving_paths) + list(self._paths)
+
+    def get(self, name):
+        """Return the shared object for an artifact, loading it on first use"""
+        # Serving artifacts always come from the active version
+        if name in self._serving_paths:
+            return self.active().artifacts[name].obj
+
+        entry = self._loaded.get(name)
+        if entry is None:
+            entry = self._load(name)
+        return entry.obj
+
+    def _load(self, name):
+        if name not in self._paths:
+            raise KeyError(f"Unknown model artifact: {name}")
+
+        with self._lock:
+            # Another thread may have loaded it while we were waiting for the lock
+            entry = self._loaded.get(name)
+            if entry is not None:
+                return entry
+
+            # Don't hit the disk again for an artifact that is known to be broken
+            if name in self._errors:
+                raise RuntimeError(f"Model artifact {name} failed to load: {self._errors[name]}")
+
+            try:
+                entry = load_artifact(name, self._paths[name])
+            except Exception as e:
+                self._errors[name] = str(e)
+                raise RuntimeError(f"Model artifact {name} failed to load: {e}")
+
+            # Publish a new dict so readers without the lock never see a half-updated one
+            loaded = dict(self._loaded)
+            loaded[name] = entry
+            self._loaded = loaded
+
+            print(f"Loaded model artifact {name} from {entry.path} "
+                  f"in {entry.load_seconds * 1000:.1f} ms ({entry.memory_bytes / 1024:.1f} KiB)")
+            return entry
+
+    def _retry_due(self):
+        failed_at = self._reload_failed_at
+        return failed_at is None or time.monotonic() - failed_at >= WATCH_INTERVAL_SECONDS
+
+    def active(self):
+        """Return the serving bundle currently in use, loading it on first use"""
+        bundle = self._active
+        if bundle is None:
+            if self._retry_due():
+                with self._retry_lock:
+                    # Concurrent requests wait for one attempt instead of each making their own
+                    if self._active is None and self._retry_due():
+                        self.reload()
+            bundle = self._active
+            if bundle is None:
+                raise RuntimeError(f"No serving model available: {self._reload_error}")
+        return bundle
+
+    def reload(self):
+        """Load the serving triple from disk and make it active if it passes verification.
+
+        Returns True if a new version was activated. A triple that fails to load or
+        verify is rejected and the current version stays active."""
+        with self._reload_lock:
+            stamp = file_stamp(self._serving_paths.values())
+            try:
+                bundle = load_serving_bundle(self._serving_paths)
+            except Exception as e:
+                self._reload_error = str(e)
+                self._reload_failed_at = time.monotonic()
+                self._active_stamp = stamp
+                self._record_version(None, None, f"rejected: {e}")
+                print(f"Error loading serving models, keeping current version: {e}")
+                return False
+
+            self._active_stamp = stamp
+            self._reload_error = None
+            self._reload_failed_at = None
+            current = self._active
+            if current is not None and current.version == bundle.version:
+                return False
+
+            # Single reference swap; in-flight requests keep the bundle they already hold
+            self._active = bundle
+            self._record_version(bundle.version, bundle.load_seconds, 'active')
+            print(f"Serving model version {bundle.version} activated "
+                  f"(loaded in {bundle.load_seconds * 1000:.1f} ms)")
+            return True
+
+    def _record_version(self, version, load_seconds, status):
+        # A rejected reload leaves the current version serving
+        if status == 'active':
+            for entry in self._history:
+                if entry['status'] == 'active':
+                    entry['status'] = 'retired'
+        self._history.append({
+            'version': version,
+            'load_ms': round(load_seconds * 1000, 3) if load_seconds is not None else None,
+            'at': time.time(),
+            'status': status
+        })
+        del self._history[:-VERSION_HISTORY_SIZE]
+
+    def check_for_update(self):
+        """Reload the serving triple if the files in Models/ have changed"""
+        stamp = file_stamp(self._serving_paths.values())
+        if stamp == self._active_stamp:
+            return False
+
+        # Wait until the files stop changing so a half-written retrain isn't picked up
+        time.sleep(min(1.0, WATCH_INTERVAL_SECONDS))
+        if file_stamp(self._serving_paths.values()) != stamp:
+            return False
+
+        # Touched but identical files don't need a reload
+        bundle = self._active
+        if bundle is not None:
+            try:
+                checksums = {name: file_checksum(path) for name, path in self._serving_paths.items()}
+            except OSError:
+                return False
+            if all(bundle.artifacts[name].sha256 == checksums[name] for name in checksums):
+                self._active_stamp = stamp
+                return False
+
+        return self.reload()
+
+    def start_watching(self, interval=WATCH_INTERVAL_SECONDS):
+        """Start a daemon thread that hot-reloads the serving triple after a retrain"""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+
+        def watch():
+            while not self._stop_watching.wait(interval):
+                try:
+                    self.check_for_update()
+                except Exception as e:
+                    print(f"Error checking for model updates: {e}")
+
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(target=watch, name='model-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        """Stop the hot-reload thread"""
+        self._stop_watching.set()
+
+    def preload(self, names=None):
+        """Load artifacts up front (all of them by default), logging instead of raising on failure"""
+        for name in (names if names is not None else self.names()):
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"Error preloading model artifact: {e}")
+
+    def active_info(self):
+        """Version, load latency and file details of the active serving bundle"""
+        bundle = self._active
+        return {
+            'version': bundle.version if bundle else None,
+            'load_ms': round(bundle.load_seconds * 1000, 3) if bundle else None,
+            'loaded_at': bundle.loaded_at if bundle else None,
+            'artifacts': {
+                name: {
+                    'path': entry.path,
+                    'sha256': entry.sha256,
+                    'load_ms': round(entry.load_seconds * 1000, 3),
+                    'memory_bytes': entry.memory_bytes,
+                    'file_bytes': entry.file_bytes
+                }
+                for name, entry in bundle.artifacts.items()
+            } if bundle else {},
+            'compiled': {
+                'trees': bundle.compiled.n_trees,
+                'nodes': bundle.compiled.n_nodes,
+                'max_depth': bundle.compiled.max_depth
+            } if bundle and bundle.compiled is not None else None,
+            'last_error': self._reload_error,
+            'watching': self._watcher is not None and self._watcher.is_alive(),
+            'history': list(self._history)
+        }
+
+    def stats(self):
+        """Load time and memory for every known artifact"""
+        stats = []
+        bundle = self._active
+        for name, path in self._serving_paths.items():
+            entry = bundle.artifacts[name] if bundle else None
+            stats.append(self._artifact_stats(name, path, entry, self._reload_error if entry is None else None))
+
+        loaded = self._loaded
+        for name, path in self._paths.items():
+            stats.append(self._artifact_stats(name, path, loaded.get(name), self._errors.get(name)))
+        return stats
+
+    @staticmethod
+    def _artifact_stats(name, path, entry, error):
+        return {
+            'name': name,
+            'path': path,
+            'loaded': entry is not None,
+            'load_ms': round(entry.load_seconds * 1000, 3) if entry else None,
+            'memory_bytes': entry.memory_bytes if entry else None,
+            'file_bytes': entry.file_bytes if entry else None,
+            'loaded_at': entry.loaded_at if entry else None,
+            'error': error
+        }
+
+
+# Shared registry for the whole process
+registry = ModelRegistry()
+
+
+def add_model_registry_routes(app):
+    """Add model registry routes to the Flask app"""
+
+    @app.route('/api/models', methods=['GET'])
+    def model_registry_stats():
+        return jsonify({'artifacts': registry.stats()})
+
+    @app.route('/api/models/active', methods=['GET'])
+    def model_registry_active():
+        return jsonify(registry.active_info())
@@ -0,0 +1,227 @@
+# Cross-Validated Hyperparameter Search for the Model Zoo
+# Stratified k-fold CV over a parameter grid per model family, on the training split
+# only (the held-out test split of train_model.py is never touched). Each fold fits its
+# own scaler, SMOTE and SelectKBest on the fold's training rows, so no synthetic or
+# scaled validation rows leak into training. The fold matrices are built once and
+# cached on disk, and every (candidate, fold) fit runs in a process pool.
+#
+# Candidates are raced fold by fold: once a candidate has been scored on a few folds,
+# one whose mean is clearly behind its family's best is dropped without fitting the
+# remaining folds.
+#
+# Usage: python train_model.py --search [--folds 5] [--families SVM KNN ...] [--jobs 4]
+
+import itertools
+import json
+import os
+import pickle
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.model_selection import StratifiedKFold
+
+from train_model import (make_estimator, split_dataset, fit_preprocessing, preprocess_key, save_artifact,
+                         MODEL_FAMILIES, FEATURE_SETS, RANDOM_STATE, DATASET_PATH, CACHE_DIR, RUNS_DIR)
+
+# Values tried for each family (every other parameter keeps its MODEL_PARAMS value)
+PARAM_GRIDS = {
+    'KNN': {'n_neighbors': [3, 5, 7, 11, 15], 'weights': ['uniform', 'distance']},
+    'SVM': {'C': [0.1, 1, 10, 100], 'gamma': ['scale', 0.01, 0.1, 1]},
+    'Decision Tree': {'max_depth': [4, 6, 8, 10, None], 'min_samples_split': [2, 5, 10],
+                      'min_samples_leaf': [1, 2, 4]},
+    'Random Forest': {'n_estimators': [100, 300], 'max_depth': [None, 8, 12], 'min_samples_leaf': [1, 2]},
+    'ANN': {'hidden_layer_sizes': [(50,), (100,), (100, 50)], 'alpha': [1e-4, 1e-3, 1e-2]},
+    'stacking_classifier': {'passthrough': [False, True]},
+    'voting_classifier': {'weights': [None, [1, 1, 1, 2], [1, 2, 1, 1]]},
+}
+
+# Score used to rank candidates (macro F1, since the three classes are imbalanced)
+SEARCH_METRIC = 'f1_macro'
+
+# Folds a candidate is scored on before it can be dropped, and how far (in mean
+# SEARCH_METRIC) behind its family's best candidate it has to be to be dropped
+MIN_FOLDS_BEFORE_PRUNING = 2
+PRUNE_MARGIN = 0.05
+
+
+def grid_candidates(family, feature_sets):
+    """Every parameter combination of a family's grid, on every feature set"""
+    grid = PARAM_GRIDS[family]
+    names = sorted(grid)
+    return [
+        {'family': family, 'feature_set': feature_set, 'params': dict(zip(names, values)),
+         'scores': [], 'accuracy': [], 'fit_seconds': 0.0, 'pruned_after': None}
+        for feature_set in feature_sets
+        for values in itertools.product(*(grid[name] for name in names))
+    ]
+
+
+def build_folds(path=DATASET_PATH, n_folds=5):
+    """Per fold: training rows scaled, SMOTE-balanced and with the fold's own k-best mask,
+    and validation rows scaled by the fold's scaler (never resampled)"""
+    _, X_train, _, y_train, _, _ = split_dataset(path)
+    folds = []
+    splitter = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=RANDOM_STATE)
+    for train_index, val_index in splitter.split(X_train, y_train):
+        scaler, k_best, X_fold, y_fold = fit_preprocessing(X_train.iloc[train_index], y_train[train_index])
+        folds.append({
+            'X_train': X_fold,
+            'y_train': y_fold,
+            'X_val': scaler.transform(X_train.iloc[val_index]),
+            'y_val': y_train[val_index],
+            'support': k_best.get_support(),
+        })
+    return folds
+
+
+def cached_folds(path=DATASET_PATH, n_folds=5, cache_dir=CACHE_DIR, use_cache=True):
+    """build_folds() through the on-disk cache; returns (cache file, whether it was a hit)"""
+    cache_path = os.path.join(cache_dir, f"folds-{preprocess_key(path, n_folds)}.pkl")
+    if use_cache and os.path.exists(cache_path):
+        return cache_path, True
+    os.makedirs(cache_dir, exist_ok=True)
+    save_artifact(build_folds(path, n_folds), cache_path)
+    return cache_path, False
+
+
+# Fold matrices already loaded by this (worker) process, by cache file
+_folds = {}
+
+
+def score_fold(folds_path, family, feature_set, params, fold):
+    """Worker entry point: fit one candidate on one fold and score it on the fold's validation rows"""
+    started_at = time.time()
+    folds = _folds.get(folds_path)
+    if folds is None:
+        with open(folds_path, 'rb') as f:
+            folds = _folds[folds_path] = pickle.load(f)
+    data = folds[fold]
+    X_train, X_val = data['X_train'], data['X_val']
+    if feature_set == 'k_best':
+        X_train, X_val = X_train[:, data['support']], X_val[:, data['support']]
+
+    start = time.perf_counter()
+    with warnings.catch_warnings():
+        # The grid includes networks that stop at max_iter; their score says what that costs
+        warnings.simplefilter('ignore', ConvergenceWarning)
+        model = make_estimator(family, params)
+        model.fit(X_train, data['y_train'])
+    fit_seconds = time.perf_counter() - start
+
+    y_pred = model.predict(X_val)
+    return {
+        'f1_macro': float(f1_score(data['y_val'], y_pred, average='macro')),
+        'accuracy': float(accuracy_score(data['y_val'], y_pred)),
+        'fit_seconds': fit_seconds,
+        'started_at': started_at,
+        'finished_at': time.time(),
+    }
+
+
+def prune(candidates, folds_done):
+    """Drop candidates whose mean so far is more than PRUNE_MARGIN behind their family's best"""
+    if folds_done < MIN_FOLDS_BEFORE_PRUNING:
+        return 0
+    best = {}
+    for candidate in candidates:
+        if candidate['pruned_after'] is None:
+            mean = np.mean(candidate['scores'])
+            best[candidate['family']] = max(best.get(candidate['family'], mean), mean)
+    pruned = 0
+    for candidate in candidates:
+        if candidate['pruned_after'] is None and np.mean(candidate['scores']) < best[candidate['family']] - PRUNE_MARGIN:
+            candidate['pruned_after'] = folds_done
+            pruned += 1
+    return pruned
+
+
+def search(families=None, feature_sets=None, jobs=None, n_folds=5, dataset=DATASET_PATH, runs_dir=RUNS_DIR,
+           cache_dir=CACHE_DIR, use_cache=True):
+    """Run the search and write a report next to the training runs; returns the report"""
+    families = [family for family in MODEL_FAMILIES if family in (families or MODEL_FAMILIES)]
+    feature_sets = feature_sets or FEATURE_SETS
+    jobs = jobs or os.cpu_count() or 1
+    search_start = time.perf_counter()
+
+    start = time.perf_counter()
+    folds_path, folds_cached = cached_folds(dataset, n_folds, cache_dir, use_cache)
+    print(f"{n_folds} folds {'loaded from cache' if folds_cached else 'built'} in {time.perf_counter() - start:.2f} s")
+
+    candidates = [candidate for family in families for candidate in grid_candidates(family, feature_sets)]
+    # Span from each family's first fit starting to its last one finishing (wall clock,
+    # as the fits run in other processes)
+    family_start, family_end = {}, {}
+    executor = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    try:
+        for fold in range(n_folds):
+            # Families are listed slowest first, so their fits are queued first
+            active = [candidate for candidate in candidates if candidate['pruned_after'] is None]
+            args = [(folds_path, c['family'], c['feature_set'], c['params'], fold) for c in active]
+            if executor is None:
+                results = [(candidate, score_fold(*task)) for candidate, task in zip(active, args)]
+            else:
+                futures = {executor.submit(score_fold, *task): candidate for candidate, task in zip(active, args)}
+                results = ((futures[future], future.result()) for future in as_completed(futures))
+
+            for candidate, result in results:
+                candidate['scores'].append(result[SEARCH_METRIC])
+                candidate['accuracy'].append(result['accuracy'])
+                candidate['fit_seconds'] += result['fit_seconds']
+                family = candidate['family']
+                family_start[family] = min(family_start.get(family, result['started_at']), result['started_at'])
+                family_end[family] = max(family_end.get(family, result['finished_at']), result['finished_at'])
+
+            pruned = prune(candidates, fold + 1)
+            print(f"  fold {fold + 1}/{n_folds}: {len(active)} fits, {pruned} candidates dropped")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    report = {
+        'created_at': time.time(),
+        'metric': SEARCH_METRIC,
+        'folds': n_folds,
+        'folds_cached': folds_cached,
+        'jobs': jobs,
+        'families': {},
+        'wall_seconds': None,
+    }
+    print(f"{'family':<20} {'best ' + SEARCH_METRIC:>14} {'std':>6} {'candidates':>10} {'dropped':>8} "
+          f"{'fits':>5} {'wall s':>7} {'cpu s':>7}  best parameters")
+    for family in families:
+        family_candidates = [candidate for candidate in candidates if candidate['family'] == family]
+        finished = [candidate for candidate in family_candidates if candidate['pruned_after'] is None]
+        best = max(finished, key=lambda candidate: np.mean(candidate['scores']))
+        entry = {
+            'best_params': {name: repr(value) for name, value in best['params'].items()},
+            'best_feature_set': best['feature_set'],
+            'best_score': round(float(np.mean(best['scores'])), 4),
+            'best_score_std': round(float(np.std(best['scores'])), 4),
+            'best_accuracy': round(float(np.mean(best['accuracy'])), 4),
+            'candidates': len(family_candidates),
+            'dropped': len(family_candidates) - len(finished),
+            'fits': sum(len(candidate['scores']) for candidate in family_candidates),
+            'wall_seconds': round(family_end[family] - family_start[family], 3),
+            'cpu_seconds': round(sum(candidate['fit_seconds'] for candidate in family_candidates), 3),
+            'results': sorted(
+                [{'feature_set': c['feature_set'], 'params': {n: repr(v) for n, v in c['params'].items()},
+                  'mean': round(float(np.mean(c['scores'])), 4), 'folds_scored': len(c['scores'])}
+                 for c in family_candidates],
+                key=lambda result: -result['mean'])
+        }
+        report['families'][family] = entry
+        print(f"{family:<20} {entry['best_score']:>14.4f} {entry['best_score_std']:>6.3f} {entry['candidates']:>10} "
+              f"{entry['dropped']:>8} {entry['fits']:>5} {entry['wall_seconds']:>7.2f} {entry['cpu_seconds']:>7.2f}  "
+              f"{best['feature_set']} {best['params']}")
+
+    report['wall_seconds'] = round(time.perf_counter() - search_start, 3)
+    os.makedirs(runs_dir, exist_ok=True)
+    report_path = os.path.join(runs_dir, f"search-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Search finished in {report['wall_seconds']:.2f} s, report at {report_path}")
+    return report
@@ -0,0 +1,287 @@
+# Batched Ingestion into sleep_monitoring and sleep_classification
+# Rows are buffered and written with executemany in bounded batches, one transaction
+# (and one commit) per flush, instead of an execute and a commit per row. A flush
+# happens when the buffer reaches the batch size, when the oldest buffered row is
+# older than the flush interval, and on shutdown. Classification rows queued with a
+# new monitoring row get its id from the insert itself, with no lookup query.
+# Classifications posted on their own are acknowledged before they are written, so a
+# failed flush puts them back in the buffer; after INGEST_MAX_ATTEMPTS failed flushes
+# they are dropped, counted and logged.
+
+from flask import request, jsonify
+import atexit
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from signal_storage import monitoring_values, MONITORING_INSERT
+from signal_synthesis import MAX_SAMPLE_RATE
+
+# Rows per executemany statement
+INGEST_BATCH_SIZE = 1000
+
+# Encoded signal bytes per statement, kept well under MySQL's max_allowed_packet (64MB)
+INGEST_BATCH_BYTES = 16 * 1024 * 1024
+
+# Seconds a row may wait in the buffer before a flush
+INGEST_FLUSH_SECONDS = 1.0
+
+# Flushes an acknowledged classification row may fail before it is dropped
+INGEST_MAX_ATTEMPTS = 5
+
+CLASSIFICATION_INSERT = ("INSERT INTO sleep_classification (monitoring_id, classification_result, confidence_score) "
+                         "VALUES (%s, %s, %s)")
+
+
+def _batches(rows, size, max_bytes):
+    """Split rows into runs of at most `size` rows and about `max_bytes` bytes of blobs"""
+    batch, batch_bytes = [], 0
+    for row in rows:
+        row_bytes = sum(len(value) for value in row if isinstance(value, (bytes, bytearray)))
+        if batch and (len(batch) >= size or batch_bytes + row_bytes > max_bytes):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(row)
+        batch_bytes += row_bytes
+    if batch:
+        yield batch
+
+
+class IngestionWriter:
+    """Buffers monitoring and classification rows and writes them in batches"""
+
+    def __init__(self, pool, batch_size=INGEST_BATCH_SIZE, flush_interval=INGEST_FLUSH_SECONDS,
+                 batch_bytes=INGEST_BATCH_BYTES, max_attempts=INGEST_MAX_ATTEMPTS):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.batch_bytes = batch_bytes
+        self.max_attempts = max_attempts
+        self._monitoring = []       # (values, classifications, future)
+        self._classifications = []  # (monitoring_id, result, confidence, failed attempts)
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()   # Keeps batches in order
+        self._consecutive_ids = None
+        self._closed = threading.Event()
+        self._thread = None
+
+        # Metrics
+        self.monitoring_rows = 0
+        self.classification_rows = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.retried_classification_rows = 0
+        self.dropped_classification_rows = 0
+        self.flush_seconds = 0.0
+
+    def start(self):
+        """Start the timer thread and flush whatever is left at interpreter exit"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='ingestion-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+        return self
+
+    def _run(self):
+        while not self._closed.wait(self.flush_interval / 4):
+            with self._lock:
+                due = self._oldest is not None and time.monotonic() - self._oldest >= self.flush_interval
+            if due:
+                self._try_flush()
+
+    def _try_flush(self):
+        """Flush and log a failure instead of raising it. Monitoring rows report it
+        through their futures and classifications stay buffered for another attempt."""
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Error flushing ingestion batch: {e}")
+
+    def _added(self):
+        """Note a new row (lock held); True once a full batch is waiting"""
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        return len(self._monitoring) + len(self._classifications) >= self.batch_size
+
+    def add_monitoring(self, values, classifications=()):
+        """Queue a sleep_monitoring row (MONITORING_INSERT values, see monitoring_values)
+        and any (result, confidence) classifications of it.
+
+        Returns a Future that resolves to the new monitoring id once the row is written."""
+        future = Future()
+        with self._lock:
+            self._monitoring.append((tuple(values), list(classifications), future))
+            full = self._added()
+        if full:
+            self._try_flush()
+        return future
+
+    def add_classification(self, monitoring_id, result, confidence):
+        """Queue a classification of an already stored monitoring row"""
+        with self._lock:
+            self._classifications.append((monitoring_id, result, confidence, 0))
+            full = self._added()
+        if full:
+            self._try_flush()
+
+    def _uses_consecutive_ids(self, cursor):
+        """Whether a multi-row INSERT's ids are one consecutive run starting at lastrowid.
+
+        True for SQLite and for InnoDB's traditional/consecutive lock modes; with
+        innodb_autoinc_lock_mode=2 monitoring rows are inserted one at a time instead."""
+        if self._consecutive_ids is None:
+            if self.pool.paramstyle == 'qmark':
+                self._consecutive_ids = True
+            else:
+                cursor.execute("SELECT @@innodb_autoinc_lock_mode")
+                self._consecutive_ids = int(cursor.fetchall()[0][0]) < 2
+        return self._consecutive_ids
+
+    def _insert_monitoring(self, cursor, rows):
+        """Insert monitoring rows and return their ids in order"""
+        if not self._uses_consecutive_ids(cursor):
+            ids = []
+            for row in rows:
+                self.pool.executemany(MONITORING_INSERT, [row], cursor)
+                ids.append(cursor.lastrowid)
+            return ids
+
+        self.pool.executemany(MONITORING_INSERT, rows, cursor)
+        if self.pool.paramstyle == 'qmark':
+            # SQLite reports the last id of the statement
+            cursor.execute("SELECT last_insert_rowid()")
+            first = cursor.fetchall()[0][0] - len(rows) + 1
+        else:
+            # MySQL reports the first id of a multi-row INSERT
+            first = cursor.lastrowid
+        return list(range(first, first + len(rows)))
+
+    def flush(self):
+        """Write everything buffered so far in one transaction"""
+        with self._flush_lock:
+            with self._lock:
+                monitoring, self._monitoring = self._monitoring, []
+                classifications, self._classifications = self._classifications, []
+                self._oldest = None
+            if not monitoring and not classifications:
+                return
+
+            start = time.perf_counter()
+            try:
+                with self.pool.cursor(commit=True) as cursor:
+                    ids = []
+                    for batch in _batches([values for values, _, _ in monitoring], self.batch_size,
+                                          self.batch_bytes):
+                        ids.extend(self._insert_monitoring(cursor, batch))
+
+                    # Link the new rows' classifications by the ids the inserts returned
+                    linked = [(monitoring_id, result, confidence)
+                              for monitoring_id, (_, pending, _) in zip(ids, monitoring)
+                              for result, confidence in pending]
+                    rows = linked + [row[:3] for row in classifications]
+                    for batch in _batches(rows, self.batch_size, self.batch_bytes):
+                        self.pool.executemany(CLASSIFICATION_INSERT, batch, cursor)
+            except Exception as e:
+                self._requeue(classifications, e)
+                for _, _, future in monitoring:
+                    future.set_exception(e)
+                raise
+
+            with self._lock:
+                self.flushes += 1
+                self.monitoring_rows += len(monitoring)
+                self.classification_rows += len(linked) + len(classifications)
+                self.flush_seconds += time.perf_counter() - start
+            for monitoring_id, (_, _, future) in zip(ids, monitoring):
+                future.set_result(monitoring_id)
+
+    def _requeue(self, classifications, error):
+        """Put classifications from a failed flush back at the front of the buffer,
+        dropping the ones that have failed max_attempts times"""
+        retry = [row[:3] + (row[3] + 1,) for row in classifications if row[3] + 1 < self.max_attempts]
+        dropped = len(classifications) - len(retry)
+        with self._lock:
+            self.failed_flushes += 1
+            self.retried_classification_rows += len(retry)
+            self.dropped_classification_rows += dropped
+            self._classifications[:0] = retry
+            if retry and self._oldest is None:
+                self._oldest = time.monotonic()
+        if dropped:
+            print(f"Dropped {dropped} classification rows after {self.max_attempts} failed flushes: {error}")
+
+    def close(self):
+        """Stop the timer thread and write what is left"""
+        self._closed.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            rows = self.monitoring_rows + self.classification_rows
+            return {
+                'pending': len(self._monitoring) + len(self._classifications),
+                'monitoring_rows': self.monitoring_rows,
+                'classification_rows': self.classification_rows,
+                'flushes': self.flushes,
+                'failed_flushes': self.failed_flushes,
+                'retried_classification_rows': self.retried_classification_rows,
+                'dropped_classification_rows': self.dropped_classification_rows,
+                'rows_per_flush': round(rows / self.flushes, 1) if self.flushes else 0.0,
+                'rows_per_second_writing': round(rows / self.flush_seconds) if self.flush_seconds else 0
+            }
+
+
+def add_ingestion_routes(app, writer):
+    """Add monitoring ingestion routes to the Flask app"""
+
+    @app.route('/api/monitoring', methods=['POST'])
+    def ingest_monitoring():
+        """Store a recording: JSON with user_id, eeg, fs, beat_times, rr_ms, optional
+        sleep_position, respiratory_pattern and classifications [{result, confidence}]"""
+        data = request.get_json(silent=True) or {}
+        try:
+            fs = float(data['fs'])
+            start = float(data.get('start', 0))
+            # Written so NaN fails the check too
+            if not (fs > 0 and fs <= MAX_SAMPLE_RATE):
+                raise ValueError(f"fs must be above 0 and at most {MAX_SAMPLE_RATE}")
+            if not np.isfinite(start):
+                raise ValueError("start must be a finite number")
+            values = monitoring_values(
+                data.get('user_id'), data['eeg'], fs, data['beat_times'], data['rr_ms'],
+                data.get('sleep_position'), data.get('respiratory_pattern'), start
+            )
+            classifications = [(c['result'], float(c['confidence'])) for c in data.get('classifications', [])]
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({'error': f"Invalid recording: {e}"}), 400
+
+        future = writer.add_monitoring(values, classifications)
+        try:
+            # Written with whatever else arrives within the flush interval
+            monitoring_id = future.result(timeout=writer.flush_interval + 10)
+        except Exception as e:
+            return jsonify({'error': f"Could not store the recording: {e}"}), 503
+        return jsonify({'id': monitoring_id}), 201
+
+    @app.route('/api/monitoring/classifications', methods=['POST'])
+    def ingest_classifications():
+        """Queue classifications of stored recordings: JSON [{monitoring_id, result, confidence}]"""
+        rows = request.get_json(silent=True)
+        # Validate every row before queueing any, so a 400 leaves nothing behind to be
+        # written twice when the client retries
+        try:
+            rows = [(int(row['monitoring_id']), row['result'], float(row['confidence'])) for row in rows]
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({'error': f"Invalid classification: {e}"}), 400
+        for row in rows:
+            writer.add_classification(*row)
+        return jsonify({'queued': len(rows)}), 202
+
+    @app.route('/api/monitoring/ingestion', methods=['GET'])
+    def ingestion_stats():
+        return jsonify(writer.stats())
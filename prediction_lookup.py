@@ -0,0 +1,470 @@
+# Precomputed Lookup Tables for /prediction
+# Every /prediction input is a small integer, a sleep duration in tenths of an hour or
+# a dropdown label, so the whole model + rules pipeline can be scored offline and a
+# request answered with two array lookups. One table over the whole input space would
+# be far too large (about 2e11 cells), but the pipeline factors into two small ones:
+#
+#   model table   The tree only compares each selected feature with its split
+#                 thresholds, so each input axis is cut into the buckets between
+#                 thresholds (computed from the exact float32 scaled value of every
+#                 grid point). One cell per bucket combination holds the id of the
+#                 leaf's probability row.
+#   rules table   The rules only compare inputs with the constants in
+#                 prediction_rules.RULE_CUT_POINTS and the health score with its
+#                 threshold, so the axes are probability row x one bucket per cut
+#                 point (and per gap between them) x BMI label x health score bit.
+#                 One cell per combination holds the refined class code; probability
+#                 rows the rules treat alike share one slab of the table.
+#
+# Cells are addressed by mixed-radix encoding of the bucket numbers. The tables are
+# written to Models/lookup/ as .npy files and memory-mapped by the app; the ECE
+# probabilities depend only on the probability row and the class code, so they are
+# stored per (row id, code). Values off the grid (fractional ages, unknown labels,
+# out-of-range readings) are scored by the model as before. A build is tied to the
+# serving model version and to prediction_rules.py, and is only written once the
+# tables agree exactly with the model + rules path on the dataset and random grid points.
+#
+# Usage: python prediction_lookup.py   (or python train_model.py --lookup)
+
+import json
+import os
+import threading
+import time
+import numpy as np
+from flask import jsonify
+
+import prediction_rules
+from prediction_rules import (apply_rules, apply_rules_scalar, ece_probabilities, calculate_health_score_scalar,
+                              RULE_CUT_POINTS, HEALTH_SCORE_THRESHOLD, DISORDER_LABELS, PROBABILITY_NAMES)
+from model_registry import registry, file_checksum, FEATURE_COLUMNS
+from feature_vocabulary import CATEGORICAL_COLUMNS
+
+LOOKUP_DIR = os.path.join('Models', 'lookup')
+
+# (first, last, step) of the values each numeric input takes on the grid: the form's
+# integer fields, and sleep duration in tenths of an hour
+LOOKUP_GRID = {
+    'Age': (0, 120, 1),
+    'Sleep Duration': (0.0, 24.0, 0.1),
+    'Quality of Sleep': (0, 10, 1),
+    'Physical Activity Level': (0, 100, 1),
+    'Stress Level': (0, 10, 1),
+    'Blood Pressure': (50, 250, 1),
+    'Heart Rate': (30, 220, 1),
+    'Daily Steps': (0, 50000, 1),
+}
+
+# Inputs the rules look at, in apply_rules argument order
+RULE_COLUMNS = ['Sleep Duration', 'Quality of Sleep', 'Physical Activity Level', 'Stress Level',
+                'BMI Category', 'Heart Rate', 'Daily Steps']
+
+# Largest table a build will write, in cells (one byte each)
+MAX_TABLE_CELLS = 50_000_000
+
+# Random grid points checked against the model + rules before a build is saved
+# (all of them through the vectorized path, the first few through the scalar one)
+VERIFY_SAMPLES = 200_000
+VERIFY_SCALAR_SAMPLES = 5_000
+
+# How often the app checks LOOKUP_DIR for rebuilt tables
+RELOAD_CHECK_SECONDS = 5.0
+
+
+def grid_values(column, vocabulary):
+    """Values one input takes on the grid (labels for categorical inputs, in code order)"""
+    if column in CATEGORICAL_COLUMNS:
+        codes = vocabulary.codes[column]
+        return sorted(codes, key=codes.get)
+    first, last, step = LOOKUP_GRID[column]
+    return [round(first + i * step, 6) for i in range(int(round((last - first) / step)) + 1)]
+
+
+def dense_buckets(keys):
+    """Number the distinct keys 0..k-1 in sorted order; returns (bucket per value, k)"""
+    distinct, buckets = np.unique(keys, return_inverse=True)
+    return buckets.reshape(-1).astype(np.intp), len(distinct)
+
+
+def split_keys(compiled, j, values):
+    """Which gap between the trees' thresholds on selected feature j each raw value falls in"""
+    internal = compiled.left != np.arange(compiled.n_nodes)
+    thresholds = np.unique(compiled.threshold[internal & (compiled.feature == j)])
+    # Same float64 scaling and float32 cast as the compiled walk
+    scaled = ((np.asarray(values, dtype=np.float64) - compiled.mean[j]) / compiled.scale[j]).astype(np.float32)
+    # x <= threshold goes left, so the gap is the number of thresholds strictly below x
+    return np.searchsorted(thresholds, scaled, side='left')
+
+
+def cut_keys(values, cut_points):
+    """Gap or cut point of each value: 2i for below cut i, 2i + 1 for equal to it"""
+    values = np.asarray(values, dtype=np.float64)
+    cuts = np.asarray(cut_points, dtype=np.float64)
+    below = np.searchsorted(cuts, values, side='left')
+    equal = (below < len(cuts)) & (cuts[np.minimum(below, len(cuts) - 1)] == values)
+    return 2 * below + equal
+
+
+def first_of_each(buckets):
+    """Grid position of the first value in each bucket (buckets are numbered 0..k-1)"""
+    return np.unique(buckets, return_index=True)[1]
+
+
+def mixed_radix(radices):
+    """Bucket numbers of every cell (cells, axes), last axis varying fastest"""
+    return np.indices(radices).reshape(len(radices), -1).T
+
+
+def strides(radices):
+    """Cell offset per bucket step on each axis"""
+    return [int(np.prod(radices[i + 1:], dtype=np.int64)) for i in range(len(radices))]
+
+
+def check_size(name, radices):
+    cells = int(np.prod(radices, dtype=np.int64))
+    if cells > MAX_TABLE_CELLS:
+        raise ValueError(f"{name} table would have {cells} cells (limit {MAX_TABLE_CELLS}); radices {radices}")
+    return cells
+
+
+def jsonable(probabilities):
+    """ECE dict with plain Python numbers (ints stay ints, so pages render the same)"""
+    return {name: value if isinstance(value, int) else float(value) for name, value in probabilities.items()}
+
+
+class LookupTables:
+    """Model and rules tables for one serving version, with the bucket of every grid value"""
+
+    def __init__(self, meta, axes, model_table, rules_table):
+        self.meta = meta
+        self.version = meta['version']
+        self.rules_sha256 = meta['rules_sha256']
+        self.axes = axes                    # {'grid/<col>', 'model/<col>', 'rules/<col>', 'probas', 'slabs'} arrays
+        self.model_table = model_table      # Probability row id per model cell
+        self.rules_table = rules_table      # Class code per rules cell
+        self.probas = axes['probas']
+        self.ece = meta['ece']              # [row id][class code] -> ECE probabilities dict
+
+        # Per input: grid value -> what it adds to the model and rules cell indexes
+        # (bucket x stride). Numeric keys match ints and floats of the same value, and
+        # anything off the grid (fractions, NaN, out of range, unknown labels) misses.
+        model_strides = dict(zip(meta['model_columns'], strides(meta['model_radices'])))
+        rules_strides = dict(zip(meta['rules_columns'], strides(meta['rules_radices'])))
+        self._slab_offsets = (axes['slabs'].astype(np.int64) * rules_strides.pop('rules slab')).tolist()
+        self._health_stride = rules_strides.pop('health score')
+        self._offsets = []
+        for col in FEATURE_COLUMNS:
+            grid = axes[f'grid/{col}'].tolist()
+            model = rules = np.zeros(len(grid), dtype=np.int64)
+            if col in model_strides:
+                model = axes[f'model/{col}'].astype(np.int64) * model_strides[col]
+            if col in rules_strides:
+                rules = axes[f'rules/{col}'].astype(np.int64) * rules_strides[col]
+            self._offsets.append(dict(zip(grid, zip(model.tolist(), rules.tolist()))))
+
+    @property
+    def nbytes(self):
+        return int(self.model_table.nbytes + self.rules_table.nbytes)
+
+    def lookup(self, values):
+        """(class code, ECE probabilities) for the 11 raw inputs in FEATURE_COLUMNS order,
+        or None if any of them is off the grid"""
+        model_index = rules_index = 0
+        for value, offsets in zip(values, self._offsets):
+            offset = offsets.get(value)
+            if offset is None:
+                return None
+            model_index += offset[0]
+            rules_index += offset[1]
+
+        healthy = calculate_health_score_scalar(values[3], values[4], values[5], values[6]) > HEALTH_SCORE_THRESHOLD
+        row = int(self.model_table[model_index])
+        code = int(self.rules_table[self._slab_offsets[row] + rules_index + healthy * self._health_stride])
+        return code, dict(self.ece[row][code])
+
+    def save(self, directory=LOOKUP_DIR):
+        """Write the tables, replacing a previous build (metadata last, so readers see a whole build)"""
+        os.makedirs(directory, exist_ok=True)
+        for name, array in [('model_table', self.model_table), ('rules_table', self.rules_table)]:
+            tmp_path = os.path.join(directory, f'{name}.tmp.npy')
+            np.save(tmp_path, np.asarray(array))
+            os.replace(tmp_path, os.path.join(directory, f'{name}.npy'))
+        tmp_path = os.path.join(directory, 'axes.tmp.npz')
+        np.savez(tmp_path, **{name.replace('/', '__'): array for name, array in self.axes.items()})
+        os.replace(tmp_path, os.path.join(directory, 'axes.npz'))
+        tmp_path = os.path.join(directory, 'lookup.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, os.path.join(directory, 'lookup.json'))
+
+    @classmethod
+    def load(cls, directory=LOOKUP_DIR):
+        """Read a build, memory-mapping both tables"""
+        with open(os.path.join(directory, 'lookup.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        with np.load(os.path.join(directory, 'axes.npz'), allow_pickle=False) as data:
+            axes = {name.replace('__', '/'): data[name] for name in data.files}
+        model_table = np.load(os.path.join(directory, 'model_table.npy'), mmap_mode='r')
+        rules_table = np.load(os.path.join(directory, 'rules_table.npy'), mmap_mode='r')
+        if model_table.size != int(np.prod(meta['model_radices'])) or \
+                rules_table.size != int(np.prod(meta['rules_radices'])):
+            raise ValueError(f"Lookup tables in {directory} don't match their metadata")
+        return cls(meta, axes, model_table, rules_table)
+
+
+def rules_checksum():
+    """Fingerprint of the rules the tables were built from"""
+    return file_checksum(prediction_rules.__file__)
+
+
+def build_tables(bundle):
+    """Score the whole grid with the bundle's compiled model and the rules"""
+    compiled = bundle.compiled
+    if compiled is None:
+        raise ValueError(f"Lookup tables need a tree model; {type(bundle.model).__name__} isn't compiled")
+    vocabulary = bundle.vocabulary
+    grids = {col: grid_values(col, vocabulary) for col in FEATURE_COLUMNS}
+    # Raw (encoded) value of every grid point, as the encoder writes it
+    raw = {col: np.array([vocabulary.encode(col, v) for v in grids[col]] if col in CATEGORICAL_COLUMNS
+                         else grids[col], dtype=np.float64) for col in FEATURE_COLUMNS}
+    axes = {f'grid/{col}': np.array(grids[col]) for col in FEATURE_COLUMNS}
+
+    # Model table: one axis per selected input, bucketed by the split thresholds
+    model_columns = [FEATURE_COLUMNS[c] for c in compiled.columns]
+    model_radices, model_first = [], []
+    for j, col in enumerate(model_columns):
+        buckets, count = dense_buckets(split_keys(compiled, j, raw[col]))
+        axes[f'model/{col}'] = buckets.astype(np.uint16)
+        model_radices.append(count)
+        model_first.append(first_of_each(buckets))
+    check_size('Model', model_radices)
+
+    cells = mixed_radix(model_radices)
+    X = np.tile(np.array([raw[col][0] for col in FEATURE_COLUMNS]), (len(cells), 1))
+    for axis, col in enumerate(model_columns):
+        X[:, FEATURE_COLUMNS.index(col)] = raw[col][model_first[axis][cells[:, axis]]]
+    probas, row_ids = np.unique(compiled.predict_proba(X), axis=0, return_inverse=True)
+    del X, cells
+    model_table = row_ids.reshape(-1).astype(np.uint8 if len(probas) <= 256 else np.uint16)
+    axes['probas'] = probas
+
+    # Rules table: probability row x rule input buckets x health score bit
+    rules_columns, rules_radices, rules_first = ['rules slab'], [len(probas)], [None]
+    for col in RULE_COLUMNS:
+        if col in CATEGORICAL_COLUMNS:
+            buckets, count = np.arange(len(grids[col])), len(grids[col])
+        else:
+            buckets, count = dense_buckets(cut_keys(grids[col], RULE_CUT_POINTS[col]))
+        axes[f'rules/{col}'] = buckets.astype(np.uint16)
+        rules_columns.append(col)
+        rules_radices.append(count)
+        rules_first.append(first_of_each(buckets))
+    rules_columns.append('health score')
+    rules_radices.append(2)
+    check_size('Rules', rules_radices)
+
+    # One probability row at a time, over every combination of the other axes
+    cells = mixed_radix(rules_radices[1:])
+    inputs = []
+    for axis, col in enumerate(RULE_COLUMNS):
+        values = np.array(grids[col], dtype=object if col in CATEGORICAL_COLUMNS else np.float64)
+        inputs.append(values[rules_first[axis + 1][cells[:, axis]]])
+    # The health score only matters against its threshold, so the last axis stands in for it
+    health_score = np.where(cells[:, -1] == 1, 1.0, 0.0)
+    rules_table = np.empty((len(probas), len(cells)), dtype=np.uint8)
+    for row, proba in enumerate(probas):
+        codes, _ = apply_rules(*inputs, np.broadcast_to(proba, (len(cells), len(proba))), health_score=health_score)
+        rules_table[row] = codes
+    # Rows with the same argmax and confidence band give identical slabs; keep one of each
+    rules_table, slabs = np.unique(rules_table, axis=0, return_inverse=True)
+    axes['slabs'] = slabs.reshape(-1).astype(np.uint16)
+    rules_radices[0] = len(rules_table)
+    rules_table = rules_table.reshape(-1)
+
+    meta = {
+        'version': bundle.version,
+        'rules_sha256': rules_checksum(),
+        'built_at': time.time(),
+        'grid': {col: list(LOOKUP_GRID[col]) for col in LOOKUP_GRID},
+        'model_columns': model_columns,
+        'model_radices': model_radices,
+        'rules_columns': rules_columns,
+        'rules_radices': rules_radices,
+        'ece': [[jsonable(ece_probabilities(code, row)) for code in sorted(DISORDER_LABELS)] for row in probas],
+    }
+    # Round-trip the metadata now so the tables verified are the tables that get loaded
+    return LookupTables(json.loads(json.dumps(meta)), axes, model_table, rules_table)
+
+
+def direct_prediction(bundle, values):
+    """The /prediction path without tables: encoder, model and scalar rules"""
+    proba = bundle.predict_proba_row(bundle.encoder.transform_row(bundle.encoder.encode(*values)))
+    return apply_rules_scalar(values[3], values[4], values[5], values[6], values[7], values[9], values[10], proba)
+
+
+def sample_records(tables, n, seed):
+    """n random grid points as raw input tuples (in FEATURE_COLUMNS order)"""
+    rng = np.random.default_rng(seed)
+    columns = []
+    for col in FEATURE_COLUMNS:
+        grid = tables.axes[f'grid/{col}'].tolist()
+        columns.append([grid[i] for i in rng.integers(0, len(grid), n)])
+    return list(zip(*columns))
+
+
+def dataset_records(csv_path='Dataset/Sleep_health_and_lifestyle_dataset.csv'):
+    """Every dataset row as raw /prediction inputs (Blood Pressure is the systolic reading)"""
+    import pandas as pd
+    df = pd.read_csv(csv_path)
+    df['Blood Pressure'] = df['Blood Pressure'].str.split('/').str[0].astype(int)
+    return [tuple(value.item() if hasattr(value, 'item') else value for value in row)
+            for row in df[FEATURE_COLUMNS].itertuples(index=False)]
+
+
+def verify_tables(tables, bundle, seed=42):
+    """Raise ValueError unless the tables give exactly the model + rules answer on the
+    dataset and on random grid points; returns the number of records checked"""
+    records = dataset_records()
+    n_scalar = len(records) + VERIFY_SCALAR_SAMPLES
+    records += sample_records(tables, VERIFY_SAMPLES, seed)
+    results = [tables.lookup(record) for record in records]
+    missed = sum(result is None for result in results)
+    if missed:
+        raise ValueError(f"{missed} grid records weren't found in the lookup tables")
+
+    # Everything through the vectorized model + rules; the dataset and the first samples
+    # through /prediction's own scalar path too
+    X = np.array([[bundle.vocabulary.encode(col, v) if col in CATEGORICAL_COLUMNS else v
+                   for col, v in zip(FEATURE_COLUMNS, record)] for record in records], dtype=np.float64)
+    columns = list(zip(*records))
+    codes, probabilities = apply_rules(*(columns[FEATURE_COLUMNS.index(col)] for col in RULE_COLUMNS),
+                                       bundle.predict_proba(X))
+    for i, (record, (code, ece)) in enumerate(zip(records, results)):
+        expected = [probabilities[i][j] for j in range(len(PROBABILITY_NAMES))]
+        if code != codes[i] or [ece[name] for name in PROBABILITY_NAMES] != expected:
+            raise ValueError(f"Lookup disagrees with the model + rules on {dict(zip(FEATURE_COLUMNS, record))}")
+        if i < n_scalar and (code, ece) != direct_prediction(bundle, record):
+            raise ValueError(f"Lookup disagrees with /prediction on {dict(zip(FEATURE_COLUMNS, record))}")
+    return len(records)
+
+
+def build_lookup(bundle=None, directory=LOOKUP_DIR):
+    """Build, verify and save the tables for a serving bundle (the active one by default)"""
+    bundle = bundle or registry.active()
+    start = time.perf_counter()
+    tables = build_tables(bundle)
+    built = time.perf_counter() - start
+    checked = verify_tables(tables, bundle)
+    tables.save(directory)
+    print(f"Lookup tables for model version {bundle.version}: model {tables.meta['model_radices']} "
+          f"({tables.model_table.size} cells, {len(tables.probas)} probability rows), "
+          f"rules {tables.meta['rules_radices']} ({tables.rules_table.size} cells), {tables.nbytes / 1e6:.1f} MB; "
+          f"built in {built:.2f} s, {checked} records verified, written to {directory}")
+    return tables
+
+
+class PredictionLookup:
+    """Answers /prediction from the tables in LOOKUP_DIR while they match the active model
+    and rules, and counts how often it could"""
+
+    def __init__(self, directory=LOOKUP_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._tables = None
+        self._stamp = None
+        self._checked_at = None
+        self._status = 'not built'
+        self._rules_sha256 = None
+        self.hits = 0
+        self.off_grid = 0
+        self.unavailable = 0
+
+    def _refresh(self):
+        """Reload the tables if a build was written since the last check"""
+        path = os.path.join(self.directory, 'lookup.json')
+        try:
+            st = os.stat(path)
+            stamp = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            self._tables, self._stamp, self._status = None, None, 'not built'
+            return
+        if stamp == self._stamp:
+            return
+        self._stamp = stamp
+        try:
+            tables = LookupTables.load(self.directory)
+            if self._rules_sha256 is None:
+                self._rules_sha256 = rules_checksum()
+            if tables.rules_sha256 != self._rules_sha256:
+                self._tables, self._status = None, 'stale: prediction_rules.py changed since the build'
+                return
+            self._tables, self._status = tables, 'loaded'
+            print(f"Prediction lookup tables loaded for model version {tables.version} "
+                  f"({tables.nbytes / 1e6:.1f} MB)")
+        except Exception as e:
+            self._tables, self._status = None, f"error: {e}"
+            print(f"Error loading prediction lookup tables: {e}")
+
+    def _check(self):
+        """_refresh() at most every RELOAD_CHECK_SECONDS"""
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= RELOAD_CHECK_SECONDS:
+            with self._lock:
+                if self._checked_at is None or now - self._checked_at >= RELOAD_CHECK_SECONDS:
+                    self._refresh()
+                    self._checked_at = now
+
+    def tables(self, bundle):
+        """The loaded tables if they were built for this bundle, else None"""
+        self._check()
+        tables = self._tables
+        return tables if tables is not None and tables.version == bundle.version else None
+
+    def predict(self, bundle, values):
+        """(class code, ECE probabilities) from the tables, or None to fall back to the model"""
+        tables = self.tables(bundle)
+        result = tables.lookup(values) if tables is not None else None
+        with self._lock:
+            if result is not None:
+                self.hits += 1
+            elif tables is not None:
+                self.off_grid += 1
+            else:
+                self.unavailable += 1
+        return result
+
+    def stats(self):
+        """Hit rate and table details"""
+        self._check()
+        tables = self._tables
+        active = registry.active_info().get('version')
+        requests = self.hits + self.off_grid + self.unavailable
+        return {
+            'status': 'stale: built for another model version' if tables is not None and tables.version != active
+                      else self._status,
+            'version': tables.version if tables is not None else None,
+            'built_at': tables.meta['built_at'] if tables is not None else None,
+            'model_radices': tables.meta['model_radices'] if tables is not None else None,
+            'rules_radices': tables.meta['rules_radices'] if tables is not None else None,
+            'table_bytes': tables.nbytes if tables is not None else None,
+            'requests': requests,
+            'hits': self.hits,
+            'off_grid': self.off_grid,
+            'unavailable': self.unavailable,
+            'hit_rate': round(self.hits / requests, 4) if requests else None,
+        }
+
+
+# Shared lookup for the whole process
+prediction_lookup = PredictionLookup()
+
+
+def add_prediction_lookup_routes(app):
+    """Add prediction lookup table routes to the Flask app"""
+
+    @app.route('/api/predict/lookup', methods=['GET'])
+    def prediction_lookup_stats():
+        return jsonify(prediction_lookup.stats())
+
+
+if __name__ == '__main__':
+    build_lookup()
@@ -0,0 +1,239 @@
+# Rule-Based Post-Processing for Sleep Disorder Classification
+# Refines the model's prediction with the sleep-metric rules used by /prediction and
+# rescales the probabilities shown by the ECE monitor. The scalar version serves one
+# form submission; the vectorized version applies the same rules to whole batches.
+
+import numpy as np
+
+# Class codes used by the /prediction route
+DISORDER_LABELS = {0: 'No sleeping disorder', 1: 'Insomnia', 2: 'Sleep Apnea', 3: 'RLS'}
+
+# Order of the columns returned by apply_rules
+PROBABILITY_NAMES = ['normal', 'insomnia', 'apnea', 'rls']
+
+# Refined thresholds based on dataset patterns and confidence levels
+NO_DISORDER_THRESHOLD = 0.70  # Adjusted threshold for confirming no disorder based on dataset patterns
+DISORDER_THRESHOLD = 0.85     # Increased threshold for confirming disorders to reduce false positives
+UNCERTAIN_THRESHOLD = 0.65    # Adjusted threshold for uncertain predictions
+
+# Minimum probability given to the predicted class when rescaling for the ECE monitor
+PREDICTED_CLASS_MIN_PROBABILITY = 0.75
+
+# Health score above which moderate-confidence predictions are overruled to no disorder
+HEALTH_SCORE_THRESHOLD = 0.65
+
+# Every constant the rules compare each input against (the health score aside). The
+# lookup tables in prediction_lookup.py bucket inputs by these, so keep them in step
+# with the conditions below; the tables are rebuilt when this file changes.
+RULE_CUT_POINTS = {
+    'Sleep Duration': [5.5, 5.9, 6.0, 6.3, 6.5, 7.5],
+    'Quality of Sleep': [4, 5, 6, 7],
+    'Physical Activity Level': [30, 35, 40],
+    'Stress Level': [6, 7, 8],
+    'Heart Rate': [80, 82, 85],
+    'Daily Steps': [3000, 3500],
+}
+
+
+def apply_rules_scalar(sleep_duration, quality_of_sleep, physical_activity_level, stress_level,
+                       bmi_category, heart_rate, daily_steps, prediction_proba):
+    """Refine one prediction. Returns the class code and the ECE probabilities dict"""
+    max_prob_index = int(np.argmax(prediction_proba))
+    max_prob_value = prediction_proba[max_prob_index]
+
+    # Check for sleep apnea patterns with refined thresholds based on actual data
+    if ((sleep_duration <= 5.9 and quality_of_sleep <= 4 and physical_activity_level <= 30 and stress_level >= 8 and bmi_category == 'Obese' and heart_rate >= 85 and daily_steps <= 3000) or
+        (sleep_duration <= 6.5 and quality_of_sleep <= 5 and physical_activity_level <= 40 and bmi_category in ['Overweight', 'Obese'] and heart_rate >= 80) or
+        (bmi_category == 'Obese' and sleep_duration < 6.0 and quality_of_sleep <= 4)):
+        prediction = 2  # Sleep Apnea
+    # Check for insomnia patterns with improved criteria
+    elif ((sleep_duration <= 6.3 and quality_of_sleep <= 6 and physical_activity_level <= 40 and stress_level >= 7 and bmi_category == 'Obese' and heart_rate >= 82 and daily_steps <= 3500) or
+          (sleep_duration <= 6.5 and quality_of_sleep <= 5 and physical_activity_level <= 40 and stress_level >= 7 and heart_rate >= 80) or
+          (sleep_duration <= 6.0 and physical_activity_level <= 30 and stress_level >= 8)):
+        prediction = 1  # Insomnia
+    # Check for clear non-sleeping disorder patterns
+    elif sleep_duration >= 7.5 and quality_of_sleep >= 7 and stress_level <= 6:
+        prediction = 0
+    elif max_prob_index == 0 and max_prob_value >= NO_DISORDER_THRESHOLD:
+        # High confidence in no disorder prediction from model
+        prediction = 0
+    elif max_prob_value >= DISORDER_THRESHOLD:
+        # Check additional metrics before confirming disorder prediction
+        if max_prob_index > 0:  # If predicting a disorder
+            if sleep_duration < 6.5 and quality_of_sleep <= 6:
+                if stress_level >= 7 and physical_activity_level <= 40:
+                    prediction = 1  # Insomnia
+                elif bmi_category in ['Overweight', 'Obese'] and stress_level >= 6:
+                    prediction = 2  # Sleep Apnea
+                else:
+                    prediction = max_prob_index
+            else:
+                prediction = 0
+        else:
+            prediction = 0
+    elif max_prob_value < UNCERTAIN_THRESHOLD:
+        # Very low confidence, use comprehensive sleep metrics
+        if sleep_duration >= 6.5 and quality_of_sleep >= 6 and stress_level <= 7 and physical_activity_level >= 35:
+            prediction = 0
+        elif sleep_duration < 5.5 and quality_of_sleep <= 4 and stress_level >= 8:
+            # Clear indicators of potential sleep disorder
+            prediction = max_prob_index
+        else:
+            prediction = 0
+    else:
+        # Moderate confidence, use additional features to validate with improved weights
+        health_score = calculate_health_score_scalar(sleep_duration, quality_of_sleep, physical_activity_level,
+                                                     stress_level)
+        if health_score > HEALTH_SCORE_THRESHOLD and (max_prob_index == 0 or max_prob_value < 0.7):
+            # Good health indicators strongly support no disorder prediction
+            prediction = 0
+        else:
+            # Use the model's best prediction (poor health indicators support it too)
+            prediction = max_prob_index
+
+    return prediction, ece_probabilities(prediction, prediction_proba)
+
+
+def ece_probabilities(prediction, prediction_proba):
+    """ECE monitor probabilities for one refined prediction"""
+    # Create probabilities for ECE visualization including non-sleeping disorder
+    probabilities = {
+        'insomnia': prediction_proba[1] if len(prediction_proba) > 1 else 0,
+        'apnea': prediction_proba[2] if len(prediction_proba) > 2 else 0,
+        'rls': prediction_proba[3] if len(prediction_proba) > 3 else 0,
+        'normal': prediction_proba[0] if len(prediction_proba) > 0 else 0
+    }
+
+    # Raise the predicted class and scale the others down proportionally
+    if prediction in (0, 1, 2):
+        target = PROBABILITY_NAMES[prediction]
+        others = [name for name in PROBABILITY_NAMES if name != target]
+        probabilities[target] = max(PREDICTED_CLASS_MIN_PROBABILITY, probabilities[target])
+        total_other = probabilities[others[0]] + probabilities[others[1]] + probabilities[others[2]]
+        if total_other > 0:
+            scale = (1.0 - probabilities[target]) / total_other
+            for name in others:
+                probabilities[name] *= scale
+
+    return probabilities
+
+
+def calculate_health_score_scalar(sleep_duration, quality_of_sleep, physical_activity_level, stress_level):
+    """Weighted score from key sleep indicators for one record"""
+    sleep_quality_weight = 0.5
+    stress_level_weight = 0.3  # Increased weight for stress level
+    physical_activity_weight = 0.2
+    sleep_duration_factor = 0.0  # Initialize additional factor
+
+    # Add sleep duration factor (longer sleep duration increases likelihood of no disorder)
+    if sleep_duration >= 7.5:
+        sleep_duration_factor = 0.2
+    elif sleep_duration >= 6.5:
+        sleep_duration_factor = 0.1
+
+    # Calculate weighted score from key indicators with adjusted weights
+    quality_score = (quality_of_sleep / 10.0) * sleep_quality_weight * 1.2  # Increased weight for sleep quality
+    stress_score = ((10 - stress_level) / 10.0) * stress_level_weight * 0.8  # Decreased weight for stress
+    activity_score = (physical_activity_level / 100.0) * physical_activity_weight
+    return quality_score + stress_score + activity_score + sleep_duration_factor
+
+
+def calculate_health_score(sleep_duration, quality_of_sleep, physical_activity_level, stress_level):
+    """Weighted score from key sleep indicators, vectorized over arrays"""
+    sleep_quality_weight = 0.5
+    stress_level_weight = 0.3  # Increased weight for stress level
+    physical_activity_weight = 0.2
+
+    # Longer sleep duration increases likelihood of no disorder
+    sleep_duration_factor = np.where(sleep_duration >= 7.5, 0.2, np.where(sleep_duration >= 6.5, 0.1, 0.0))
+
+    quality_score = (quality_of_sleep / 10.0) * sleep_quality_weight * 1.2  # Increased weight for sleep quality
+    stress_score = ((10 - stress_level) / 10.0) * stress_level_weight * 0.8  # Decreased weight for stress
+    activity_score = (physical_activity_level / 100.0) * physical_activity_weight
+    return quality_score + stress_score + activity_score + sleep_duration_factor
+
+
+def apply_rules(sleep_duration, quality_of_sleep, physical_activity_level, stress_level,
+                bmi_category, heart_rate, daily_steps, prediction_proba, health_score=None):
+    """Vectorized apply_rules_scalar over N rows.
+
+    Inputs are length-N arrays (bmi_category holds labels) and prediction_proba is (N, n_classes).
+    health_score, if given, replaces calculate_health_score() of the inputs.
+    Returns (N,) class codes and an (N, 4) array of ECE probabilities in PROBABILITY_NAMES order."""
+    sd = np.asarray(sleep_duration, dtype=np.float64)
+    q = np.asarray(quality_of_sleep, dtype=np.float64)
+    pa = np.asarray(physical_activity_level, dtype=np.float64)
+    st = np.asarray(stress_level, dtype=np.float64)
+    hr = np.asarray(heart_rate, dtype=np.float64)
+    ds = np.asarray(daily_steps, dtype=np.float64)
+    bmi = np.asarray(bmi_category)
+    proba = np.asarray(prediction_proba, dtype=np.float64)
+
+    n = len(proba)
+    obese = bmi == 'Obese'
+    heavy = obese | (bmi == 'Overweight')
+    max_prob_index = np.argmax(proba, axis=1)
+    max_prob_value = proba[np.arange(n), max_prob_index]
+
+    apnea = (((sd <= 5.9) & (q <= 4) & (pa <= 30) & (st >= 8) & obese & (hr >= 85) & (ds <= 3000)) |
+             ((sd <= 6.5) & (q <= 5) & (pa <= 40) & heavy & (hr >= 80)) |
+             (obese & (sd < 6.0) & (q <= 4)))
+    insomnia = (((sd <= 6.3) & (q <= 6) & (pa <= 40) & (st >= 7) & obese & (hr >= 82) & (ds <= 3500)) |
+                ((sd <= 6.5) & (q <= 5) & (pa <= 40) & (st >= 7) & (hr >= 80)) |
+                ((sd <= 6.0) & (pa <= 30) & (st >= 8)))
+    clear_normal = (sd >= 7.5) & (q >= 7) & (st <= 6)
+    model_normal = (max_prob_index == 0) & (max_prob_value >= NO_DISORDER_THRESHOLD)
+    high = max_prob_value >= DISORDER_THRESHOLD
+    low = max_prob_value < UNCERTAIN_THRESHOLD
+
+    # High confidence in a disorder: confirm with sleep metrics
+    poor_sleep = (sd < 6.5) & (q <= 6)
+    high_prediction = np.where(
+        (max_prob_index > 0) & poor_sleep,
+        np.where((st >= 7) & (pa <= 40), 1, np.where(heavy & (st >= 6), 2, max_prob_index)),
+        0
+    )
+
+    # Very low confidence: fall back on comprehensive sleep metrics
+    low_prediction = np.where(
+        ~((sd >= 6.5) & (q >= 6) & (st <= 7) & (pa >= 35)) & (sd < 5.5) & (q <= 4) & (st >= 8),
+        max_prob_index,
+        0
+    )
+
+    # Moderate confidence: validate with the weighted health score
+    if health_score is None:
+        health_score = calculate_health_score(sd, q, pa, st)
+    moderate_prediction = np.where(
+        (health_score > HEALTH_SCORE_THRESHOLD) & ((max_prob_index == 0) | (max_prob_value < 0.7)),
+        0,
+        max_prob_index
+    )
+
+    prediction = np.select(
+        [apnea, insomnia, clear_normal, model_normal, high, low],
+        [2, 1, 0, 0, high_prediction, low_prediction],
+        default=moderate_prediction
+    )
+
+    # ECE probabilities: normal, insomnia, apnea, rls (missing classes are 0)
+    probabilities = np.zeros((n, 4), dtype=np.float64)
+    width = min(4, proba.shape[1])
+    probabilities[:, :width] = proba[:, :width]
+
+    for target in (0, 1, 2):
+        rows = np.flatnonzero(prediction == target)
+        if not len(rows):
+            continue
+        others = [j for j in range(4) if j != target]
+        block = probabilities[rows]
+        block[:, target] = np.maximum(PREDICTED_CLASS_MIN_PROBABILITY, block[:, target])
+        total_other = block[:, others[0]] + block[:, others[1]] + block[:, others[2]]
+        positive = total_other > 0
+        scale = np.ones(len(rows))
+        scale[positive] = (1.0 - block[positive, target]) / total_other[positive]
+        for j in others:
+            block[:, j] *= scale
+        probabilities[rows] = block
+
+    return prediction, probabilities
@@ -0,0 +1,336 @@
+# EEG and HRV Feature Extraction for Monitoring Data
+# Turns EEG samples and heartbeat (RR interval) series into per-window features:
+# Welch PSD band powers and sleep spindle counts for EEG, and RMSSD, SDNN and LF/HF
+# for HRV. Windows overlap, so the work is done once per Welch segment (EEG) or per
+# step (HRV) and each window combines the partial results it covers instead of
+# being recomputed from its samples. The extractors also accept data in pieces
+# (e.g. from a live stream) and return each window as soon as it is complete.
+
+from flask import request, jsonify
+import numpy as np
+
+from prediction_rules import PROBABILITY_NAMES
+from signal_synthesis import (synthesize_eeg, synthesize_rr, clean_probabilities, EEG_SAMPLE_RATE,
+                              MAX_SAMPLE_RATE, MAX_STREAM_SECONDS)
+
+# EEG frequency bands (Hz)
+EEG_BANDS = (('delta', 0.5, 4.0), ('theta', 4.0, 8.0), ('alpha', 8.0, 13.0),
+             ('beta', 13.0, 30.0), ('gamma', 30.0, 45.0))
+
+# EEG feature window and the step between windows (the step must be a multiple of the segment hop)
+EEG_WINDOW_SECONDS = 30
+EEG_STEP_SECONDS = 10
+
+# Welch segment length; segments overlap by half
+WELCH_SEGMENT_SECONDS = 4
+
+# Sleep spindles: sigma band (Hz), envelope RMS window, amplitude threshold (uV) and duration (s)
+SPINDLE_BAND = (11.0, 16.0)
+SPINDLE_RMS_SECONDS = 0.25
+SPINDLE_THRESHOLD_UV = 5.0
+SPINDLE_MIN_SECONDS = 0.5
+SPINDLE_MAX_SECONDS = 2.0
+
+# HRV feature window (5 minutes, the standard short-term length) and step
+HRV_WINDOW_SECONDS = 300
+HRV_STEP_SECONDS = 60
+
+# The RR series is resampled to this rate for the spectrum, in segments of this length (half overlap)
+HRV_RESAMPLE_HZ = 4
+HRV_SEGMENT_SECONDS = 120
+
+# HRV frequency bands (Hz)
+HRV_LF_BAND = (0.04, 0.15)
+HRV_HF_BAND = (0.15, 0.4)
+
+
+def _band_masks(nperseg, fs, bands):
+    frequencies = np.fft.rfftfreq(nperseg, 1 / fs)
+    return np.array([(frequencies >= low) & (frequencies < high) for low, high in bands], dtype=np.float64)
+
+
+class _WelchBands:
+    """Band powers of consecutive half-overlapping Welch segments of a sample stream.
+
+    Matches scipy.signal.welch (Hann window, constant detrend, density scaling):
+    the Welch estimate over any run of segments is the mean of their band powers."""
+
+    def __init__(self, fs, segment_seconds, bands):
+        self.nperseg = int(round(segment_seconds * fs))
+        self.hop = self.nperseg // 2
+        # scipy.signal is imported by the extractors, not at app start-up
+        from scipy import signal as sps
+        window = sps.get_window('hann', self.nperseg)
+        self._window = window
+        # One-sided density scaling, with the band integral's frequency step folded in
+        scale = np.full(self.nperseg // 2 + 1, 2.0 / (fs * (window ** 2).sum()))
+        scale[0] /= 2
+        if self.nperseg % 2 == 0:
+            scale[-1] /= 2
+        self._weights = _band_masks(self.nperseg, fs, bands) * scale * (fs / self.nperseg)
+        self._tail = np.empty(0)
+        self.segments = 0    # Segments computed so far
+
+    def update(self, samples, chunk=1024):
+        """Band powers (segments x bands) of the segments completed by these samples"""
+        data = np.concatenate((self._tail, samples))
+        count = (len(data) - self.nperseg) // self.hop + 1 if len(data) >= self.nperseg else 0
+        powers = np.empty((count, len(self._weights)))
+        if count:
+            views = np.lib.stride_tricks.sliding_window_view(data, self.nperseg)[::self.hop]
+        # A chunk of segments at a time keeps the FFT buffers small for a whole night
+        for first in range(0, count, chunk):
+            segments = views[first:first + chunk]
+            segments = (segments - segments.mean(axis=1, keepdims=True)) * self._window
+            spectrum = np.fft.rfft(segments, axis=1)
+            powers[first:first + chunk] = (spectrum.real ** 2 + spectrum.imag ** 2) @ self._weights.T
+        self._tail = data[count * self.hop:]
+        self.segments += count
+        return powers
+
+
+class _WindowCombiner:
+    """Means of per-segment values over sliding windows of `per_window` segments
+    advancing `per_step` segments, from a running sum"""
+
+    def __init__(self, per_window, per_step, width):
+        self.per_window = per_window
+        self.per_step = per_step
+        self._values = np.empty((0, width))
+        self._first = 0      # Segment number of _values[0]
+        self.windows = 0     # Windows emitted so far
+
+    def update(self, values):
+        self._values = np.concatenate((self._values, values))
+        available = self._first + len(self._values)
+        count = max(0, (available - self.per_window) // self.per_step + 1 - self.windows)
+        if count == 0:
+            return np.empty((0, self._values.shape[1]))
+        cumulative = np.concatenate((np.zeros((1, self._values.shape[1])), np.cumsum(self._values, axis=0)))
+        starts = (self.windows + np.arange(count)) * self.per_step - self._first
+        means = (cumulative[starts + self.per_window] - cumulative[starts]) / self.per_window
+        self.windows += count
+        # Segments before the next window aren't needed again
+        drop = self.windows * self.per_step - self._first
+        self._values = self._values[drop:]
+        self._first += drop
+        return means
+
+
+class EEGFeatureExtractor:
+    """Per-window Welch band powers and spindle counts from EEG samples fed in any pieces"""
+
+    def __init__(self, fs=EEG_SAMPLE_RATE, start=0.0, window_seconds=EEG_WINDOW_SECONDS,
+                 step_seconds=EEG_STEP_SECONDS):
+        self.fs = fs
+        self.start = start
+        self.window = int(round(window_seconds * fs))
+        self.step = int(round(step_seconds * fs))
+        self._welch = _WelchBands(fs, WELCH_SEGMENT_SECONDS, [band[1:] for band in EEG_BANDS])
+        hop = self._welch.hop
+        if self.step % hop or self.window < self._welch.nperseg:
+            raise ValueError("EEG windows must hold a Welch segment and step by whole segment hops")
+        self._bands = _WindowCombiner((self.window - self._welch.nperseg) // hop + 1, self.step // hop, len(EEG_BANDS))
+
+        # Spindle detector state: sigma band-pass filter, RMS envelope tail, open spindle
+        from scipy import signal as sps
+        self._sos = sps.butter(4, SPINDLE_BAND, btype='bandpass', fs=fs, output='sos')
+        self._zi = np.zeros((self._sos.shape[0], 2))
+        self._rms_length = max(1, int(round(SPINDLE_RMS_SECONDS * fs)))
+        self._power_tail = np.zeros(self._rms_length - 1)
+        self._above_since = None
+        self._spindle_ends = []  # Sample index where each spindle ended, not yet counted
+        self.samples = 0
+
+    def _detect_spindles(self, samples):
+        from scipy import signal as sps
+        sigma, self._zi = sps.sosfilt(self._sos, samples, zi=self._zi)
+        power = np.concatenate((self._power_tail, sigma ** 2))
+        cumulative = np.concatenate(([0.0], np.cumsum(power)))
+        rms = np.sqrt(np.maximum(cumulative[self._rms_length:] - cumulative[:-self._rms_length], 0) / self._rms_length)
+        self._power_tail = power[len(power) - (self._rms_length - 1):] if self._rms_length > 1 else power[:0]
+
+        # Spindle = a run of the envelope above the threshold lasting MIN..MAX seconds
+        above = rms > SPINDLE_THRESHOLD_UV
+        edges = np.flatnonzero(np.diff(above.astype(np.int8), prepend=np.int8(self._above_since is not None)))
+        for edge in edges:
+            index = self.samples + edge
+            if above[edge]:
+                self._above_since = index
+            else:
+                duration = (index - self._above_since) / self.fs
+                if SPINDLE_MIN_SECONDS <= duration <= SPINDLE_MAX_SECONDS:
+                    self._spindle_ends.append(index)
+                self._above_since = None
+
+    def update(self, samples):
+        """Feed EEG samples; returns the windows they complete as a dict of arrays:
+        start (s), one band power (uV^2) per EEG_BANDS name, total_power and spindles"""
+        samples = np.asarray(samples, dtype=np.float64)
+        self._detect_spindles(samples)
+        self.samples += len(samples)
+        first_window = self._bands.windows
+        powers = self._bands.update(self._welch.update(samples))
+
+        window_starts = (first_window + np.arange(len(powers))) * self.step
+        ends = np.array(self._spindle_ends, dtype=np.int64)
+        spindles = (np.searchsorted(ends, window_starts + self.window) - np.searchsorted(ends, window_starts))
+        if len(powers):
+            # Spindles ending before the next window start are done with
+            keep_from = np.searchsorted(ends, (first_window + len(powers)) * self.step)
+            self._spindle_ends = self._spindle_ends[keep_from:]
+
+        features = {'start': self.start + window_starts / self.fs}
+        for (name, _, _), column in zip(EEG_BANDS, powers.T):
+            features[name] = column
+        features['total_power'] = powers.sum(axis=1)
+        features['spindles'] = spindles
+        return features
+
+
+class HRVFeatureExtractor:
+    """Per-window RMSSD, SDNN, heart rate and LF/HF from heartbeats fed in any pieces.
+
+    Successive differences belong to the window of the later beat."""
+
+    def __init__(self, start=0.0, window_seconds=HRV_WINDOW_SECONDS, step_seconds=HRV_STEP_SECONDS):
+        self.start = start
+        self.step_seconds = step_seconds
+        self.per_window = int(window_seconds // step_seconds)
+        if self.per_window * step_seconds != window_seconds:
+            raise ValueError("HRV windows must be a whole number of steps")
+
+        # Per step: beats, sum RR, sum RR^2, differences, sum diff^2, differences over 50ms
+        self._steps = np.zeros((0, 6))
+        self._first_step = 0
+        self._last_beat = None   # (time, rr) of the latest beat
+
+        self._welch = _WelchBands(HRV_RESAMPLE_HZ, HRV_SEGMENT_SECONDS, [HRV_LF_BAND, HRV_HF_BAND])
+        hop_seconds = self._welch.hop / HRV_RESAMPLE_HZ
+        self._spectrum = _WindowCombiner(int((window_seconds - HRV_SEGMENT_SECONDS) // hop_seconds) + 1,
+                                         int(step_seconds // hop_seconds), 2)
+        self._resampled = 0      # Tachogram samples produced so far
+        self.windows = 0
+
+    def update(self, beat_times, rr_ms):
+        """Feed heartbeats (times in seconds, increasing); returns the windows they
+        complete as a dict of arrays: start, beats, mean_rr, heart_rate, sdnn, rmssd,
+        pnn50, lf, hf and lf_hf"""
+        beat_times = np.asarray(beat_times, dtype=np.float64)
+        rr_ms = np.asarray(rr_ms, dtype=np.float64)
+        if len(beat_times) == 0:
+            return self._emit(np.empty((0, 2)))
+
+        # Time-domain sums per step
+        steps = ((beat_times - self.start) // self.step_seconds).astype(np.int64)
+        previous = [self._last_beat[1]] if self._last_beat is not None else []
+        differences = np.diff(np.concatenate((previous or [rr_ms[0]], rr_ms)))
+        # The very first beat has no predecessor
+        has_difference = np.ones(len(rr_ms), dtype=bool)
+        has_difference[0] = bool(previous)
+        needed = steps[-1] + 1 - self._first_step
+        if needed > len(self._steps):
+            self._steps = np.concatenate((self._steps, np.zeros((needed - len(self._steps), 6))))
+        index = steps - self._first_step
+        for column, values in enumerate((np.ones_like(rr_ms), rr_ms, rr_ms ** 2, has_difference,
+                                         differences ** 2 * has_difference,
+                                         (np.abs(differences) > 50) & has_difference)):
+            np.add.at(self._steps[:, column], index, values)
+
+        # Tachogram resampled at HRV_RESAMPLE_HZ up to the latest beat, for the spectrum
+        known_times = np.concatenate(([self._last_beat[0]] if previous else [], beat_times))
+        known_rr = np.concatenate((previous, rr_ms))
+        last = int(np.floor((beat_times[-1] - self.start) * HRV_RESAMPLE_HZ))
+        grid = self.start + np.arange(self._resampled, last + 1) / HRV_RESAMPLE_HZ
+        self._resampled = last + 1
+        self._last_beat = (beat_times[-1], rr_ms[-1])
+        return self._emit(self._spectrum.update(self._welch.update(np.interp(grid, known_times, known_rr))))
+
+    def _emit(self, spectrum):
+        count = len(spectrum)
+        first = self.windows - self._first_step
+        cumulative = np.concatenate((np.zeros((1, 6)), np.cumsum(self._steps, axis=0)))
+        starts = first + np.arange(count)
+        sums = cumulative[starts + self.per_window] - cumulative[starts]
+        beats, total, squares, n_differences, difference_squares, over_50 = sums.T
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_rr = total / beats
+            features = {
+                'start': self.start + (self.windows + np.arange(count)) * self.step_seconds,
+                'beats': beats.astype(np.int64),
+                'mean_rr': mean_rr,
+                'heart_rate': 60000 / mean_rr,
+                'sdnn': np.sqrt(np.maximum(squares / beats - mean_rr ** 2, 0) * beats / np.maximum(beats - 1, 1)),
+                'rmssd': np.sqrt(difference_squares / n_differences),
+                'pnn50': over_50 / n_differences,
+                'lf': spectrum[:, 0],
+                'hf': spectrum[:, 1],
+                'lf_hf': spectrum[:, 0] / spectrum[:, 1]
+            }
+        self.windows += count
+        # Steps before the next window aren't needed again
+        drop = min(len(self._steps), self.windows - self._first_step)
+        self._steps = self._steps[drop:]
+        self._first_step += drop
+        return features
+
+
+def eeg_features(eeg, fs=EEG_SAMPLE_RATE, start=0.0):
+    """Band powers and spindle counts for every window of a whole EEG recording"""
+    return EEGFeatureExtractor(fs, start).update(eeg)
+
+
+def hrv_features(beat_times, rr_ms, start=0.0):
+    """RMSSD, SDNN, LF/HF etc. for every window of a whole heartbeat series"""
+    return HRVFeatureExtractor(start).update(beat_times, rr_ms)
+
+
+def features_to_records(features):
+    """Dict of per-window arrays -> list of per-window dicts with rounded plain floats"""
+    names = list(features)
+    columns = [values.tolist() if values.dtype.kind in 'iu' else np.round(values, 4).tolist()
+               for values in (np.asarray(features[name]) for name in names)]
+    return [dict(zip(names, values)) for values in zip(*columns)]
+
+
+def add_signal_feature_routes(app):
+    """Add EEG/HRV feature extraction routes to the Flask app"""
+
+    @app.route('/api/signals/features', methods=['GET'])
+    def signal_features():
+        """Per-window EEG and HRV features of a synthesized recording:
+        ?disorder=&seconds=(default a full 8-hour night)&fs=&seed= and optional probabilities"""
+        try:
+            seconds = float(request.args.get('seconds', 8 * 3600))
+            fs = int(request.args.get('fs', EEG_SAMPLE_RATE))
+            seed = int(request.args.get('seed', 0))
+            if not HRV_WINDOW_SECONDS <= seconds <= MAX_STREAM_SECONDS:
+                raise ValueError(f"seconds must be between {HRV_WINDOW_SECONDS} and {MAX_STREAM_SECONDS}")
+            if not 2 * EEG_BANDS[-1][2] <= fs <= MAX_SAMPLE_RATE:
+                raise ValueError(f"fs must be between {2 * EEG_BANDS[-1][2]:g} Hz (for the gamma band) "
+                                 f"and {MAX_SAMPLE_RATE}")
+            probabilities = clean_probabilities(
+                {name: request.args[name] for name in PROBABILITY_NAMES if request.args.get(name)})
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        prediction = request.args.get('disorder') or None
+
+        # Synthesized and analysed an epoch block at a time so a night's samples are never all in memory
+        extractor = EEGFeatureExtractor(fs)
+        eeg = {}
+        block = 600
+        for block_start in range(0, int(np.ceil(seconds)), block):
+            block_features = extractor.update(synthesize_eeg(prediction, block_start, min(block, seconds - block_start),
+                                                             fs, seed))
+            for name, values in block_features.items():
+                eeg.setdefault(name, []).append(values)
+        eeg = {name: np.concatenate(parts) for name, parts in eeg.items()}
+
+        beat_times, rr_ms = synthesize_rr(prediction, 0, seconds, probabilities, seed)
+        return jsonify({
+            'eeg_window_seconds': EEG_WINDOW_SECONDS,
+            'hrv_window_seconds': HRV_WINDOW_SECONDS,
+            'eeg': features_to_records(eeg),
+            'hrv': features_to_records(hrv_features(beat_times, rr_ms))
+        })
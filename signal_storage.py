@@ -0,0 +1,236 @@
+# Compact Binary Storage for Monitoring Signals
+# sleep_monitoring keeps each recording's EEG and heartbeats as binary blobs instead
+# of text. A blob is a fixed header (sample rate, start offset, sample encoding), a
+# table of chunk offsets, then the samples in independently compressed chunks of one
+# scoring epoch each. Reading a slice of a night fetches the header and only the
+# chunks that cover it (SUBSTR on the blob column, or a seek in a file), never the
+# whole recording.
+
+from flask import request, jsonify, Response
+import struct
+import zlib
+import numpy as np
+
+# Header: magic, version, sample encoding, compression, sample rate (Hz, 0 = one per beat),
+# start (s), int16 scale (units per step), sample count, samples per chunk, chunk count
+SIGNAL_HEADER = struct.Struct('<4sBBBxddfQII')
+SIGNAL_MAGIC = b'SSIG'
+SIGNAL_VERSION = 1
+
+# Sample encodings
+ENCODING_FLOAT32 = 0
+ENCODING_INT16 = 1  # Quantized to `scale`; compressed as successive differences
+
+# Chunk compression
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+
+# EEG is stored as int16 steps of 0.1 uV (+-3276 uV range, finer than EEG amplifier noise) in 30 s chunks
+EEG_INT16_SCALE = 0.1
+SIGNAL_CHUNK_SECONDS = 30
+
+# RR intervals are stored per beat as float32 milliseconds in chunks of this many beats
+RR_CHUNK_BEATS = 4096
+
+# zlib compression level (zlib's default balance of size and speed)
+ZLIB_LEVEL = 6
+
+# Bytes fetched by the first read of a blob: the header plus an offset table for up to 8 hours
+HEADER_PREFETCH_BYTES = SIGNAL_HEADER.size + 8 * (8 * 3600 // SIGNAL_CHUNK_SECONDS + 1)
+
+# Blob columns of sleep_monitoring that hold encoded signals
+SIGNAL_COLUMNS = ('eeg_data', 'hrv_data')
+
+
+def encode_signal(samples, sample_rate, start=0.0, encoding=ENCODING_INT16, scale=EEG_INT16_SCALE,
+                  chunk_samples=None, compression=COMPRESSION_ZLIB):
+    """Encode a 1-D signal as a header, chunk offset table and chunks"""
+    samples = np.asarray(samples)
+    if chunk_samples is None:
+        chunk_samples = int(round(SIGNAL_CHUNK_SECONDS * sample_rate)) if sample_rate else RR_CHUNK_BEATS
+
+    if encoding == ENCODING_INT16:
+        limit = np.iinfo(np.int16).max
+        values = np.clip(np.round(samples / scale), -limit, limit).astype(np.int16)
+    else:
+        values = samples.astype(np.float32)
+
+    chunks = []
+    for first in range(0, len(values), chunk_samples):
+        chunk = values[first:first + chunk_samples]
+        if encoding == ENCODING_INT16:
+            # Neighbouring samples are close, so their differences compress far better
+            # (int16 wrap-around is undone by an int16 cumsum on decode)
+            chunk = np.diff(chunk, prepend=np.int16(0))
+        data = chunk.astype(chunk.dtype.newbyteorder('<')).tobytes()
+        chunks.append(zlib.compress(data, ZLIB_LEVEL) if compression == COMPRESSION_ZLIB else data)
+
+    offsets = np.concatenate(([0], np.cumsum([len(chunk) for chunk in chunks], dtype=np.uint64))).astype('<u8')
+    header = SIGNAL_HEADER.pack(SIGNAL_MAGIC, SIGNAL_VERSION, encoding, compression, float(sample_rate),
+                                float(start), float(scale), len(values), chunk_samples, len(chunks))
+    return b''.join([header, offsets.tobytes()] + chunks)
+
+
+def encode_rr(beat_times, rr_ms):
+    """Encode heartbeats as float32 RR intervals; the first beat's time is the start"""
+    start = float(beat_times[0]) if len(beat_times) else 0.0
+    return encode_signal(rr_ms, 0, start, ENCODING_FLOAT32, 1.0, RR_CHUNK_BEATS)
+
+
+class SignalBlob:
+    """Random access to an encoded signal through read_at(offset, length) -> bytes"""
+
+    def __init__(self, read_at):
+        self._read_at = read_at
+        prefix = bytes(read_at(0, HEADER_PREFETCH_BYTES))
+        if len(prefix) < SIGNAL_HEADER.size:
+            raise ValueError("Not an encoded signal (too short)")
+        (magic, version, self.encoding, self.compression, self.sample_rate, self.start, self.scale,
+         self.n_samples, self.chunk_samples, self.n_chunks) = SIGNAL_HEADER.unpack_from(prefix)
+        if magic != SIGNAL_MAGIC or version != SIGNAL_VERSION:
+            raise ValueError("Not an encoded signal (bad header)")
+
+        table_bytes = 8 * (self.n_chunks + 1)
+        table = prefix[SIGNAL_HEADER.size:SIGNAL_HEADER.size + table_bytes]
+        if len(table) < table_bytes:
+            table = bytes(read_at(SIGNAL_HEADER.size, table_bytes))
+        self.offsets = np.frombuffer(table, dtype='<u8').astype(np.int64)
+        self.data_start = SIGNAL_HEADER.size + table_bytes
+        self.bytes_read = len(prefix)
+
+    @property
+    def duration(self):
+        return self.n_samples / self.sample_rate if self.sample_rate else None
+
+    def _decode_chunk(self, data):
+        if self.compression == COMPRESSION_ZLIB:
+            data = zlib.decompress(data)
+        if self.encoding == ENCODING_INT16:
+            return np.cumsum(np.frombuffer(data, dtype='<i2'), dtype=np.int16).astype(np.float32) * np.float32(self.scale)
+        return np.frombuffer(data, dtype='<f4').astype(np.float32)
+
+    def read_samples(self, first, count):
+        """Samples [first, first + count) as float32, reading only the chunks they're in"""
+        first = max(0, min(int(first), self.n_samples))
+        end = max(first, min(first + int(count), self.n_samples))
+        if end == first:
+            return np.empty(0, dtype=np.float32)
+        first_chunk, last_chunk = first // self.chunk_samples, (end - 1) // self.chunk_samples
+
+        # One contiguous read for all the chunks needed
+        begin, finish = self.offsets[first_chunk], self.offsets[last_chunk + 1]
+        data = bytes(self._read_at(self.data_start + begin, finish - begin))
+        self.bytes_read += len(data)
+        samples = np.concatenate([
+            self._decode_chunk(data[self.offsets[i] - begin:self.offsets[i + 1] - begin])
+            for i in range(first_chunk, last_chunk + 1)
+        ])
+        skip = first - first_chunk * self.chunk_samples
+        return samples[skip:skip + end - first]
+
+    def read_seconds(self, start, seconds):
+        """Samples for [start, start + seconds) of the session (start is in session time)"""
+        first = int(round((start - self.start) * self.sample_rate))
+        return self.read_samples(first, int(round(seconds * self.sample_rate)))
+
+    def read_all(self):
+        return self.read_samples(0, self.n_samples)
+
+
+def decode_rr(blob):
+    """(beat_times, rr_ms) of a heartbeat SignalBlob"""
+    rr_ms = blob.read_all().astype(np.float64)
+    if len(rr_ms) == 0:
+        return rr_ms, rr_ms
+    return blob.start + np.concatenate(([0.0], np.cumsum(rr_ms[1:]) / 1000)), rr_ms
+
+
+def bytes_reader(data):
+    """read_at over an in-memory blob"""
+    view = memoryview(data)
+    return lambda offset, length: view[offset:offset + length]
+
+
+def file_reader(path):
+    """read_at over an encoded signal file (a seek and a read per call)"""
+    def read_at(offset, length):
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+    return read_at
+
+
+def blob_reader(pool, column, monitoring_id):
+    """read_at over a sleep_monitoring blob column; each read is a SUBSTR on the server"""
+    if column not in SIGNAL_COLUMNS:
+        raise ValueError(f"Unknown signal column {column}")
+    query = f"SELECT SUBSTR({column}, %s, %s) FROM sleep_monitoring WHERE id = %s"
+
+    def read_at(offset, length):
+        # SUBSTR positions start at 1
+        rows = pool.fetchall(query, (int(offset) + 1, int(length), monitoring_id))
+        if not rows or rows[0][0] is None:
+            raise LookupError(f"No {column} for monitoring id {monitoring_id}")
+        return rows[0][0]
+    return read_at
+
+
+def monitoring_values(user_id, eeg, sample_rate, beat_times, rr_ms, sleep_position=None,
+                      respiratory_pattern=None, start=0.0):
+    """Parameters for MONITORING_INSERT with the signals encoded"""
+    return (user_id, encode_signal(eeg, sample_rate, start), encode_rr(beat_times, rr_ms),
+            sleep_position, respiratory_pattern)
+
+
+# Insert a recording; the values come from monitoring_values
+MONITORING_INSERT = ("INSERT INTO sleep_monitoring (user_id, eeg_data, hrv_data, sleep_position, respiratory_pattern) "
+                     "VALUES (%s, %s, %s, %s, %s)")
+
+
+def store_monitoring(pool, *args, **kwargs):
+    """Insert one recording (see monitoring_values for the arguments)"""
+    pool.execute(MONITORING_INSERT, monitoring_values(*args, **kwargs))
+
+
+def add_monitoring_storage_routes(app, pool):
+    """Add routes reading stored monitoring signals to the Flask app"""
+
+    @app.route('/api/monitoring/<int:monitoring_id>/eeg', methods=['GET'])
+    def monitoring_eeg(monitoring_id):
+        """EEG of a stored recording for ?start=&seconds= (session time), as JSON or
+        raw float32 little-endian with format=binary"""
+        try:
+            blob = SignalBlob(blob_reader(pool, 'eeg_data', monitoring_id))
+            if not blob.sample_rate > 0:
+                raise ValueError(f"Recording {monitoring_id} has no EEG sample rate")
+            start = float(request.args.get('start', blob.start))
+            seconds = float(request.args.get('seconds', SIGNAL_CHUNK_SECONDS))
+            if not (np.isfinite(start) and np.isfinite(seconds)):
+                raise ValueError("start and seconds must be finite numbers")
+            samples = blob.read_seconds(start, seconds)
+            actual_start = blob.start + max(0, int(round((start - blob.start) * blob.sample_rate))) / blob.sample_rate
+        except LookupError as e:
+            return jsonify({'error': str(e)}), 404
+        except (ValueError, OverflowError) as e:
+            # OverflowError: start/seconds so large that the sample index overflows a float
+            return jsonify({'error': str(e)}), 400
+        if request.args.get('format') == 'binary':
+            return Response(samples.astype('<f4').tobytes(), mimetype='application/octet-stream',
+                            headers={'X-Sample-Rate': str(blob.sample_rate), 'X-Start-Seconds': str(actual_start)})
+        return jsonify({
+            'fs': blob.sample_rate,
+            'start': actual_start,
+            'duration': blob.duration,
+            'eeg': np.round(samples, 3).tolist()
+        })
+
+    @app.route('/api/monitoring/<int:monitoring_id>/hrv', methods=['GET'])
+    def monitoring_hrv(monitoring_id):
+        """Heartbeat times and RR intervals of a stored recording"""
+        try:
+            beat_times, rr_ms = decode_rr(SignalBlob(blob_reader(pool, 'hrv_data', monitoring_id)))
+        except LookupError as e:
+            return jsonify({'error': str(e)}), 404
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'beat_times': np.round(beat_times, 4).tolist(), 'rr_ms': np.round(rr_ms, 2).tolist()})
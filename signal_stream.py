@@ -0,0 +1,220 @@
+# Live Streaming of Monitoring Signals (Server-Sent Events)
+# A monitoring session is created from a prediction and its EEG and heartbeats are
+# pushed to any number of listeners as batches at a chosen rate, replacing the
+# browser's own 100ms timer. Each listener is a generator that synthesizes one second
+# of signal at a time, so a connection holds at most a second of samples however long
+# it stays open, and every listener of a session sees the same signal. Listeners
+# sleep between batches; under a gevent/eventlet worker one process serves hundreds.
+
+from flask import request, jsonify, Response, url_for
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import numpy as np
+
+from prediction_rules import PROBABILITY_NAMES
+from signal_synthesis import (synthesize_eeg, iter_beats, clean_probabilities, EEG_SAMPLE_RATE,
+                              MAX_SAMPLE_RATE, SLEEP_CYCLE_SECONDS, MAX_STREAM_SECONDS)
+
+# Batches per second sent by default, and the most a listener may ask for
+DEFAULT_STREAM_RATE = 10
+MAX_STREAM_RATE = 50
+
+# Sessions remembered at once; the oldest are forgotten beyond this
+MAX_SIGNAL_SESSIONS = 1000
+
+# Open streams per worker; further listeners get a 503
+MAX_STREAM_LISTENERS = int(os.environ.get('MAX_STREAM_LISTENERS', 200))
+
+# A reconnecting listener (Last-Event-ID) catches up on at most this many seconds
+MAX_CATCHUP_SECONDS = 30
+
+# Seconds of heartbeats synthesized per step of the beat model
+BEAT_BLOCK_SECONDS = 10
+
+# Milliseconds the browser waits before reconnecting a dropped stream
+STREAM_RETRY_MS = 2000
+
+
+class SignalSessions:
+    """Monitoring sessions (just their synthesis parameters) and the open stream count"""
+
+    def __init__(self, max_sessions=MAX_SIGNAL_SESSIONS, max_listeners=MAX_STREAM_LISTENERS):
+        self.max_sessions = max_sessions
+        self.max_listeners = max_listeners
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.listeners = 0
+        self.streams_opened = 0
+        self.rejected = 0
+
+    def create(self, prediction=None, probabilities=None, seed=None, cycle_seconds=SLEEP_CYCLE_SECONDS):
+        """Start a session now and return it; raises ValueError for a bad cycle length"""
+        cycle_seconds = float(cycle_seconds)
+        if not (cycle_seconds > 0 and np.isfinite(cycle_seconds)):
+            raise ValueError("cycle_seconds must be a positive number")
+        signal_session = {
+            'id': uuid.uuid4().hex,
+            'prediction': prediction or None,
+            'probabilities': clean_probabilities(probabilities),
+            'seed': int(seed) if seed is not None else random.getrandbits(31),
+            'cycle_seconds': cycle_seconds,
+            'started_at': time.time()
+        }
+        with self._lock:
+            self._sessions[signal_session['id']] = signal_session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return signal_session
+
+    def get(self, session_id):
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def acquire(self):
+        """Reserve a stream slot; False when the worker is at MAX_STREAM_LISTENERS"""
+        with self._lock:
+            if self.listeners >= self.max_listeners:
+                self.rejected += 1
+                return False
+            self.listeners += 1
+            self.streams_opened += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.listeners -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'listeners': self.listeners,
+                'max_listeners': self.max_listeners,
+                'streams_opened': self.streams_opened,
+                'rejected': self.rejected
+            }
+
+
+# Sessions shared by all requests in this Flask worker
+signal_sessions = SignalSessions()
+
+
+def iter_session_events(signal_session, rate=DEFAULT_STREAM_RATE, fs=EEG_SAMPLE_RATE, resume_sample=None,
+                        clock=time.time, sleep=time.sleep):
+    """Yield Server-Sent Events with the session's signals as they happen, `rate` per second.
+
+    Each event carries the EEG samples and heartbeats since the previous one. Its id is
+    the next sample index, which a reconnecting EventSource sends back as Last-Event-ID
+    to resume from there (up to MAX_CATCHUP_SECONDS back)."""
+    prediction = signal_session['prediction']
+    seed = signal_session['seed']
+    cycle_seconds = signal_session['cycle_seconds']
+    started_at = signal_session['started_at']
+
+    live = int((clock() - started_at) * fs)
+    position = live
+    if resume_sample is not None:
+        position = min(live, max(resume_sample, live - MAX_CATCHUP_SECONDS * fs))
+    end = int(MAX_STREAM_SECONDS * fs)
+    batch = max(1, fs // rate)
+
+    # The current second of EEG, and heartbeats synthesized but not sent yet
+    block_start, block = None, None
+    beats = iter_beats(prediction, position / fs, BEAT_BLOCK_SECONDS, signal_session['probabilities'], seed)
+    beat_times, rr_ms = next(beats)
+    beats_until = position / fs + BEAT_BLOCK_SECONDS
+
+    yield f"retry: {STREAM_RETRY_MS}\n\n"
+    while position < end:
+        target = min(position + batch, end)
+        wait = started_at + target / fs - clock()
+        if wait > 0:
+            sleep(wait)
+
+        eeg = []
+        k = position
+        while k < target:
+            if block_start is None or not block_start <= k < block_start + fs:
+                block_start = k - k % fs
+                block = np.round(synthesize_eeg(prediction, block_start / fs, 1.0, fs, seed, cycle_seconds), 2)
+            stop = min(target, block_start + fs)
+            eeg.extend(block[k - block_start:stop - block_start].tolist())
+            k = stop
+
+        end_time = target / fs
+        while beats_until < end_time:
+            more_times, more_rr = next(beats)
+            beat_times = np.concatenate((beat_times, more_times))
+            rr_ms = np.concatenate((rr_ms, more_rr))
+            beats_until += BEAT_BLOCK_SECONDS
+        due = np.searchsorted(beat_times, end_time)
+
+        data = {
+            't': position / fs,
+            'fs': fs,
+            'eeg': eeg,
+            'beat_times': np.round(beat_times[:due], 3).tolist(),
+            'rr_ms': np.round(rr_ms[:due], 1).tolist()
+        }
+        beat_times, rr_ms = beat_times[due:], rr_ms[due:]
+        position = target
+        yield f"id: {position}\ndata: {json.dumps(data)}\n\n"
+
+
+def add_signal_stream_routes(app):
+    """Add monitoring session and signal stream routes to the Flask app"""
+
+    @app.route('/api/signals/sessions', methods=['POST'])
+    def create_signal_session():
+        """Start a session from a JSON or form body: disorder (prediction text),
+        optional insomnia/apnea/rls probabilities, seed and cycle_seconds"""
+        data = request.get_json(silent=True) or request.form
+        try:
+            probabilities = {name: data[name] for name in PROBABILITY_NAMES if data.get(name) not in (None, '')}
+            signal_session = signal_sessions.create(
+                data.get('disorder'), probabilities, data.get('seed'),
+                data.get('cycle_seconds', SLEEP_CYCLE_SECONDS)
+            )
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(dict(signal_session,
+                            stream_url=url_for('stream_signal_session', session_id=signal_session['id']))), 201
+
+    @app.route('/api/signals/sessions/<session_id>/stream', methods=['GET'])
+    def stream_signal_session(session_id):
+        """text/event-stream of the session's signals; ?rate= batches per second, ?fs= EEG rate"""
+        signal_session = signal_sessions.get(session_id)
+        if signal_session is None:
+            return jsonify({'error': 'Unknown session id'}), 404
+        try:
+            rate = int(request.args.get('rate', DEFAULT_STREAM_RATE))
+            fs = int(request.args.get('fs', EEG_SAMPLE_RATE))
+            resume = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+            resume_sample = int(resume) if resume else None
+            if not 1 <= rate <= MAX_STREAM_RATE or not 1 <= fs <= MAX_SAMPLE_RATE:
+                raise ValueError(f"rate must be 1-{MAX_STREAM_RATE} and fs 1-{MAX_SAMPLE_RATE}")
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if not signal_sessions.acquire():
+            response = jsonify({'error': 'Too many open signal streams, try again shortly'})
+            response.headers['Retry-After'] = '5'
+            return response, 503
+
+        response = Response(iter_session_events(signal_session, rate, fs, resume_sample),
+                            mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        # Runs when the stream ends or the client goes away
+        response.call_on_close(signal_sessions.release)
+        return response
+
+    @app.route('/api/signals/sessions', methods=['GET'])
+    def signal_session_stats():
+        return jsonify(signal_sessions.stats())
@@ -0,0 +1,441 @@
+# Server-Side EEG/HRV Signal Synthesis
+# Generates whole epochs of simulated EEG at a real sampling rate (256 Hz by default)
+# and RR intervals as NumPy arrays, with the same disorder-specific band weights,
+# sleep-cycle staging and events the ECE monitor used to compute one sample per 100ms
+# tick in the browser. The browser now fetches epochs and only plots them.
+#
+# Random draws come from a counter-based hash of (seed, stream, tick), so any time
+# range can be generated on its own and adjacent ranges join up exactly.
+
+from flask import request, jsonify, Response
+import struct
+import numpy as np
+
+from prediction_rules import DISORDER_LABELS, PROBABILITY_NAMES
+
+# Default EEG sampling rate (Hz) and the highest one accepted
+EEG_SAMPLE_RATE = 256
+MAX_SAMPLE_RATE = 1024
+
+# Events, artifacts and HRV noise are drawn once per tick, the JS generator's update interval
+TICKS_PER_SECOND = 10
+
+# Length of one normal sleep cycle (N1 -> N2 -> N3 -> REM)
+SLEEP_CYCLE_SECONDS = 90 * 60
+
+# Scoring epoch length, the default request length
+EPOCH_SECONDS = 30
+
+# Longest range returned in one JSON/binary response; longer ranges use format=frames
+MAX_RESPONSE_SECONDS = 600
+
+# Longest range a frame stream covers (one night)
+MAX_STREAM_SECONDS = 12 * 3600
+
+# Latest time (start + seconds) a request can reach in a session
+MAX_SESSION_SECONDS = 24 * 3600
+
+# Ticks of the beat model integrated at a time on the way up to a request's start
+BEAT_PHASE_CHUNK_TICKS = 30 * 60 * TICKS_PER_SECOND
+
+# Seconds of EEG per streamed frame, and per block generated behind the stream
+FRAME_SECONDS = 1
+STREAM_BLOCK_SECONDS = 30
+
+# Frame header: start time (s) and sample count, followed by that many float32 samples
+FRAME_HEADER = struct.Struct('<dI')
+
+# Band amplitudes (uV) and frequencies (Hz): delta, theta, alpha, beta, gamma
+BAND_AMPLITUDES = (25.0, 15.0, 35.0, 10.0, 5.0)
+BAND_FREQUENCIES = (2.0, 6.0, 10.0, 20.0, 35.0)
+
+# Band weights without a prediction
+DEFAULT_WEIGHTS = (0.4, 0.3, 0.2, 0.1, 0.0)
+
+# Normal sleep stages: where each ends in the cycle, and its band weights
+SLEEP_STAGES = ('N1', 'N2', 'N3', 'REM')
+SLEEP_STAGE_ENDS = (0.1, 0.4, 0.7)
+SLEEP_STAGE_WEIGHTS = np.array([
+    [0.1, 0.4, 0.3, 0.2, 0.0],     # N1 - light sleep onset, prominent theta
+    [0.3, 0.4, 0.2, 0.1, 0.0],     # N2 - theta with sleep spindles
+    [0.7, 0.2, 0.05, 0.05, 0.0],   # N3 - deep sleep, strong delta
+    [0.1, 0.3, 0.3, 0.3, 0.0],     # REM - increased beta
+])
+
+# Apnea event/arousal/recovery cycle and RLS periodic limb movement cycle
+APNEA_CYCLE_SECONDS = 60
+RLS_CYCLE_SECONDS = 30
+
+# RR interval at 75 bpm, before the disorder-specific variation
+HRV_BASE_INTERVAL_MS = 60000 / 75
+
+# Shortest RR interval the beat model allows
+HRV_MIN_INTERVAL_MS = 300
+
+# Disorder probabilities that scale the HRV patterns when none are given
+DEFAULT_PROBABILITIES = {'normal': 0.5, 'insomnia': 0.25, 'apnea': 0.25, 'rls': 0.0}
+
+# Prediction text -> disorder key ('No sleeping disorder' -> 'normal', ...)
+DISORDER_KEYS = {label: name for label, name in zip(DISORDER_LABELS.values(), PROBABILITY_NAMES)}
+
+# Independent random streams
+_STREAM_EVENT, _STREAM_INTRUSION, _STREAM_ARTIFACT, _STREAM_ARTIFACT_TYPE, \
+    _STREAM_ARTIFACT_SIZE, _STREAM_NOISE, _STREAM_HRV, _STREAM_HRV_MOVEMENT, _STREAM_SPINDLE = range(9)
+
+
+def disorder_key(prediction):
+    """'normal', 'insomnia', 'apnea' or 'rls' for a prediction text, 'other' for
+    anything else and None without a prediction (matched like the JS includes())"""
+    if not prediction:
+        return None
+    for label, key in DISORDER_KEYS.items():
+        if label in prediction:
+            return key
+    return 'other'
+
+
+def uniform(seed, stream, index):
+    """Uniform [0, 1) draws for an array of integer indices (splitmix64 of seed, stream, index).
+
+    The same (seed, stream, index) always gives the same value."""
+    with np.errstate(over='ignore'):
+        key = np.uint64((seed * 0x9E3779B1 + stream * 0x85EBCA77) & 0xFFFFFFFFFFFFFFFF)
+        z = np.asarray(index).astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15) + key
+        z ^= z >> np.uint64(30)
+        z *= np.uint64(0xBF58476D1CE4E5B9)
+        z ^= z >> np.uint64(27)
+        z *= np.uint64(0x94D049BB133111EB)
+        z ^= z >> np.uint64(31)
+    return (z >> np.uint64(11)) * (1.0 / (1 << 53))
+
+
+def clean_probabilities(probabilities=None):
+    """Disorder probabilities with missing, NaN or out-of-range values fixed up"""
+    cleaned = dict(DEFAULT_PROBABILITIES)
+    for name, value in (probabilities or {}).items():
+        if name in cleaned and value is not None:
+            value = float(value)
+            cleaned[name] = 0.0 if np.isnan(value) else min(max(value, 0.0), 1.0)
+    return cleaned
+
+
+def eeg_band_weights(key, t, cycle_seconds=SLEEP_CYCLE_SECONDS):
+    """Per-sample (delta, theta, alpha, beta, gamma) weights and the artifact probability"""
+    if key == 'normal':
+        stage = np.searchsorted(SLEEP_STAGE_ENDS, (t % cycle_seconds) / cycle_seconds, side='right')
+        return list(SLEEP_STAGE_WEIGHTS[stage].T), 0.0
+
+    if key == 'insomnia':
+        # Hyperarousal: little delta, intrusive alpha and elevated beta following stress
+        stress = np.sin(t / 10) * 0.3 + 0.7
+        return [0.1, 0.2, 0.3 + stress * 0.1, 0.3 + stress * 0.1, 0.1 * stress], 0.0
+
+    if key == 'apnea':
+        phase = (t % APNEA_CYCLE_SECONDS) / APNEA_CYCLE_SECONDS
+        event = phase < 0.6
+        arousal = (phase >= 0.6) & (phase < 0.7)
+        progress = phase / 0.6           # Progressive hypoxia during the event
+        recovery = (phase - 0.7) / 0.3   # Return to sleep after the arousal
+
+        def piecewise(during, arousing, recovering):
+            return np.where(event, during, np.where(arousal, arousing, recovering))
+
+        return [
+            piecewise(0.4 * (1 - progress), 0.1, 0.1 + 0.3 * recovery),
+            piecewise(0.3, 0.2, 0.2 + 0.1 * recovery),
+            piecewise(0.1 + 0.1 * progress, 0.3, 0.3 - 0.1 * recovery),
+            piecewise(0.1 + 0.2 * progress, 0.3, 0.3 - 0.2 * recovery),
+            piecewise(0.1 * progress, 0.1, 0.1 * (1 - recovery)),
+        ], 0.2
+
+    if key == 'rls':
+        movement = (t % RLS_CYCLE_SECONDS) / RLS_CYCLE_SECONDS < 0.1
+        weights = [np.where(movement, during, between) for during, between in
+                   zip((0.1, 0.2, 0.3, 0.3, 0.1), (0.3, 0.3, 0.2, 0.2, 0.0))]
+        return weights, np.where(movement, 0.5, 0.1)
+
+    return list(DEFAULT_WEIGHTS), 0.0
+
+
+def eeg_events(key, t, draw, cycle_seconds=SLEEP_CYCLE_SECONDS):
+    """Spindles, micro-arousals, arousal bursts, K-complexes and movement artifacts"""
+    events = np.zeros_like(t)
+    if key == 'normal':
+        stage = np.searchsorted(SLEEP_STAGE_ENDS, (t % cycle_seconds) / cycle_seconds, side='right')
+        # 12-14 Hz sleep spindles in N2: a waxing and waning burst filling 20% of the seconds
+        spindle = (stage == 1) & (draw(_STREAM_SPINDLE, np.floor(t).astype(np.int64)) < 0.2)
+        events += np.where(spindle, 20 * np.sin(2 * np.pi * 13 * t) * np.sin(np.pi * (t % 1)) ** 2, 0.0)
+
+    elif key == 'insomnia':
+        arousal = draw(_STREAM_EVENT) < 0.15
+        events += np.where(arousal, 25 * np.sin(2 * np.pi * 15 * t) * np.exp(-(t % 0.5) * 5), 0.0)
+        # Alpha-delta sleep
+        intrusion = draw(_STREAM_INTRUSION) < 0.3
+        events += np.where(intrusion, 15 * np.sin(2 * np.pi * 10 * t) * np.sin(2 * np.pi * 2 * t), 0.0)
+
+    elif key == 'apnea':
+        phase = (t % APNEA_CYCLE_SECONDS) / APNEA_CYCLE_SECONDS
+        arousal = (phase >= 0.6) & (phase < 0.7)
+        events += np.where(arousal, 30 * np.sin(2 * np.pi * 12 * t) * np.exp(-(phase - 0.6) * 50), 0.0)
+        k_complex = (phase > 0.8) & (draw(_STREAM_EVENT) < 0.1)
+        events += np.where(k_complex, 40 * np.exp(-(t % 0.3) * 15) - 20, 0.0)
+
+    elif key == 'rls':
+        phase = (t % RLS_CYCLE_SECONDS) / RLS_CYCLE_SECONDS
+        events += np.where(phase < 0.1, 50 * np.sin(2 * np.pi * 5 * t) * np.exp(-phase * 30), 0.0)
+
+    return events
+
+
+def synthesize_eeg(prediction=None, start=0.0, seconds=EPOCH_SECONDS, fs=EEG_SAMPLE_RATE, seed=0,
+                   cycle_seconds=SLEEP_CYCLE_SECONDS):
+    """Simulated EEG (uV, float32) for [start, start + seconds) of a session at fs Hz.
+
+    start is rounded to the sample grid; splitting a range into pieces gives the same samples."""
+    key = disorder_key(prediction)
+    first = int(round(start * fs))
+    k = np.arange(first, first + int(round(seconds * fs)), dtype=np.int64)
+    t = k / fs
+    tick = k * TICKS_PER_SECOND // fs
+
+    def draw(stream, index=tick):
+        return uniform(seed, stream, index)
+
+    weights, artifact_probability = eeg_band_weights(key, t, cycle_seconds)
+    signal = eeg_events(key, t, draw, cycle_seconds)
+    for weight, amplitude, frequency in zip(weights, BAND_AMPLITUDES, BAND_FREQUENCIES):
+        signal += weight * amplitude * np.sin(2 * np.pi * frequency * t)
+
+    # Muscle (50 Hz), movement (offset) and electrode pop (step) artifacts
+    if np.any(artifact_probability):
+        hit = draw(_STREAM_ARTIFACT) < artifact_probability
+        kind = (draw(_STREAM_ARTIFACT_TYPE) * 3).astype(np.int8)
+        size = draw(_STREAM_ARTIFACT_SIZE)
+        artifact = np.select([kind == 0, kind == 1],
+                             [20 * size * np.sin(2 * np.pi * 50 * t), 40 * (size - 0.5)],
+                             30 * np.sign(size - 0.5))
+        signal += np.where(hit, artifact, 0.0)
+
+    # Physiological noise, stronger with a disorder
+    noise_factor = 15 if key not in (None, 'normal') else 8
+    signal += (uniform(seed, _STREAM_NOISE, k) - 0.5) * noise_factor
+    return signal.astype(np.float32)
+
+
+def stage_labels(prediction, times, cycle_seconds=SLEEP_CYCLE_SECONDS):
+    """Sleep stage or disorder phase name at each time"""
+    key = disorder_key(prediction)
+    times = np.asarray(times, dtype=np.float64)
+    if key == 'normal':
+        stage = np.searchsorted(SLEEP_STAGE_ENDS, (times % cycle_seconds) / cycle_seconds, side='right')
+        return [SLEEP_STAGES[i] for i in stage]
+    if key == 'insomnia':
+        return ['hyperarousal'] * len(times)
+    if key == 'apnea':
+        phase = (times % APNEA_CYCLE_SECONDS) / APNEA_CYCLE_SECONDS
+        return [('apnea', 'arousal', 'recovery')[i] for i in np.searchsorted((0.6, 0.7), phase, side='right')]
+    if key == 'rls':
+        phase = (times % RLS_CYCLE_SECONDS) / RLS_CYCLE_SECONDS
+        return ['movement' if p < 0.1 else 'between' for p in phase]
+    return ['unstaged'] * len(times)
+
+
+def rr_variation(key, t, tick, probabilities, seed=0):
+    """RR interval deviation (ms) from HRV_BASE_INTERVAL_MS at each tick time"""
+    apnea_weight = probabilities['apnea']
+    insomnia_weight = probabilities['insomnia']
+    rls_weight = probabilities['rls']
+    r = uniform(seed, _STREAM_HRV, tick)
+
+    if key == 'apnea':
+        phase = np.sin(t / 4)
+        cycle = np.sin(t / 15)
+        respiratory = np.sin(t * 0.8) * 20  # Respiratory sinus arrhythmia
+        severity = 0.7 + apnea_weight * 0.3
+        # Slowing during the apnea episode, faster and more variable afterwards
+        episode = np.sin(t / 2) * 200 * severity + np.sin(t * 3) * 50 * severity + r * 50
+        compensation = (np.sin(t / 3) * 50 + np.sin(t * 5) * 80 + r * 30) * (1 + apnea_weight)
+        transition = (np.sin(t / 5) * 80 + respiratory + r * 40) * (1 + cycle * apnea_weight)
+        return np.where(phase > 0.7, episode, np.where(phase < -0.7, compensation, transition))
+
+    if key == 'insomnia':
+        stress = np.sin(t / 10) * 0.5 + 0.5
+        arousal = np.cos(t / 8) * 0.3 + 0.7
+        sympathetic = np.sin(t / 6) * 0.4 + 0.6
+        return (np.sin(t) * 100 * stress + np.cos(t * 2) * 50 * arousal
+                + np.sin(t * 0.5) * 30 * sympathetic + r * 70 * (0.5 + insomnia_weight * 0.5))
+
+    if key == 'rls':
+        movement_phase = np.sin(t / 20)
+        moving = uniform(seed, _STREAM_HRV_MOVEMENT, tick) < 0.15 + rls_weight * 0.2
+        # Leg movement: brief acceleration, deceleration, then back to baseline
+        intensity = 150 + rls_weight * 100
+        mt = t % 10
+        movement = np.where(mt < 1, intensity * (1 - mt) + r * 50,
+                            np.where(mt < 3, -intensity * 0.5 * (mt - 1) / 2 + r * 70, np.sin(mt) * 50 + r * 40))
+        baseline = (np.sin(t / 3) * 70 + np.cos(t / 6) * 30 + np.sin(t / 12) * 50 * movement_phase
+                    + r * 50) * (1 + movement_phase * rls_weight)
+        return np.where(moving, movement, baseline)
+
+    # Normal HRV with respiratory sinus arrhythmia and a slow circadian drift
+    circadian = np.sin(t / 300) * 0.3 + 0.7
+    return (np.sin(t / 6) * 60 + np.sin(t / 10) * 30 + np.sin(t * 0.75) * 40 + r * 20) * circadian
+
+
+def integrate_beats(key, first_tick, end_tick, phase_start, last_beat, probabilities, seed=0):
+    """Beats between two ticks, given the beat model's phase and the last beat time at
+    first_tick (None before the first beat). Returns (beat_times, rr_ms, phase, last_beat)
+    with the phase and last beat at end_tick; rr_ms is NaN for the session's first beat."""
+    tick = np.arange(first_tick, end_tick + 1, dtype=np.int64)
+    t = tick / TICKS_PER_SECOND
+    rr = np.maximum(HRV_BASE_INTERVAL_MS + rr_variation(key, t, tick, probabilities, seed),
+                    HRV_MIN_INTERVAL_MS)
+
+    # Beats happen where the accumulated phase (seconds / RR) crosses a whole number
+    phase = phase_start + np.concatenate(([0.0], np.cumsum(1000.0 / rr[:-1] / TICKS_PER_SECOND)))
+    beat_times = np.interp(np.arange(int(phase[0]) + 1, int(phase[-1]) + 1), phase, t)
+    previous = np.array([last_beat if last_beat is not None else np.nan])
+    rr_ms = np.diff(np.concatenate((previous, beat_times))) * 1000
+    if len(beat_times):
+        last_beat = beat_times[-1]
+    return beat_times, rr_ms, phase[-1], last_beat
+
+
+def iter_beats(prediction=None, start=0.0, seconds=EPOCH_SECONDS, probabilities=None, seed=0):
+    """Yield (beat_times, rr_ms) for consecutive blocks of about `seconds` from start on.
+
+    The RR interval curve sampled every tick drives an integral pulse frequency model
+    from the start of the session, so the beats at a given time don't depend on where
+    a request starts. The model is integrated up to the start in fixed chunks of
+    BEAT_PHASE_CHUNK_TICKS (so memory doesn't grow with start), then block by block."""
+    key = disorder_key(prediction)
+    probabilities = clean_probabilities(probabilities)
+    first_tick, phase_start, last_beat = 0, 0.0, None
+    start_tick = int(np.floor(start * TICKS_PER_SECOND))
+    while first_tick + BEAT_PHASE_CHUNK_TICKS <= start_tick:
+        end_tick = first_tick + BEAT_PHASE_CHUNK_TICKS
+        _, _, phase_start, last_beat = integrate_beats(key, first_tick, end_tick, phase_start, last_beat,
+                                                       probabilities, seed)
+        first_tick = end_tick
+
+    block_end = start + seconds
+    while True:
+        # Blocks end on a tick so the phase can be carried over exactly
+        end_tick = int(np.ceil(block_end * TICKS_PER_SECOND))
+        beat_times, rr_ms, phase_end, last_beat = integrate_beats(key, first_tick, end_tick, phase_start,
+                                                                  last_beat, probabilities, seed)
+
+        # The session's first beat has no interval
+        keep = (beat_times >= start) & ~np.isnan(rr_ms)
+        yield beat_times[keep], rr_ms[keep]
+        first_tick, phase_start = end_tick, phase_end
+        block_end += seconds
+
+
+def synthesize_rr(prediction=None, start=0.0, seconds=EPOCH_SECONDS, probabilities=None, seed=0):
+    """Simulated heartbeats in [start, start + seconds) of a session as (beat_times, rr_ms)"""
+    beat_times, rr_ms = next(iter_beats(prediction, start, seconds, probabilities, seed))
+    keep = beat_times < start + seconds
+    return beat_times[keep], rr_ms[keep]
+
+
+def iter_eeg_frames(prediction=None, start=0.0, seconds=EPOCH_SECONDS, fs=EEG_SAMPLE_RATE, seed=0,
+                    cycle_seconds=SLEEP_CYCLE_SECONDS):
+    """Yield binary frames (FRAME_HEADER + float32 samples) of FRAME_SECONDS each.
+
+    Only one STREAM_BLOCK_SECONDS block is held in memory at a time."""
+    frame = FRAME_SECONDS * fs
+    first = int(round(start * fs))
+    end = first + int(round(seconds * fs))
+    block = STREAM_BLOCK_SECONDS * fs
+    for block_start in range(first, end, block):
+        samples = synthesize_eeg(prediction, block_start / fs, min(block, end - block_start) / fs, fs, seed,
+                                 cycle_seconds)
+        for offset in range(0, len(samples), frame):
+            chunk = samples[offset:offset + frame]
+            yield FRAME_HEADER.pack((block_start + offset) / fs, len(chunk)) + chunk.astype('<f4').tobytes()
+
+
+def read_signal_args():
+    """Validated synthesis parameters from the query string; raises ValueError"""
+    args = request.args
+    fs = int(args.get('fs', EEG_SAMPLE_RATE))
+    start = float(args.get('start', 0))
+    seconds = float(args.get('seconds', EPOCH_SECONDS))
+    if not 1 <= fs <= MAX_SAMPLE_RATE:
+        raise ValueError(f"fs must be between 1 and {MAX_SAMPLE_RATE}")
+    # Written so NaN and infinity fail the checks too
+    if not (seconds > 0 and seconds <= MAX_STREAM_SECONDS):
+        raise ValueError(f"seconds must be between 0 and {MAX_STREAM_SECONDS}")
+    if not (start >= 0 and start + seconds <= MAX_SESSION_SECONDS):
+        raise ValueError(f"start must be >= 0 and start + seconds at most {MAX_SESSION_SECONDS}")
+    cycle_seconds = float(args.get('cycle_seconds', SLEEP_CYCLE_SECONDS))
+    if not (cycle_seconds > 0 and np.isfinite(cycle_seconds)):
+        raise ValueError("cycle_seconds must be a positive number")
+    probabilities = {name: args[name] for name in PROBABILITY_NAMES if args.get(name) not in (None, '')}
+    return {
+        'prediction': args.get('disorder') or None,
+        'start': start,
+        'seconds': seconds,
+        'fs': fs,
+        'seed': int(args.get('seed', 0)),
+        'cycle_seconds': cycle_seconds,
+        'probabilities': clean_probabilities(probabilities),
+    }
+
+
+def add_signal_routes(app):
+    """Add EEG/HRV signal synthesis routes to the Flask app"""
+
+    @app.route('/api/signals/eeg', methods=['GET'])
+    def signals_eeg():
+        """EEG for ?disorder=<prediction>&start=&seconds=&fs=&seed= as JSON (format=json),
+        raw float32 little-endian (format=binary) or a chunked stream of frames (format=frames)"""
+        try:
+            params = read_signal_args()
+            output = request.args.get('format', 'json')
+            eeg_args = (params['prediction'], params['start'], params['seconds'], params['fs'],
+                        params['seed'], params['cycle_seconds'])
+            headers = {'X-Sample-Rate': str(params['fs']),
+                       'X-Start-Seconds': str(round(params['start'] * params['fs']) / params['fs'])}
+
+            if output == 'frames':
+                headers['X-Frame-Header'] = FRAME_HEADER.format
+                return Response(iter_eeg_frames(*eeg_args), mimetype='application/octet-stream', headers=headers)
+
+            if params['seconds'] > MAX_RESPONSE_SECONDS:
+                return jsonify({'error': f"Ranges over {MAX_RESPONSE_SECONDS} seconds need format=frames"}), 400
+            eeg = synthesize_eeg(*eeg_args)
+            if output == 'binary':
+                return Response(eeg.astype('<f4').tobytes(), mimetype='application/octet-stream', headers=headers)
+
+            seconds = np.arange(params['start'], params['start'] + params['seconds'])
+            return jsonify({
+                'fs': params['fs'],
+                'start': float(headers['X-Start-Seconds']),
+                'eeg': np.round(eeg, 3).tolist(),
+                'stages': stage_labels(params['prediction'], seconds, params['cycle_seconds'])
+            })
+
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    @app.route('/api/signals/hrv', methods=['GET'])
+    def signals_hrv():
+        """Heartbeat times and RR intervals for ?disorder=&start=&seconds=&seed= and
+        optional insomnia/apnea/rls probabilities"""
+        try:
+            params = read_signal_args()
+            if params['seconds'] > MAX_RESPONSE_SECONDS:
+                return jsonify({'error': f"Ranges over {MAX_RESPONSE_SECONDS} seconds are not supported"}), 400
+            beat_times, rr_ms = synthesize_rr(params['prediction'], params['start'], params['seconds'],
+                                              params['probabilities'], params['seed'])
+            return jsonify({
+                'start': params['start'],
+                'beat_times': np.round(beat_times, 4).tolist(),
+                'rr_ms': np.round(rr_ms, 2).tolist(),
+                'probabilities': params['probabilities']
+            })
+
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
@@ -7,7 +7,7 @@ class ECEProcessor {
         this.sleepPosition = 'supine';
         this.respiratoryPattern = 'normal';
         this.isMonitoring = false;
-        this.updateInterval = 100; // Update every 100ms
+        this.updateInterval = 100; // Signal batch every 100ms
         this.probabilities = {
             normal: 0.50,  // Initialize with more accurate baseline probabilities
             insomnia: 0.25,
@@ -15,286 +15,54 @@ class ECEProcessor {
             rls: 0
         };
         this.lastPrediction = null;
+        this.signalRate = 256;       // EEG samples per second streamed from the server
+        this.eegWindowSeconds = 4;   // Seconds of EEG shown on the canvas
+        this.signalSession = null;
+        this.eventSource = null;
     }
 
-    // Generate simulated EEG data with clinically accurate sleep stage characteristics based on disorder prediction
-    generateEEGData() {
-        const time = Date.now() / 1000;
-        let signal = 0;
-        
-        // Base frequency components with enhanced clinical accuracy
-        const delta = 25 * Math.sin(2 * Math.PI * 2 * time);  // Delta waves (0.5-4 Hz) - deep sleep
-        const theta = 15 * Math.sin(2 * Math.PI * 6 * time);  // Theta waves (4-8 Hz) - drowsiness/light sleep
-        const alpha = 35 * Math.sin(2 * Math.PI * 10 * time); // Alpha waves (8-13 Hz) - relaxed wakefulness
-        const beta = 10 * Math.sin(2 * Math.PI * 20 * time);  // Beta waves (13-30 Hz) - alert wakefulness
-        const gamma = 5 * Math.sin(2 * Math.PI * 35 * time);  // Gamma waves (>30 Hz) - cognitive processing
-        
-        // Adjust wave weights based on sleep disorder with clinical accuracy
-        let deltaWeight = 0.4;
-        let thetaWeight = 0.3;
-        let alphaWeight = 0.2;
-        let betaWeight = 0.1;
-        let gammaWeight = 0.0;
-        let artifactProbability = 0.0;
-        
-        if (this.lastPrediction) {
-            if (this.lastPrediction.includes('No sleeping disorder')) {
-                // Normal sleep: Clinically accurate wave distribution for healthy sleep cycles
-                // Sleep cycles typically progress from N1→N2→N3→REM
-                const sleepCycle = (time % 90) / 90; // 90-minute sleep cycle simulation
-                
-                if (sleepCycle < 0.1) { // N1 - Light sleep onset
-                    deltaWeight = 0.1;
-                    thetaWeight = 0.4; // Prominent theta in N1
-                    alphaWeight = 0.3; // Alpha still present but diminishing
-                    betaWeight = 0.2;
-                    gammaWeight = 0.0;
-                } else if (sleepCycle < 0.4) { // N2 - Established light sleep
-                    deltaWeight = 0.3;
-                    thetaWeight = 0.4; // Strong theta with sleep spindles
-                    alphaWeight = 0.2;
-                    betaWeight = 0.1;
-                    gammaWeight = 0.0;
-                    // Add sleep spindles (12-14 Hz bursts)
-                    if (Math.random() < 0.2) {
-                        signal += 20 * Math.sin(2 * Math.PI * 13 * time) * Math.exp(-((time % 1) * 10));
-                    }
-                } else if (sleepCycle < 0.7) { // N3 - Deep sleep
-                    deltaWeight = 0.7; // Strong delta in deep sleep
-                    thetaWeight = 0.2;
-                    alphaWeight = 0.05;
-                    betaWeight = 0.05;
-                    gammaWeight = 0.0;
-                } else { // REM sleep
-                    deltaWeight = 0.1;
-                    thetaWeight = 0.3;
-                    alphaWeight = 0.3;
-                    betaWeight = 0.3; // Increased beta during REM
-                    gammaWeight = 0.0;
-                }
-            } else if (this.lastPrediction.includes('Insomnia')) {
-                // Insomnia: Clinically accurate pattern showing hyperarousal
-                // Features: Reduced slow waves, increased fast activity, sleep onset difficulties
-                const stressLevel = Math.sin(time / 10) * 0.3 + 0.7; // Fluctuating stress/arousal
-                
-                deltaWeight = 0.1; // Significantly reduced delta (deep sleep deficit)
-                thetaWeight = 0.2; // Reduced theta
-                alphaWeight = 0.3 + (stressLevel * 0.1); // Intrusive alpha - alpha-delta intrusion
-                betaWeight = 0.3 + (stressLevel * 0.1); // Elevated beta - hyperarousal
-                gammaWeight = 0.1 * stressLevel; // Some gamma activity during stress peaks
-                
-                // Add micro-arousals characteristic of insomnia
-                if (Math.random() < 0.15) {
-                    signal += 25 * Math.sin(2 * Math.PI * 15 * time) * Math.exp(-((time % 0.5) * 5));
-                }
-                
-                // Add alpha intrusions into delta (alpha-delta sleep)
-                if (Math.random() < 0.3) {
-                    signal += 15 * Math.sin(2 * Math.PI * 10 * time) * Math.sin(2 * Math.PI * 2 * time);
-                }
-            } else if (this.lastPrediction.includes('Sleep Apnea')) {
-                // Sleep Apnea: Clinically accurate pattern showing respiratory disturbance
-                // Features: Cyclic variation with arousals, sleep fragmentation
-                const apneaCycle = time % 60; // Typical 1-minute apnea cycle
-                const apneaPhase = apneaCycle / 60; // 0-1 range for cycle phase
-                
-                if (apneaPhase < 0.6) { // During apnea event - progressive hypoxia
-                    // Gradual shift from normal sleep to disturbed pattern
-                    const progressFactor = apneaPhase / 0.6; // 0-1 range for progression
-                    
-                    deltaWeight = 0.4 * (1 - progressFactor); // Delta decreases during apnea
-                    thetaWeight = 0.3;
-                    alphaWeight = 0.1 + (0.1 * progressFactor); // Alpha intrusion increases
-                    betaWeight = 0.1 + (0.2 * progressFactor); // Beta increases with stress
-                    gammaWeight = 0.1 * progressFactor; // Some gamma with arousal
-                } else if (apneaPhase < 0.7) { // Arousal/awakening after apnea
-                    // Sudden shift to arousal pattern
-                    deltaWeight = 0.1; // Sharp drop in delta
-                    thetaWeight = 0.2;
-                    alphaWeight = 0.3; // Alpha surge during arousal
-                    betaWeight = 0.3; // Beta surge during arousal
-                    gammaWeight = 0.1; // Some gamma during arousal
-                    
-                    // Add arousal burst
-                    signal += 30 * Math.sin(2 * Math.PI * 12 * time) * Math.exp(-((apneaPhase - 0.6) * 50));
-                } else { // Recovery after arousal
-                    // Gradual return to sleep pattern
-                    const recoveryFactor = (apneaPhase - 0.7) / 0.3; // 0-1 range for recovery
-                    
-                    deltaWeight = 0.1 + (0.3 * recoveryFactor); // Delta gradually recovers
-                    thetaWeight = 0.2 + (0.1 * recoveryFactor);
-                    alphaWeight = 0.3 - (0.1 * recoveryFactor); // Alpha gradually decreases
-                    betaWeight = 0.3 - (0.2 * recoveryFactor); // Beta gradually decreases
-                    gammaWeight = 0.1 * (1 - recoveryFactor); // Gamma fades
-                }
-                
-                // Add occasional K-complexes during lighter sleep phases
-                if (apneaPhase > 0.8 && Math.random() < 0.1) {
-                    signal += 40 * Math.exp(-((time % 0.3) * 15)) - 20;
-                }
-                
-                // Higher artifact probability during apnea events
-                artifactProbability = 0.2;
-            } else if (this.lastPrediction.includes('RLS')) {
-                // RLS: Clinically accurate pattern showing periodic limb movements
-                // Features: Movement artifacts, sleep fragmentation, periodic patterns
-                const rlsCycle = time % 30; // Typical 30-second periodicity in PLMS
-                const rlsPhase = rlsCycle / 30; // 0-1 range for cycle phase
-                
-                if (rlsPhase < 0.1) { // During limb movement
-                    deltaWeight = 0.1; // Reduced delta during movement
-                    thetaWeight = 0.2;
-                    alphaWeight = 0.3; // Alpha intrusion during arousal
-                    betaWeight = 0.3; // Increased beta during movement/arousal
-                    gammaWeight = 0.1; // Some gamma during movement
-                    
-                    // Add movement artifact
-                    signal += 50 * Math.sin(2 * Math.PI * 5 * time) * Math.exp(-((rlsPhase) * 30));
-                    artifactProbability = 0.5; // High artifact probability during movement
-                } else { // Between movements
-                    // More normal sleep pattern but still disrupted
-                    deltaWeight = 0.3; // Reduced delta overall due to fragmentation
-                    thetaWeight = 0.3;
-                    alphaWeight = 0.2;
-                    betaWeight = 0.2; // Elevated beta between movements
-                    gammaWeight = 0.0;
-                    artifactProbability = 0.1; // Some artifacts between movements
-                }
-            }
-        }
-        
-        // Combine waves with disorder-specific weights
-        signal = delta * deltaWeight + 
-                 theta * thetaWeight + 
-                 alpha * alphaWeight + 
-                 beta * betaWeight + 
-                 gamma * gammaWeight;
-        
-        // Add clinically realistic artifacts based on disorder
-        if (Math.random() < artifactProbability) {
-            // Simulate various artifacts: muscle, movement, electrode pop
-            const artifactType = Math.floor(Math.random() * 3);
-            if (artifactType === 0) { // Muscle artifact (high frequency)
-                signal += 20 * Math.random() * Math.sin(2 * Math.PI * 50 * time);
-            } else if (artifactType === 1) { // Movement artifact (large amplitude shift)
-                signal += 40 * (Math.random() - 0.5);
-            } else { // Electrode artifact (sudden jump)
-                signal += 30 * Math.sign(Math.random() - 0.5);
-            }
-        }
-        
-        // Add physiologically appropriate noise level based on disorder
-        const noiseFactor = this.lastPrediction && !this.lastPrediction.includes('No sleeping disorder') ? 15 : 8;
-        signal += (Math.random() - 0.5) * noiseFactor;
-        
-        return signal;
+    // Start a server-side monitoring session for the current prediction. Its EEG and
+    // heartbeats are synthesized on the server and pushed to the page over
+    // Server-Sent Events (/api/signals/sessions/<id>/stream)
+    createSignalSession() {
+        this.closeSignalStream();
+        this.signalSession = null;
+        const token = {};
+        this.sessionToken = token;
+
+        fetch('/api/signals/sessions', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                disorder: this.lastPrediction || '',
+                insomnia: this.probabilities.insomnia,
+                apnea: this.probabilities.apnea,
+                rls: this.probabilities.rls
+            })
+        }).then(response => response.json()).then(session => {
+            // Ignore a session superseded by a newer prediction while it was being created
+            if (this.sessionToken !== token) return;
+            this.signalSession = session;
+            if (this.isMonitoring) this.openSignalStream();
+        }).catch(error => {
+            console.error('Error creating signal session:', error);
+        });
     }
 
-    // Generate simulated HRV data with enhanced sleep disorder characteristics and improved accuracy
-    generateHRVData() {
-        const baseInterval = 60000 / 75; // Base RR interval for 75 bpm
-        let variation = 0;
-        const time = Date.now() / 1000;
-        
-        // Get disorder probability weights for more accurate patterns
-        const apneaWeight = this.probabilities.apnea;
-        const insomniaWeight = this.probabilities.insomnia;
-        const rlsWeight = this.probabilities.rls;
-        
-        // Ensure weights are valid numbers with improved validation
-        const safeApneaWeight = isNaN(apneaWeight) || apneaWeight < 0 ? 0 : (apneaWeight > 1 ? 1 : apneaWeight);
-        const safeInsomniaWeight = isNaN(insomniaWeight) || insomniaWeight < 0 ? 0 : (insomniaWeight > 1 ? 1 : insomniaWeight);
-        const safeRlsWeight = isNaN(rlsWeight) || rlsWeight < 0 ? 0 : (rlsWeight > 1 ? 1 : rlsWeight);
-        
-        // Adjust HRV based on sleep disorder probabilities and prediction
-        if (this.lastPrediction && this.lastPrediction.includes('Sleep Apnea')) {
-            // Enhanced sleep apnea pattern simulation with more realistic patterns
-            const apneaPhase = Math.sin(time / 4);
-            const apneaCycle = Math.sin(time / 15); // Longer cycle for overall pattern
-            const respiratoryOscillation = Math.sin(time * 0.8) * 20; // Respiratory sinus arrhythmia
-            
-            if (apneaPhase > 0.7) {
-                // Severe apnea episode - longer RR intervals with characteristic pattern
-                // During apnea, heart rate initially slows, then becomes erratic
-                const apneaSeverity = 0.7 + (safeApneaWeight * 0.3); // Scale severity with probability
-                variation = (
-                    Math.sin(time / 2) * 200 * apneaSeverity + 
-                    Math.sin(time * 3) * 50 * apneaSeverity + // High-frequency component
-                    Math.random() * 50
-                );
-            } else if (apneaPhase < -0.7) {
-                // Post-apnea compensation - rapid heart rate with increased variability
-                // After apnea, heart rate typically increases rapidly
-                variation = (
-                    Math.sin(time / 3) * 50 + 
-                    Math.sin(time * 5) * 80 + // Faster oscillation post-apnea
-                    Math.random() * 30
-                ) * (1 + safeApneaWeight);
-            } else {
-                // Transition phase with respiratory sinus arrhythmia
-                variation = (
-                    Math.sin(time / 5) * 80 + 
-                    respiratoryOscillation +
-                    Math.random() * 40
-                ) * (1 + apneaCycle * safeApneaWeight);
-            }
-        } else if (this.lastPrediction && this.lastPrediction.includes('Insomnia')) {
-            // Enhanced insomnia pattern with stress indicators and autonomic activation
-            const stressFactor = Math.sin(time / 10) * 0.5 + 0.5; // Stress variation
-            const arousalFactor = Math.cos(time / 8) * 0.3 + 0.7; // Arousal level
-            const sympatheticTone = Math.sin(time / 6) * 0.4 + 0.6; // Sympathetic nervous system activation
-            
-            // Insomnia typically shows reduced HRV with higher frequency components
-            variation = (
-                Math.sin(time) * 100 * stressFactor + // Fast oscillation
-                Math.cos(time * 2) * 50 * arousalFactor + // Even faster component
-                Math.sin(time * 0.5) * 30 * sympatheticTone + // Slower background rhythm
-                Math.random() * 70 * (0.5 + safeInsomniaWeight * 0.5) // Noise increases with severity
-            );
-        } else if (this.lastPrediction && this.lastPrediction.includes('RLS')) {
-            // Enhanced RLS pattern with periodic leg movements and associated heart rate changes
-            const movementPhase = Math.sin(time / 20); // Overall movement pattern
-            const movementProbability = 0.15 + (safeRlsWeight * 0.2); // Increased probability with RLS severity
-            
-            if (Math.random() < movementProbability) {
-                // Leg movement with characteristic heart rate response
-                // Typically a brief acceleration followed by deceleration
-                const movementIntensity = 150 + (safeRlsWeight * 100);
-                const movementTime = time % 10; // Reset for each movement
-                
-                if (movementTime < 1) {
-                    // Initial acceleration
-                    variation = movementIntensity * (1 - movementTime) + Math.random() * 50;
-                } else if (movementTime < 3) {
-                    // Deceleration
-                    variation = -movementIntensity * 0.5 * (movementTime - 1) / 2 + Math.random() * 70;
-                } else {
-                    // Return to baseline
-                    variation = Math.sin(movementTime) * 50 + Math.random() * 40;
-                }
-            } else {
-                // Baseline with subtle variations and occasional disruptions
-                variation = (
-                    Math.sin(time / 3) * 70 + 
-                    Math.cos(time / 6) * 30 + 
-                    Math.sin(time / 12) * 50 * movementPhase + // Slower oscillation
-                    Math.random() * 50
-                ) * (1 + movementPhase * safeRlsWeight);
-            }
-        } else {
-            // Normal HRV pattern with natural variations including respiratory sinus arrhythmia
-            const circadianFactor = Math.sin(time / 300) * 0.3 + 0.7; // Long-term variation
-            const respiratoryComponent = Math.sin(time * 0.75) * 40; // Respiratory influence
-            
-            variation = (
-                Math.sin(time / 6) * 60 + // Low frequency component
-                Math.sin(time / 10) * 30 + // Very low frequency
-                respiratoryComponent + // High frequency (respiratory)
-                Math.random() * 20 // Small random component
-            ) * circadianFactor;
+    // Listen to the session's stream (EventSource reconnects by itself and resumes from the last batch)
+    openSignalStream() {
+        if (!this.signalSession || this.eventSource) return;
+        const rate = Math.round(1000 / this.updateInterval);
+        this.eventSource = new EventSource(`${this.signalSession.stream_url}?rate=${rate}&fs=${this.signalRate}`);
+        this.eventSource.onmessage = event => this.updateData(JSON.parse(event.data));
+        this.eventSource.onerror = () => console.warn('Signal stream interrupted, reconnecting');
+    }
+
+    closeSignalStream() {
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
         }
-        
-        return baseInterval + variation;
     }
 
     // Enhanced sleep position detection with disorder-specific patterns and stability
@@ -623,7 +391,7 @@ class ECEProcessor {
     startMonitoring() {
         if (this.isMonitoring) return;
         this.isMonitoring = true;
-        this.monitoringInterval = setInterval(() => this.updateData(), this.updateInterval);
+        this.openSignalStream();
         
         // Update UI to reflect monitoring state
         const startBtn = document.getElementById('start-monitoring');
@@ -649,18 +417,13 @@ class ECEProcessor {
             }
             indicator.classList.add('visible');
         }
-        
-        // Initialize with current prediction
-        if (this.lastPrediction) {
-            this.updateData();
-        }
     }
 
     // Stop monitoring with cleanup and visual state reset
     stopMonitoring() {
         if (!this.isMonitoring) return;
         this.isMonitoring = false;
-        clearInterval(this.monitoringInterval);
+        this.closeSignalStream();
         
         // Update UI to reflect stopped state
         const startBtn = document.getElementById('start-monitoring');
@@ -681,15 +444,18 @@ class ECEProcessor {
         }
     }
 
-    // Update all data points
-    updateData() {
+    // Update all data points from one streamed batch of signals
+    updateData(batch) {
         // Update EEG data
-        this.eegData.push(this.generateEEGData());
-        if (this.eegData.length > 100) this.eegData.shift();
+        const windowSamples = this.eegWindowSeconds * this.signalRate;
+        this.eegData = this.eegData.concat(batch.eeg);
+        if (this.eegData.length > windowSamples) this.eegData = this.eegData.slice(-windowSamples);
 
-        // Update HRV data
-        this.hrvData.push(this.generateHRVData());
-        if (this.hrvData.length > 50) this.hrvData.shift();
+        // Update HRV data, one RR interval per heartbeat
+        batch.rr_ms.forEach(rr => {
+            this.hrvData.push(rr);
+            if (this.hrvData.length > 50) this.hrvData.shift();
+        });
 
         // Update position and respiratory pattern less frequently
         if (Math.random() < 0.1) { // 10% chance each update
@@ -1146,17 +912,10 @@ class ECEProcessor {
         this.sleepPosition = this.detectSleepPosition();
         console.log('Sleep position:', this.sleepPosition);
         
-        // Clear existing data to start fresh
+        // Clear existing data and start a new session for this prediction
         this.eegData = [];
         this.hrvData = [];
-        
-        // Generate initial data points
-        for (let i = 0; i < 50; i++) {
-            this.eegData.push(this.generateEEGData());
-            if (i % 2 === 0) { // Generate HRV at half the rate of EEG
-                this.hrvData.push(this.generateHRVData());
-            }
-        }
+        this.createSignalSession();
         
         // Start monitoring automatically when probabilities are updated
         this.startMonitoring();
@@ -0,0 +1,9 @@
+# Shared pytest setup: the app's modules and the relative Models/ and Dataset/ paths
+# they use resolve from the repository root
+
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
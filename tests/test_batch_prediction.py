@@ -0,0 +1,29 @@
+# Tests for the batch prediction API (app_batch_prediction.py)
+
+from flask import Flask
+
+from app_batch_prediction import add_batch_prediction_routes
+
+# Dataset row (Person ID 7) labelled Insomnia, which the serving model and the rules agree on
+INSOMNIA_RECORD = {
+    'Gender': 'Male', 'Age': 29, 'Occupation': 'Teacher', 'Sleep Duration': 6.3, 'Quality of Sleep': 6,
+    'Physical Activity Level': 40, 'Stress Level': 7, 'BMI Category': 'Obese', 'Blood Pressure': '140/90',
+    'Heart Rate': 82, 'Daily Steps': 3500
+}
+
+
+def client():
+    app = Flask(__name__)
+    add_batch_prediction_routes(app)
+    return app.test_client()
+
+
+def test_insomnia_record_is_labelled_insomnia():
+    response = client().post('/api/predict/batch', json=[INSOMNIA_RECORD])
+    assert response.status_code == 200
+    result = response.get_json()['results'][0]
+    assert result['label'] == 'Insomnia'
+    assert result['model_class'] == 1
+    probabilities = result['probabilities']
+    assert set(probabilities) == {'No sleeping disorder', 'Insomnia', 'Sleep Apnea'}
+    assert max(probabilities, key=probabilities.get) == 'Insomnia'
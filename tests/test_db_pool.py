@@ -0,0 +1,78 @@
+# Tests for the connection pool (db_pool.py) against a SQLite stand-in for MySQL
+
+import sqlite3
+
+import pytest
+
+from db_pool import ConnectionPool
+
+
+class StandInConnection:
+    """SQLite connection that behaves like mysql-connector with autocommit off: a
+    transaction is always open, and in WAL mode its first read pins a snapshot"""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('BEGIN')
+        # Set to make the next commit go through but report a dropped connection
+        self.drop_after_commit = False
+
+    def cursor(self):
+        return self._conn.cursor()
+
+    def commit(self):
+        self._conn.execute('COMMIT')
+        self._conn.execute('BEGIN')
+        if self.drop_after_commit:
+            self.drop_after_commit = False
+            raise sqlite3.OperationalError("Lost connection to server after the commit was applied")
+
+    def rollback(self):
+        self._conn.execute('ROLLBACK')
+        self._conn.execute('BEGIN')
+
+    def close(self):
+        self._conn.close()
+
+
+@pytest.fixture
+def database(tmp_path):
+    """(pool of size 1, connections it opened, a separate connection) on a users table"""
+    path = str(tmp_path / 'db.sqlite')
+    other = StandInConnection(path)
+    other.cursor().execute("CREATE TABLE users (email TEXT, password TEXT)")
+    other.commit()
+
+    created = []
+
+    def connect():
+        created.append(StandInConnection(path))
+        return created[-1]
+
+    pool = ConnectionPool(connect, size=1, paramstyle='qmark', disconnect_errors=(sqlite3.OperationalError,))
+    yield pool, created, other
+    pool.close()
+    for conn in created + [other]:
+        conn.close()
+
+
+def test_pooled_read_sees_rows_committed_since_its_last_read(database):
+    pool, created, other = database
+    login = "SELECT password FROM users WHERE email = %s"
+    assert pool.fetchall(login, ('new@example.com',)) == []
+
+    # Register on another connection, then read again on the same pooled connection
+    other.cursor().execute("INSERT INTO users VALUES (?, ?)", ('new@example.com', 'secret'))
+    other.commit()
+    assert pool.fetchall(login, ('new@example.com',)) == [('secret',)]
+    assert len(created) == 1
+
+
+def test_write_is_not_replayed_after_a_dropped_connection(database):
+    pool, created, _ = database
+    pool.fetchall("SELECT 1")
+    created[0].drop_after_commit = True
+    with pytest.raises(sqlite3.OperationalError):
+        pool.execute("INSERT INTO users VALUES (%s, %s)", ('twice@example.com', 'secret'))
+    assert pool.fetchall("SELECT COUNT(*) FROM users WHERE email = %s", ('twice@example.com',)) == [(1,)]
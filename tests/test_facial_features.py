@@ -0,0 +1,28 @@
+# Tests for the landmark features (app_image_processing.py): only the eyelid and lip
+# gaps are measured; the rest comes from the aligned template and is marked as such
+
+import numpy as np
+
+from app_image_processing import (TEMPLATE_DERIVED_FEATURES, facial_features_from_points,
+                                  facial_metrics, features_from_metrics)
+from face_detection import FACE_CROP_SIZE, TEMPLATE_POINTS
+
+
+def test_measured_features_leave_out_template_values():
+    features = features_from_metrics(facial_metrics(TEMPLATE_POINTS * FACE_CROP_SIZE))[0]
+    assert set(features) == {'eyes', 'mouth', 'jawline'}
+    assert set(features['jawline']) == {'tension', 'relaxation'}
+
+
+def test_response_marks_template_derived_features():
+    points = TEMPLATE_POINTS * FACE_CROP_SIZE
+    features = facial_features_from_points(points)
+    assert features['templateDerived'] == TEMPLATE_DERIVED_FEATURES
+    for name in TEMPLATE_DERIVED_FEATURES:
+        section, _, key = name.partition('.')
+        assert key in features[section] if key else section in features
+
+    # A batch gets the same entries on every face
+    batch = facial_features_from_points(np.stack([points, points]))
+    assert [face['templateDerived'] for face in batch] == [TEMPLATE_DERIVED_FEATURES] * 2
+    assert batch[1]['nasolabialFolds'] == features['nasolabialFolds']
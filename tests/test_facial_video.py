@@ -0,0 +1,47 @@
+# Tests for the video blink/PERCLOS analysis (facial_video.py)
+
+import io
+
+import pytest
+from flask import Flask
+
+from facial_video import EyeClosureMonitor, add_facial_video_routes
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    add_facial_video_routes(app)
+    return app.test_client()
+
+
+@pytest.mark.parametrize('fps', ['0', '-30', 'nan', 'inf'])
+def test_non_positive_fps_is_rejected(client, fps):
+    response = client.post('/process_facial_video', content_type='multipart/form-data',
+                           data={'fps': fps, 'frames': [(io.BytesIO(b'not an image'), 'frame0.png')]})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == "fps must be a positive number"
+
+
+def _monitor(ears, fps=10.0):
+    monitor = EyeClosureMonitor()
+    for index, ear in enumerate(ears):
+        monitor.update(index / fps, ear)
+    return monitor
+
+
+def test_closure_still_open_at_the_end_is_counted():
+    # Two frames (0.2 s) closed at the very end of the clip: a blink
+    assert _monitor([0.3] * 10 + [0.1] * 2).summary()['blinks'] == 1
+    # Closed for the last second: a long closure
+    summary = _monitor([0.3] * 10 + [0.1] * 10).summary()
+    assert (summary['blinks'], summary['long_closures']) == (0, 1)
+
+
+def test_summary_does_not_end_the_closure():
+    monitor = _monitor([0.3] * 10 + [0.1] * 2)
+    monitor.summary()
+    for index in range(12, 20):
+        monitor.update(index / 10.0, 0.1)
+    summary = monitor.summary()
+    assert (summary['blinks'], summary['long_closures']) == (0, 1)
@@ -0,0 +1,29 @@
+# Tests for the facial image result cache (image_cache.py)
+
+import os
+import time
+
+from image_cache import ResultCache, image_key
+
+
+def test_key_depends_on_detector_version():
+    assert image_key(b'image', 1) == image_key(b'image', 1)
+    assert image_key(b'image', 1) != image_key(b'image', 2)
+
+
+def test_disk_hit_keeps_the_file_age(tmp_path):
+    writer = ResultCache(ttl_seconds=60, disk_dir=str(tmp_path))
+    key = image_key(b'image', 1)
+    writer.put(key, {'landmarks': None, 'error': 'none'})
+
+    # Written 50 s ago: still fresh on disk, but only for another 10 s
+    path = writer._disk_path(key)
+    written = time.time() - 50
+    os.utime(path, (written, written))
+
+    reader = ResultCache(ttl_seconds=60, disk_dir=str(tmp_path))
+    assert reader.get(key) == {'landmarks': None, 'error': 'none'}
+    assert reader.disk_hits == 1
+    stored_at, _ = reader._entries[key]
+    assert abs(stored_at - written) < 1
+
@@ -0,0 +1,60 @@
+# Tests for the monitoring ingestion routes (monitoring_ingest.py) on a SQLite database
+
+import sqlite3
+
+import pytest
+from flask import Flask
+
+from db_pool import ConnectionPool
+from monitoring_ingest import IngestionWriter, add_ingestion_routes
+
+RECORDING = {'user_id': 1, 'eeg': [0.1, -0.2, 0.3, 0.0], 'fs': 256, 'beat_times': [0.5, 1.3, 2.1],
+             'rr_ms': [800, 800]}
+
+
+@pytest.fixture
+def writer(tmp_path):
+    path = str(tmp_path / 'db.sqlite')
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        create table sleep_monitoring(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INT, eeg_data BLOB, hrv_data BLOB,
+            sleep_position TEXT, respiratory_pattern TEXT);
+        create table sleep_classification(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            monitoring_id INT, classification_result TEXT, confidence_score REAL);""")
+    conn.close()
+    pool = ConnectionPool(lambda: sqlite3.connect(path, check_same_thread=False), size=2, paramstyle='qmark')
+    # A batch size of 1 writes each row as it is added, so no timer thread is needed
+    yield IngestionWriter(pool, batch_size=1)
+    pool.close()
+
+
+@pytest.fixture
+def client(writer):
+    app = Flask(__name__)
+    add_ingestion_routes(app, writer)
+    return app.test_client()
+
+
+def test_recording_is_stored(client):
+    response = client.post('/api/monitoring', json=RECORDING)
+    assert response.status_code == 201
+    assert response.get_json()['id'] == 1
+
+
+@pytest.mark.parametrize('fields', [{'fs': 0}, {'fs': -256}, {'fs': 1e12}, {'fs': 'nan'}, {'start': 'inf'}])
+def test_recording_with_invalid_timing_is_rejected(client, writer, fields):
+    response = client.post('/api/monitoring', json=dict(RECORDING, **fields))
+    assert response.status_code == 400
+    assert writer.stats()['monitoring_rows'] == 0
+
+
+def test_invalid_classification_batch_queues_nothing(client, writer):
+    rows = [{'monitoring_id': 1, 'result': 'Insomnia', 'confidence': 0.9},
+            {'monitoring_id': 1, 'result': 'Insomnia', 'confidence': 'high'}]
+    response = client.post('/api/monitoring/classifications', json=rows)
+    assert response.status_code == 400
+    stats = writer.stats()
+    assert stats['pending'] == 0 and stats['classification_rows'] == 0
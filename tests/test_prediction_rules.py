@@ -0,0 +1,52 @@
+# Tests for the /prediction rules (prediction_rules.py): the vectorized apply_rules
+# used for batches must agree row for row with apply_rules_scalar
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_vocabulary import CATEGORICAL_COLUMNS
+from model_registry import registry, FEATURE_COLUMNS
+from prediction_rules import apply_rules, apply_rules_scalar, PROBABILITY_NAMES
+
+DATASET_PATH = 'Dataset/Sleep_health_and_lifestyle_dataset.csv'
+
+# Inputs the rules look at, in apply_rules argument order
+RULE_COLUMNS = ['Sleep Duration', 'Quality of Sleep', 'Physical Activity Level', 'Stress Level',
+                'BMI Category', 'Heart Rate', 'Daily Steps']
+
+
+@pytest.fixture(scope='module')
+def dataset():
+    return pd.read_csv(DATASET_PATH)
+
+
+def model_probabilities(df):
+    """The serving model's probabilities for every dataset row"""
+    bundle = registry.active()
+    encoded = df[FEATURE_COLUMNS].copy()
+    for col in CATEGORICAL_COLUMNS:
+        encoded[col] = [bundle.vocabulary.encode(col, label) for label in df[col]]
+    encoded['Blood Pressure'] = df['Blood Pressure'].str.split('/').str[0].astype(int)
+    return bundle.model.predict_proba(bundle.k_best.transform(bundle.scaler.transform(encoded)))
+
+
+def assert_rules_agree(df, proba):
+    codes, probabilities = apply_rules(*[df[col].to_numpy() for col in RULE_COLUMNS], proba)
+    for i, row in enumerate(df[RULE_COLUMNS].itertuples(index=False)):
+        code, expected = apply_rules_scalar(*row, proba[i])
+        assert code == codes[i], f"Row {i}: scalar {code} != vectorized {codes[i]}"
+        got = dict(zip(PROBABILITY_NAMES, probabilities[i]))
+        for name in PROBABILITY_NAMES:
+            assert expected[name] == got[name], f"Row {i} {name}: scalar {expected[name]} != vectorized {got[name]}"
+
+
+def test_rules_agree_on_model_probabilities(dataset):
+    assert_rules_agree(dataset, model_probabilities(dataset))
+
+
+@pytest.mark.parametrize('n_classes', [3, 4])
+def test_rules_agree_on_random_probabilities(dataset, n_classes):
+    # Random probabilities reach the branches the serving model's confident outputs don't
+    rng = np.random.default_rng(42 + n_classes)
+    assert_rules_agree(dataset, rng.dirichlet(np.ones(n_classes) * 0.7, size=len(dataset)))
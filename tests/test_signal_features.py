@@ -0,0 +1,28 @@
+# Tests for the EEG/HRV feature route (signal_features.py)
+
+import pytest
+from flask import Flask
+
+from signal_features import add_signal_feature_routes
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    add_signal_feature_routes(app)
+    return app.test_client()
+
+
+@pytest.mark.parametrize('query', ['seconds=300&fs=5000000', 'seconds=300&fs=10', 'seconds=300&insomnia=abc',
+                                   'seconds=nan'])
+def test_invalid_parameters_are_rejected(client, query):
+    response = client.get(f'/api/signals/features?{query}')
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_features_of_a_short_recording(client):
+    response = client.get('/api/signals/features?seconds=600&disorder=Insomnia&insomnia=0.9')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['eeg'] and body['hrv']
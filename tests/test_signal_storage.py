@@ -0,0 +1,50 @@
+# Tests for reading stored monitoring signals (signal_storage.py) from a SQLite database
+
+import sqlite3
+
+import numpy as np
+import pytest
+from flask import Flask
+
+from db_pool import ConnectionPool
+from signal_storage import add_monitoring_storage_routes, encode_rr, encode_signal, MONITORING_INSERT
+
+
+@pytest.fixture
+def client(tmp_path):
+    path = str(tmp_path / 'db.sqlite')
+    conn = sqlite3.connect(path)
+    conn.execute("""create table sleep_monitoring(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INT, eeg_data BLOB, hrv_data BLOB,
+        sleep_position TEXT, respiratory_pattern TEXT)""")
+    eeg = np.sin(np.arange(256 * 60) / 10.0)
+    hrv = encode_rr([0.5, 1.3, 2.1], [800, 800, 800])
+    insert = MONITORING_INSERT.replace('%s', '?')
+    # Recording 1 at 256 Hz; recording 2 stored with a sample rate of 0
+    conn.execute(insert, (1, encode_signal(eeg, 256), hrv, None, None))
+    conn.execute(insert, (1, encode_signal(eeg, 0, chunk_samples=1024), hrv, None, None))
+    conn.commit()
+    conn.close()
+
+    pool = ConnectionPool(lambda: sqlite3.connect(path, check_same_thread=False), size=2, paramstyle='qmark')
+    app = Flask(__name__)
+    add_monitoring_storage_routes(app, pool)
+    yield app.test_client()
+    pool.close()
+
+
+def test_eeg_window_is_read(client):
+    response = client.get('/api/monitoring/1/eeg?start=10&seconds=2')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['fs'] == 256 and body['start'] == 10 and len(body['eeg']) == 512
+
+
+@pytest.mark.parametrize('query', ['start=inf', 'start=nan', 'seconds=inf', 'seconds=1e308'])
+def test_non_finite_window_is_rejected(client, query):
+    assert client.get(f'/api/monitoring/1/eeg?{query}').status_code == 400
+
+
+def test_eeg_without_sample_rate_is_rejected(client):
+    assert client.get('/api/monitoring/2/eeg').status_code == 400
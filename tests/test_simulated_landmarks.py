@@ -0,0 +1,30 @@
+# Golden-file test for the simulated facial landmarks (app_image_processing.py): every
+# stored upload must keep the seed and exactly the simulated features it has always had
+
+import base64
+import json
+import os
+
+import pytest
+
+from app_image_processing import image_fingerprint, seeded_factors, simulate_facial_landmarks
+from image_cache import to_builtin
+
+# Uploads with the seeds and features produced by the original byte-loop fingerprint
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), 'fixtures', 'simulated_landmarks_golden.json')
+
+with open(FIXTURE_PATH, encoding='utf-8') as f:
+    CASES = json.load(f)['cases']
+
+
+@pytest.mark.parametrize('case', CASES, ids=[case['name'] for case in CASES])
+def test_simulated_landmarks_match_golden_file(case):
+    if 'bytes' in case:
+        image_data = base64.b64decode(case['bytes'])
+        if image_data:
+            assert (12345 + image_fingerprint(image_data)) % 100000 == case['seed']
+    else:
+        image_data = case.get('data_uri')
+    features = to_builtin(simulate_facial_landmarks(image_data))
+    assert features == case['features']
+    assert features['nasolabialFolds']['depth'] == seeded_factors(case['seed'])[6]
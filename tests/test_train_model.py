@@ -0,0 +1,61 @@
+# Tests for the training pipeline (train_model.py), on the two fastest model families
+
+import os
+
+import pytest
+
+import train_model
+from train_model import SERVE_BEST, SERVING_FAMILY, default_serve, make_run_dir, train
+
+FAMILIES = ['KNN', 'Decision Tree']
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    # Publish into the temporary directory instead of over the served Models/ files
+    monkeypatch.setattr(train_model, 'SERVING_ARTIFACTS',
+                        {name: str(tmp_path / f"serving-{name}") for name in train_model.SERVING_ARTIFACTS})
+    return {'runs_dir': str(tmp_path / 'runs'), 'cache_dir': str(tmp_path / 'cache')}
+
+
+def test_cached_models_report_their_original_fit_time(dirs):
+    first = train(FAMILIES, ['k_best'], jobs=1, serve=None, **dirs)
+    second = train(FAMILIES, ['k_best'], jobs=1, serve=None, **dirs)
+    assert first['version'] != second['version']
+    for name, model in second['models'].items():
+        assert model['cached'] and not first['models'][name]['cached']
+        assert model['fit_seconds'] == first['models'][name]['fit_seconds']
+
+
+def test_cache_entries_without_a_fit_time_report_none(dirs):
+    train(['KNN'], ['k_best'], jobs=1, serve=None, **dirs)
+    models_dir = os.path.join(dirs['cache_dir'], 'models')
+    for name in os.listdir(models_dir):
+        if name.endswith('.json'):
+            os.remove(os.path.join(models_dir, name))
+    manifest = train(['KNN'], ['k_best'], jobs=1, serve=None, **dirs)
+    assert [model['fit_seconds'] for model in manifest['models'].values()] == [None]
+
+
+def test_run_directories_never_collide(tmp_path):
+    versions = [make_run_dir(str(tmp_path), '20240101-000000-abcdef') for _ in range(3)]
+    assert versions == ['20240101-000000-abcdef', '20240101-000000-abcdef-2', '20240101-000000-abcdef-3']
+
+
+def test_default_serving_family():
+    assert default_serve() == SERVING_FAMILY
+    assert default_serve(['KNN', SERVING_FAMILY]) == SERVING_FAMILY
+    assert default_serve(['KNN']) == SERVE_BEST
+    assert default_serve(None, ['original']) is None
+
+
+def test_serve_best_publishes_the_most_accurate_family(dirs):
+    manifest = train(FAMILIES, ['k_best'], jobs=1, serve=SERVE_BEST, **dirs)
+    k_best = [model for model in manifest['models'].values() if model['feature_set'] == 'k_best']
+    best = max(k_best, key=lambda model: (model['accuracy'], model['f1_macro']))
+    assert manifest['serving']['family'] == best['family']
+
+
+def test_untrained_serving_family_is_explained(dirs):
+    with pytest.raises(ValueError, match='none'):
+        train(['KNN'], ['k_best'], jobs=1, serve=SERVING_FAMILY, **dirs)
@@ -1,64 +1,458 @@
-import pandas as pd
+# Training Pipeline for Sleep Disorder Classification
+# Runs the shared preprocessing (label encoding, blood pressure parsing, scaling,
+# SMOTE, SelectKBest) once and caches the result on disk, then fits every model
+# family on the original and the k-best features in a process pool. Each run
+# writes its artifacts to a new versioned directory with a manifest of parameters,
+# fit times and test metrics, and publishes the serving triple to Models/.
+#
+# Usage: python train_model.py [--families "Decision Tree" KNN ...] [--jobs 4] [--serve "Decision Tree"|best|none]
+#        python train_model.py --search [--folds 5] [--families ...] [--jobs 4]
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import numpy as np
+import pandas as pd
+import sklearn
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.feature_selection import SelectKBest, f_classif
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.svm import SVC
 from sklearn.tree import DecisionTreeClassifier
+from sklearn.ensemble import RandomForestClassifier, StackingClassifier, VotingClassifier
+from sklearn.neural_network import MLPClassifier
+from sklearn.metrics import accuracy_score, f1_score
 from imblearn.over_sampling import SMOTE
-import pickle
 
-# Load and preprocess data
-df = pd.read_csv('Dataset/Sleep_health_and_lifestyle_dataset.csv')
-
-# Encode categorical variables
-le = LabelEncoder()
-df['Gender'] = le.fit_transform(df['Gender'])
-df['Occupation'] = le.fit_transform(df['Occupation'])
-df['BMI Category'] = le.fit_transform(df['BMI Category'])
-
-# Convert Blood Pressure to numeric (use systolic pressure)
-df['Blood Pressure'] = df['Blood Pressure'].apply(lambda x: int(x.split('/')[0]))
-
-# Handle Sleep Disorder (target variable)
-df['Sleep Disorder'] = df['Sleep Disorder'].fillna('None')
-df['Sleep Disorder'] = le.fit_transform(df['Sleep Disorder'])
-
-# Prepare features and target
-X = df.drop(['Person ID', 'Sleep Disorder'], axis=1)
-y = df['Sleep Disorder']
-
-# Split the data
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-# Scale the features
-scaler = StandardScaler()
-X_train_scaled = scaler.fit_transform(X_train)
-X_test_scaled = scaler.transform(X_test)
-
-# Apply SMOTE for class balancing
-smote = SMOTE(random_state=42)
-X_train_balanced, y_train_balanced = smote.fit_resample(X_train_scaled, y_train)
-
-# Select K best features
-k_best = SelectKBest(score_func=f_classif, k=8)
-X_train_selected = k_best.fit_transform(X_train_balanced, y_train_balanced)
-X_test_selected = k_best.transform(X_test_scaled)
-
-# Train a simple Decision Tree model
-model = DecisionTreeClassifier(
-    max_depth=10,  # Limit tree depth
-    min_samples_split=5,
-    min_samples_leaf=2,
-    random_state=42
-)
-model.fit(X_train_selected, y_train_balanced)
-
-# Save the models and preprocessors using pickle protocol 3 for better compatibility
-with open('Models/Random Forest_model_k_best.pkl', 'wb') as f:
-    pickle.dump(model, f, protocol=3)
-
-with open('Models/k_best_selector.pkl', 'wb') as f:
-    pickle.dump(k_best, f, protocol=3)
-
-with open('Models/scaler.pkl', 'wb') as f:
-    pickle.dump(scaler, f, protocol=3)
\ No newline at end of file
+from feature_vocabulary import build_vocabulary, save_vocabulary, Vocabulary, CATEGORICAL_COLUMNS
+from model_registry import SERVING_ARTIFACTS
+from compiled_model import try_compile
+
+DATASET_PATH = os.path.join('Dataset', 'Sleep_health_and_lifestyle_dataset.csv')
+
+# Versioned training runs (one directory each) and the preprocessing/model cache
+RUNS_DIR = os.path.join('Models', 'runs')
+CACHE_DIR = os.path.join('Models', 'cache')
+
+# Held-out share of the dataset, features kept by SelectKBest and the seed used everywhere
+TEST_SIZE = 0.2
+K_BEST = 8
+RANDOM_STATE = 42
+
+# Bump when the preprocessing code changes so stale cache entries aren't reused
+PREPROCESS_VERSION = 2
+
+# Hyperparameters of each model family (the serving Decision Tree's are the long-standing ones)
+MODEL_PARAMS = {
+    'KNN': {},
+    'SVM': {'probability': True, 'random_state': RANDOM_STATE},
+    'Decision Tree': {'max_depth': 10, 'min_samples_split': 5, 'min_samples_leaf': 2,
+                      'random_state': RANDOM_STATE},
+    'Random Forest': {'random_state': RANDOM_STATE},
+    'ANN': {'max_iter': 300, 'random_state': RANDOM_STATE},
+    'stacking_classifier': {},
+    'voting_classifier': {'voting': 'soft'},
+}
+
+# Families in submission order, slowest first so the pool isn't left waiting on a straggler
+MODEL_FAMILIES = ['stacking_classifier', 'voting_classifier', 'SVM', 'Random Forest', 'ANN', 'KNN',
+                  'Decision Tree']
+
+# Feature sets every family is fitted on: all 11 scaled features, or the SelectKBest subset
+FEATURE_SETS = ['original', 'k_best']
+
+# Family whose k-best model is published as the serving model
+SERVING_FAMILY = 'Decision Tree'
+
+# serve= value that publishes the trained family with the best k-best test accuracy
+SERVE_BEST = 'best'
+
+
+def save_artifact(obj, path):
+    """Pickle with protocol 3 for better compatibility, to a temporary name renamed
+    into place so a running app that hot-reloads Models/ never reads a half-written pickle"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(obj, f, protocol=3)
+    os.replace(tmp_path, path)
+
+
+def publish_file(src, dst):
+    """Copy a finished artifact over a served one atomically"""
+    tmp_path = dst + '.tmp'
+    shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+def artifact_name(family, feature_set):
+    """File name of a fitted model, following the BACK END/ naming"""
+    if family.endswith('_classifier'):
+        return f"{family}_{feature_set}.pkl"
+    return f"{family}_model_{feature_set}.pkl"
+
+
+def make_estimator(family, params=None):
+    """An unfitted estimator of a family, with MODEL_PARAMS overridden by `params`"""
+    params = dict(MODEL_PARAMS[family], **(params or {}))
+    if family in ('stacking_classifier', 'voting_classifier'):
+        base = [('knn', make_estimator('KNN')), ('svm', make_estimator('SVM')),
+                ('dt', DecisionTreeClassifier(random_state=RANDOM_STATE)),
+                ('rf', make_estimator('Random Forest'))]
+        if family == 'stacking_classifier':
+            return StackingClassifier(estimators=base, final_estimator=make_estimator('ANN'), **params)
+        return VotingClassifier(estimators=base, **params)
+    estimator = {
+        'KNN': KNeighborsClassifier,
+        'SVM': SVC,
+        'Decision Tree': DecisionTreeClassifier,
+        'Random Forest': RandomForestClassifier,
+        'ANN': MLPClassifier,
+    }[family]
+    return estimator(**params)
+
+
+def estimator_params(estimator):
+    """get_params(deep=True) for a cache key: nested estimators are reduced to their
+    class name, their own settings being in the 'name__param' entries"""
+    def plain(value):
+        if hasattr(value, 'get_params'):
+            return type(value).__name__
+        if isinstance(value, (list, tuple)):
+            return [plain(item) for item in value]
+        return value
+    return {name: plain(value) for name, value in estimator.get_params(deep=True).items()}
+
+
+def file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def cache_key(*parts):
+    """Short stable key for a cache entry"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=repr).encode()).hexdigest()[:16]
+
+
+def load_dataset(path=DATASET_PATH):
+    """Raw dataset -> (vocabulary, encoded features, encoded target, target labels)"""
+    df = pd.read_csv(path)
+
+    # Record the categorical labels and their codes before encoding so the app can
+    # build its dropdowns and encode inputs without re-reading the dataset
+    vocabulary = build_vocabulary(df)
+
+    # Encode categorical variables
+    for col in CATEGORICAL_COLUMNS:
+        df[col] = LabelEncoder().fit_transform(df[col])
+
+    # Convert Blood Pressure to numeric (use systolic pressure)
+    df['Blood Pressure'] = df['Blood Pressure'].apply(lambda x: int(x.split('/')[0]))
+
+    # Handle Sleep Disorder (target variable)
+    target = LabelEncoder()
+    y = target.fit_transform(df['Sleep Disorder'].fillna('None'))
+
+    X = df.drop(['Person ID', 'Sleep Disorder'], axis=1)
+    return vocabulary, X, y, list(target.classes_)
+
+
+def split_dataset(path=DATASET_PATH):
+    """(vocabulary, X_train, X_test, y_train, y_test, target labels) with the held-out split"""
+    vocabulary, X, y, classes = load_dataset(path)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=TEST_SIZE, random_state=RANDOM_STATE)
+    return vocabulary, X_train, X_test, y_train, y_test, classes
+
+
+def fit_preprocessing(X_train, y_train):
+    """Fit the scaler, SMOTE and SelectKBest on training rows only.
+
+    Returns (scaler, k_best, scaled and balanced X, balanced y)."""
+    # Scale the features
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+
+    # Apply SMOTE for class balancing
+    X_train_balanced, y_train_balanced = SMOTE(random_state=RANDOM_STATE).fit_resample(X_train_scaled, y_train)
+
+    # Select K best features
+    k_best = SelectKBest(score_func=f_classif, k=K_BEST)
+    k_best.fit(X_train_balanced, y_train_balanced)
+    return scaler, k_best, X_train_balanced, y_train_balanced
+
+
+def preprocess(path=DATASET_PATH):
+    """Split, scale, balance with SMOTE and select features"""
+    vocabulary, X_train, X_test, y_train, y_test, classes = split_dataset(path)
+    scaler, k_best, X_train_balanced, y_train_balanced = fit_preprocessing(X_train, y_train)
+
+    return {
+        'vocabulary': vocabulary.columns,
+        'classes': classes,
+        'feature_names': list(X_train.columns),
+        'scaler': scaler,
+        'k_best': k_best,
+        'X_train': X_train_balanced,
+        'y_train': y_train_balanced,
+        'X_test': scaler.transform(X_test),
+        'y_test': y_test,
+    }
+
+
+def preprocess_key(path=DATASET_PATH, *extra):
+    """Cache key of everything preprocessing depends on (plus any extra settings)"""
+    return cache_key(file_sha256(path), TEST_SIZE, K_BEST, RANDOM_STATE, PREPROCESS_VERSION, sklearn.__version__,
+                     *extra)
+
+
+def cached_preprocess(path=DATASET_PATH, cache_dir=CACHE_DIR, use_cache=True):
+    """preprocess() through an on-disk cache keyed by the dataset contents and settings.
+
+    Returns (cache file, preprocessed data, key, whether it was a cache hit)."""
+    key = preprocess_key(path)
+    cache_path = os.path.join(cache_dir, f"preprocess-{key}.pkl")
+    if use_cache and os.path.exists(cache_path):
+        with open(cache_path, 'rb') as f:
+            return cache_path, pickle.load(f), key, True
+
+    data = preprocess(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    save_artifact(data, cache_path)
+    return cache_path, data, key, False
+
+
+# Preprocessed data already loaded by this (worker) process, by cache file
+_preprocessed = {}
+
+
+def feature_matrices(data, feature_set):
+    """(X_train, y_train, X_test, y_test) for one feature set"""
+    X_train, X_test = data['X_train'], data['X_test']
+    if feature_set == 'k_best':
+        X_train, X_test = data['k_best'].transform(X_train), data['k_best'].transform(X_test)
+    return X_train, data['y_train'], X_test, data['y_test']
+
+
+def fit_model(cache_path, prep_key, family, feature_set, out_dir, cache_dir=CACHE_DIR, use_cache=True):
+    """Worker entry point: fit (or fetch from the cache) one family on one feature set,
+    evaluate it on the held-out split and write it to out_dir"""
+    data = _preprocessed.get(cache_path)
+    if data is None:
+        with open(cache_path, 'rb') as f:
+            data = _preprocessed[cache_path] = pickle.load(f)
+    X_train, y_train, X_test, y_test = feature_matrices(data, feature_set)
+
+    params = MODEL_PARAMS[family]
+    # Keyed on every parameter, including those of stacking/voting base estimators
+    model = make_estimator(family)
+    key = cache_key(prep_key, family, feature_set, estimator_params(model), sklearn.__version__)
+    model_path = os.path.join(cache_dir, 'models', f"{key}.pkl")
+    # The original fit time is kept next to the cached model; loading it says nothing about fitting
+    fit_time_path = model_path[:-len('.pkl')] + '.json'
+    cached = use_cache and os.path.exists(model_path)
+    if cached:
+        with open(model_path, 'rb') as f:
+            model = pickle.load(f)
+        try:
+            with open(fit_time_path, encoding='utf-8') as f:
+                fit_seconds = json.load(f)['fit_seconds']
+        except (OSError, ValueError, KeyError):
+            fit_seconds = None  # Cached before fit times were recorded
+    else:
+        start = time.perf_counter()
+        model.fit(X_train, y_train)
+        fit_seconds = time.perf_counter() - start
+
+    y_pred = model.predict(X_test)
+    path = os.path.join(out_dir, artifact_name(family, feature_set))
+    save_artifact(model, path)
+    if not cached:
+        os.makedirs(os.path.dirname(model_path), exist_ok=True)
+        publish_file(path, model_path)
+        tmp_path = fit_time_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'fit_seconds': fit_seconds}, f)
+        os.replace(tmp_path, fit_time_path)
+
+    # Tree models on the k-best features are also exported as flat arrays (see compiled_model.py)
+    compiled = try_compile(data['scaler'], data['k_best'], model) if feature_set == 'k_best' else None
+    if compiled is not None:
+        compiled_path = path[:-len('.pkl')] + '.npz'
+        compiled.save(compiled_path)
+
+    return {
+        'file': os.path.basename(path),
+        'family': family,
+        'feature_set': feature_set,
+        'params': {name: repr(value) for name, value in params.items()},
+        'cached': cached,
+        'fit_seconds': round(fit_seconds, 4) if fit_seconds is not None else None,
+        'accuracy': round(float(accuracy_score(y_test, y_pred)), 4),
+        'f1_macro': round(float(f1_score(y_test, y_pred, average='macro')), 4),
+        'sha256': file_sha256(path),
+        'file_bytes': os.path.getsize(path),
+        'compiled': os.path.basename(compiled_path) if compiled is not None else None,
+    }
+
+
+def run_tasks(tasks, jobs):
+    """Run fit_model over (args) tuples, in a process pool when jobs > 1; yields results as they finish"""
+    if jobs <= 1:
+        for args in tasks:
+            yield fit_model(*args)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(fit_model, *args) for args in tasks]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def make_run_dir(runs_dir, version):
+    """Create a new run directory and return its version; a name already taken by a
+    run started in the same second gets a -2, -3, ... suffix"""
+    os.makedirs(runs_dir, exist_ok=True)
+    name, attempt = version, 1
+    while True:
+        try:
+            os.mkdir(os.path.join(runs_dir, name))
+            return name
+        except FileExistsError:
+            attempt += 1
+            name = f"{version}-{attempt}"
+
+
+def default_serve(families=None, feature_sets=None):
+    """serve= for a run that didn't choose one: SERVING_FAMILY when it is trained on the
+    k-best features, otherwise the best family that is, or None without k-best models"""
+    if 'k_best' not in (feature_sets or FEATURE_SETS):
+        return None
+    return SERVING_FAMILY if SERVING_FAMILY in (families or MODEL_FAMILIES) else SERVE_BEST
+
+
+def train(families=None, feature_sets=None, jobs=None, serve=SERVING_FAMILY, dataset=DATASET_PATH,
+          runs_dir=RUNS_DIR, cache_dir=CACHE_DIR, use_cache=True):
+    """Train the model zoo into a new versioned run directory and return its manifest"""
+    families = [family for family in MODEL_FAMILIES if family in (families or MODEL_FAMILIES)]
+    feature_sets = feature_sets or FEATURE_SETS
+    jobs = jobs or os.cpu_count() or 1
+    if serve and (serve not in families + [SERVE_BEST] or 'k_best' not in feature_sets):
+        raise ValueError(f"Serving family {serve} must be trained on the k_best features: include it in "
+                         f"the families and k_best in the feature sets, or serve '{SERVE_BEST}' or none")
+    run_start = time.perf_counter()
+
+    start = time.perf_counter()
+    cache_path, data, prep_key, prep_cached = cached_preprocess(dataset, cache_dir, use_cache)
+    prep_seconds = time.perf_counter() - start
+    print(f"Preprocessing {'loaded from cache' if prep_cached else 'done'} in {prep_seconds:.2f} s ({prep_key})")
+
+    version = make_run_dir(runs_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{prep_key[:6]}")
+    out_dir = os.path.join(runs_dir, version)
+
+    # The run directory holds a complete bundle: preprocessors, vocabulary and every model
+    save_artifact(data['scaler'], os.path.join(out_dir, 'scaler.pkl'))
+    save_artifact(data['k_best'], os.path.join(out_dir, 'k_best_selector.pkl'))
+    save_vocabulary(Vocabulary(data['vocabulary']), os.path.join(out_dir, 'vocabulary.json'))
+
+    tasks = [(cache_path, prep_key, family, feature_set, out_dir, cache_dir, use_cache)
+             for family in families for feature_set in feature_sets]
+    models = {}
+    for result in run_tasks(tasks, min(jobs, len(tasks))):
+        models[result['file']] = result
+        fit = f"{result['fit_seconds']:.2f} s" if result['fit_seconds'] is not None else "time unknown"
+        print(f"  {result['family']} ({result['feature_set']}): accuracy {result['accuracy']:.3f}, "
+              f"F1 {result['f1_macro']:.3f}, fit {fit}{' (cached)' if result['cached'] else ''}")
+
+    manifest = {
+        'version': version,
+        'created_at': time.time(),
+        'sklearn_version': sklearn.__version__,
+        'dataset': {'path': dataset, 'sha256': file_sha256(dataset)},
+        'preprocessing': {
+            'key': prep_key,
+            'cached': prep_cached,
+            'seconds': round(prep_seconds, 4),
+            'test_size': TEST_SIZE,
+            'k_best': K_BEST,
+            'random_state': RANDOM_STATE,
+            'selected_features': [name for name, keep in zip(data['feature_names'], data['k_best'].get_support())
+                                  if keep],
+        },
+        'classes': data['classes'],
+        'jobs': jobs,
+        'models': {name: models[name] for name in sorted(models)},
+        'serving': None,
+        'wall_seconds': None,
+    }
+
+    if serve == SERVE_BEST:
+        # Ties go to the family trained first in MODEL_FAMILIES order
+        serve = max(families, key=lambda family: (models[artifact_name(family, 'k_best')]['accuracy'],
+                                                  models[artifact_name(family, 'k_best')]['f1_macro']))
+
+    # Publish the serving triple; the model keeps the file name the registry has always watched
+    if serve:
+        sources = {
+            'vocabulary': os.path.join(out_dir, 'vocabulary.json'),
+            'scaler': os.path.join(out_dir, 'scaler.pkl'),
+            'k_best': os.path.join(out_dir, 'k_best_selector.pkl'),
+            'model': os.path.join(out_dir, artifact_name(serve, 'k_best')),
+        }
+        for name, src in sources.items():
+            publish_file(src, SERVING_ARTIFACTS[name])
+        manifest['serving'] = {'family': serve, 'artifacts': dict(SERVING_ARTIFACTS)}
+
+    manifest['wall_seconds'] = round(time.perf_counter() - run_start, 3)
+    manifest_path = os.path.join(out_dir, 'manifest.json')
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Run {version}: {len(models)} models in {manifest['wall_seconds']:.2f} s, manifest at {manifest_path}")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the sleep disorder model zoo")
+    parser.add_argument('--families', nargs='+', choices=MODEL_FAMILIES, help="model families to train (all by default)")
+    parser.add_argument('--feature-sets', nargs='+', choices=FEATURE_SETS, help="feature sets to fit on (both by default)")
+    parser.add_argument('--jobs', type=int, help="worker processes (one per CPU by default)")
+    parser.add_argument('--serve',
+                        help=f"family whose k_best model is published to Models/ ('{SERVE_BEST}' for the most "
+                             f"accurate one trained, 'none' to skip); {SERVING_FAMILY} if it is trained, "
+                             f"otherwise the best one, by default")
+    parser.add_argument('--dataset', default=DATASET_PATH)
+    parser.add_argument('--no-cache', action='store_true', help="recompute preprocessing and refit every model")
+    parser.add_argument('--search', action='store_true',
+                        help="cross-validated hyperparameter search instead of training (see model_search.py)")
+    parser.add_argument('--folds', type=int, default=5, help="cross-validation folds for --search")
+    parser.add_argument('--lookup', action='store_true',
+                        help="precompute the /prediction lookup tables for the published model (see prediction_lookup.py)")
+    args = parser.parse_args()
+
+    if args.search:
+        from model_search import search
+        search(args.families, args.feature_sets, args.jobs, args.folds, args.dataset, use_cache=not args.no_cache)
+        return
+
+    if args.serve is None:
+        serve = default_serve(args.families, args.feature_sets)
+    elif args.serve.lower() == 'none':
+        serve = None
+    elif args.serve.lower() == SERVE_BEST:
+        serve = SERVE_BEST
+    else:
+        serve = args.serve
+    train(args.families, args.feature_sets, args.jobs, serve, args.dataset, use_cache=not args.no_cache)
+
+    if args.lookup:
+        from model_registry import load_serving_bundle
+        from prediction_lookup import build_lookup
+        build_lookup(load_serving_bundle(SERVING_ARTIFACTS))
+
+
+if __name__ == '__main__':
+    main()